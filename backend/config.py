@@ -1,22 +1,98 @@
 """应用配置模块"""
 import os
+import shutil
 from pathlib import Path
 
 # 基础路径
 BASE_DIR = Path(__file__).resolve().parent
-OUTPUT_DIR = BASE_DIR / "output"
+OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR") or BASE_DIR / "output")  # 可用环境变量改到其他位置（如基准测试的临时目录）
 BGM_DIR = BASE_DIR / "bgm"
 TEMPLATES_DIR = BASE_DIR / "templates"
-TEMP_DIR = BASE_DIR / "temp"
+TEMP_DIR = Path(os.getenv("TEMP_DIR") or BASE_DIR / "temp")
+SEGMENT_CACHE_DIR = TEMP_DIR / "segments"  # 分镜片段缓存（增量重渲染）
+SUBTITLE_CACHE_DIR = TEMP_DIR / "subtitles"  # 字幕叠加图缓存
+IMAGE_CACHE_DIR = TEMP_DIR / "images"  # 按目标分辨率裁剪缩放后的配图
+BGM_CACHE_DIR = TEMP_DIR / "bgm"  # BGM 索引与解码后的 PCM 缓存
+TIMELINE_DIR = TEMP_DIR / "timelines"  # 成片的时间线信息（旁白文件与时长），用于只替换音轨的重新混音
+DURATION_INDEX_DIR = TEMP_DIR / "durations"  # 音频时长索引（不放在静态挂载的 output 目录下）
+FONTS_DIR = BASE_DIR / "fonts"  # 项目自带字体（字幕渲染）
 
 # 确保目录存在
-for d in [OUTPUT_DIR, BGM_DIR, TEMPLATES_DIR, TEMP_DIR]:
+for d in [OUTPUT_DIR, BGM_DIR, TEMPLATES_DIR, TEMP_DIR, SEGMENT_CACHE_DIR, SUBTITLE_CACHE_DIR, IMAGE_CACHE_DIR, BGM_CACHE_DIR, TIMELINE_DIR, DURATION_INDEX_DIR]:
     d.mkdir(exist_ok=True)
 
 # 服务配置
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
 
+# FFmpeg 可执行文件（可通过环境变量指定绝对路径）
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+if not shutil.which(FFMPEG_BIN):
+    # PATH 中没有 ffmpeg 时使用 moviepy 自带的 imageio-ffmpeg（无 ffprobe，合成会回退到 moviepy 引擎）
+    try:
+        import imageio_ffmpeg
+        FFMPEG_BIN = imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        pass
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+
+# 默认视频合成引擎：ffmpeg（原生滤镜图）/ segments（分镜片段缓存，增量重渲染）
+# / moviepy（逐帧 Python 渲染，兜底）
+COMPOSE_ENGINE = os.getenv("COMPOSE_ENGINE", "ffmpeg")
+
+# 音轨生成方式：numpy（解码为 PCM 后整体排布，BGM 侧链闪避）/ ffmpeg（滤镜图拼接 + amix）
+AUDIO_ENGINE = os.getenv("AUDIO_ENGINE", "numpy")
+
+CPU_COUNT = os.cpu_count() or 2
+
+# 同时运行的合成任务数（受 CPU 核心数限制，防止突发请求超额订阅主机）
+COMPOSE_MAX_JOBS = min(CPU_COUNT, int(os.getenv("COMPOSE_MAX_JOBS", str(max(1, CPU_COUNT // 4)))))
+# 排队 + 运行中的任务上限，超出时拒绝新任务
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", "100"))
+# 已结束任务的保留时长（秒）
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+
+# 分镜片段并行渲染的默认 worker 数（每个 worker 驱动一个 ffmpeg 进程），
+# 默认把 CPU 均分给同时运行的合成任务
+COMPOSE_WORKERS = int(os.getenv("COMPOSE_WORKERS", str(max(1, CPU_COUNT // COMPOSE_MAX_JOBS))))
+
+# 配图入库时预先生成的目标分辨率（逗号分隔），合成时其他分辨率按需生成
+IMAGE_TARGET_RESOLUTIONS = [
+    r.strip() for r in os.getenv("IMAGE_TARGET_RESOLUTIONS", "1080x1920,1920x1080").split(",") if r.strip()
+]
+# 配图归一化进程池大小
+IMAGE_NORMALIZE_WORKERS = int(os.getenv("IMAGE_NORMALIZE_WORKERS", str(max(1, CPU_COUNT // 2))))
+
+# 默认编码档位（见 services/encoder_profiles.py，可用 scripts/benchmark_encoders.py 对比后调整）
+ENCODER_PROFILE = os.getenv("ENCODER_PROFILE", "default")
+
+# 每个 TTS 供应商同时进行的合成数（所有请求共享，格式：供应商=数量，逗号分隔）
+TTS_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (
+        pair.split("=", 1) for pair in os.getenv("TTS_CONCURRENCY", "edge-tts=4,openai-tts=8").split(",") if "=" in pair
+    )
+}
+# 未在 TTS_CONCURRENCY 中列出的供应商的并发数
+TTS_DEFAULT_CONCURRENCY = int(os.getenv("TTS_DEFAULT_CONCURRENCY", "4"))
+# 单条合成失败后的重试次数（指数退避，首次间隔 TTS_RETRY_BACKOFF 秒）
+TTS_RETRIES = int(os.getenv("TTS_RETRIES", "2"))
+TTS_RETRY_BACKOFF = float(os.getenv("TTS_RETRY_BACKOFF", "0.5"))
+
+# TTS 音频缓存上限（MB），超出时按最近访问时间淘汰
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "2048"))
+
+# 合成缓存上限（MB），每次合成结束后按最近访问时间淘汰（见 services/cache_gc.py）
+SEGMENT_CACHE_MAX_MB = int(os.getenv("SEGMENT_CACHE_MAX_MB", "10240"))
+SUBTITLE_CACHE_MAX_MB = int(os.getenv("SUBTITLE_CACHE_MAX_MB", "512"))
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "2048"))
+TIMELINE_CACHE_MAX_MB = int(os.getenv("TIMELINE_CACHE_MAX_MB", "64"))
+# 最近访问过的缓存文件在此时长（秒）内不淘汰，避免删除其他进行中任务刚生成的片段
+CACHE_EVICT_GRACE = float(os.getenv("CACHE_EVICT_GRACE", "3600"))
+
+# 字幕字体文件路径（为空时使用 backend/fonts 下的字体）
+SUBTITLE_FONT = os.getenv("SUBTITLE_FONT", "")
+
 # CORS 允许的来源
 CORS_ORIGINS = [
     "http://localhost:3000",
@@ -1,11 +1,11 @@
 """AI 视频生成后端 - FastAPI 主入口"""
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from config import CORS_ORIGINS, OUTPUT_DIR, BGM_DIR
-from routers import script, image, voice, video, apikeys, analyze, auth
+from routers import script, image, voice, video, apikeys, analyze, auth, jobs, bgm
 from database import init_db
+from static_files import MediaStaticFiles
 
 app = FastAPI(
     title="AI Video Generator",
@@ -27,9 +27,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 静态文件：输出视频和BGM
-app.mount("/output", StaticFiles(directory=str(OUTPUT_DIR)), name="output")
-app.mount("/bgm", StaticFiles(directory=str(BGM_DIR)), name="bgm")
+# 静态文件：输出视频和BGM（支持 Range 请求，生成产物长期缓存）
+app.mount("/output", MediaStaticFiles(directory=str(OUTPUT_DIR)), name="output")
+app.mount("/bgm", MediaStaticFiles(directory=str(BGM_DIR), immutable=False), name="bgm")
 
 # 注册路由
 app.include_router(script.router, prefix="/api/script", tags=["脚本生成"])
@@ -39,6 +39,8 @@ app.include_router(video.router, prefix="/api/video", tags=["视频合成"])
 app.include_router(apikeys.router, prefix="/api/keys", tags=["密钥管理"])
 app.include_router(analyze.router, prefix="/api/analyze", tags=["竞品分析"])
 app.include_router(auth.router, prefix="/api/auth", tags=["用户认证"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["任务队列"])
+app.include_router(bgm.router, prefix="/api/bgm", tags=["背景音乐"])
 
 
 @app.get("/api/health")
@@ -0,0 +1,13 @@
+"""BGM 曲库路由"""
+import asyncio
+from fastapi import APIRouter
+from services.bgm_library import scan_library
+
+router = APIRouter()
+
+
+@router.get("")
+async def list_bgm():
+    """列出 BGM_DIR 中的曲目（时长 / 响度 / 采样率），首次访问或曲目变化时分析并缓存"""
+    tracks = await asyncio.to_thread(scan_library)
+    return {"tracks": tracks}
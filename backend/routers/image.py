@@ -1,7 +1,8 @@
 """图像生成路由"""
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from services.image_service import generate_image
+from services.image_service import generate_image, generate_images_batch
+from services import jobs
 
 router = APIRouter()
 
@@ -17,6 +18,24 @@ class ImageRequest(BaseModel):
     model: str = ""
 
 
+class ImageBatchItem(BaseModel):
+    index: int
+    prompt: str
+
+
+class ImageBatchRequest(BaseModel):
+    items: list[ImageBatchItem]
+    style_prefix: str = ""
+    width: int = 1024
+    height: int = 1024
+    provider: str = "openai"
+    api_key: str = ""
+    base_url: str = ""
+    model: str = ""
+    concurrency: int = 1  # 默认逐张生成，避免触发速率限制
+    retries: int = 3
+
+
 class ImageResponse(BaseModel):
     image_url: str
     local_path: str = ""
@@ -30,10 +49,8 @@ async def generate(req: ImageRequest):
     if not req.api_key:
         raise HTTPException(400, "请先配置图像生成 API Key")
 
-    full_prompt = f"Unified Style: {req.style_prefix}\nScene Content: {req.prompt}".strip() if req.style_prefix else req.prompt
-
     result = await generate_image(
-        prompt=full_prompt,
+        prompt=_full_prompt(req.prompt, req.style_prefix),
         width=req.width,
         height=req.height,
         provider=req.provider,
@@ -42,3 +59,34 @@ async def generate(req: ImageRequest):
         model=req.model,
     )
     return result
+
+
+@router.post("/batch", status_code=202)
+async def generate_batch(req: ImageBatchRequest):
+    """提交批量生图任务，立即返回任务 ID（通过 /api/jobs/{job_id}/events 获取实时进度）"""
+    if not req.items:
+        raise HTTPException(400, "没有需要生成的配图")
+    if not req.api_key:
+        raise HTTPException(400, "请先配置图像生成 API Key")
+
+    try:
+        job = jobs.submit_async(
+            "image_batch",
+            generate_images_batch,
+            items=[{"index": i.index, "prompt": _full_prompt(i.prompt, req.style_prefix)} for i in req.items],
+            concurrency=req.concurrency,
+            retries=req.retries,
+            width=req.width,
+            height=req.height,
+            provider=req.provider,
+            api_key=req.api_key,
+            base_url=req.base_url,
+            model=req.model,
+        )
+    except jobs.JobQueueFull as e:
+        raise HTTPException(503, str(e))
+    return {"job_id": job.id, "status": job.status}
+
+
+def _full_prompt(prompt: str, style_prefix: str) -> str:
+    return f"Unified Style: {style_prefix}\nScene Content: {prompt}".strip() if style_prefix else prompt
@@ -0,0 +1,94 @@
+"""后台任务路由 - 查询状态 / 实时进度 / 获取结果 / 取消"""
+import asyncio
+import json
+import time
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from services import jobs
+
+router = APIRouter()
+
+SSE_POLL_INTERVAL = 0.5   # 检查新事件的间隔（秒）
+SSE_HEARTBEAT = 10.0      # 无新事件时的心跳间隔（秒），心跳携带距上次进度的时长，便于发现卡住的任务
+
+
+def _get_or_404(job_id: str) -> jobs.Job:
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(404, "任务不存在或已过期")
+    return job
+
+
+@router.get("/{job_id}")
+async def get_status(job_id: str):
+    """查询任务状态"""
+    return _get_or_404(job_id).to_dict()
+
+
+@router.get("/{job_id}/events")
+async def stream_events(job_id: str, request: Request):
+    """以 Server-Sent Events 推送任务进度，任务结束后发送 end 事件并关闭连接
+
+    支持 Last-Event-ID 断线续传
+    """
+    job = _get_or_404(job_id)
+    last_seq = int(request.headers.get("last-event-id") or 0)
+
+    async def event_stream():
+        nonlocal last_seq
+        last_sent = time.monotonic()
+        while True:
+            if await request.is_disconnected():
+                return
+            for event in job.events_since(last_seq):
+                last_seq = event["seq"]
+                last_sent = time.monotonic()
+                yield _sse("progress", event, event["seq"])
+            if job.status in jobs.FINISHED_STATES and not job.events_since(last_seq):
+                yield _sse("end", job.to_dict())
+                return
+            if time.monotonic() - last_sent >= SSE_HEARTBEAT:
+                last_sent = time.monotonic()
+                yield _sse("heartbeat", {
+                    "status": job.status,
+                    "idle_seconds": round(time.time() - job.updated_at, 1),
+                })
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data: dict, event_id: int | None = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@router.get("/{job_id}/result")
+async def get_result(job_id: str):
+    """获取已完成任务的结果
+
+    任务失败（输入不合法、素材缺失、ffmpeg 报错等）属于任务状态而非服务故障，返回 409 与失败原因，
+    完整状态见 GET /{job_id}
+    """
+    job = _get_or_404(job_id)
+    if job.status == "failed":
+        raise HTTPException(409, f"任务失败: {job.error or '未知错误'}")
+    if job.status != "completed":
+        raise HTTPException(409, f"任务尚未完成（当前状态: {job.status}）")
+    return job.result
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    """取消排队中或运行中的任务"""
+    job = _get_or_404(job_id)
+    if not jobs.cancel(job):
+        raise HTTPException(409, f"任务已结束（当前状态: {job.status}）")
+    return job.to_dict()
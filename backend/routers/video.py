@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
-from services.video_service import compose_video
+from services.video_service import compose_video_sync, remix_video_sync, validate_compose
+from services.pipeline import Pipeline, PipelineError, get_pipeline, register
+from services import jobs
 from routers.auth import get_current_user
 from models.user import User
 from models.project import Project
@@ -10,13 +12,38 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 router = APIRouter()
 
+class Motion(BaseModel):
+    type: str = "none"  # none / zoom_in / zoom_out / pan_left / pan_right / pan_up / pan_down
+    intensity: float = Field(0.15, ge=0, le=1)  # 缩放幅度（0~1，0 为静止），平移时为取景放大倍数 - 1
+
 class Scene(BaseModel):
     index: int
     narration: str
     image_prompt: Optional[str] = ""
     image_url: Optional[str] = ""
     audio_url: Optional[str] = ""
+    image_path: Optional[str] = ""
+    audio_path: Optional[str] = ""
     duration: float = 0
+    motion: Optional[Motion] = None  # 运动镜头（Ken Burns），为空时为静止画面
+    transition: Optional[str] = ""  # 进入该分镜时的转场（见 TRANSITIONS），为空时使用全局 transition
+
+class SubtitleStyle(BaseModel):
+    font: str = ""  # backend/fonts 下的字体文件名，为空时自动查找
+    fontsize: int = 36
+    outline: float = 1.5  # 描边宽度（px）
+    bottom_offset: int = 200  # 字幕顶部距画面底部的距离（px）
+
+class ExportOutput(BaseModel):
+    kind: str  # video（其他分辨率 / 宽高比）/ poster（封面）/ teaser（动图预告）
+    resolution: str = ""  # video：目标分辨率，如 1920x1080
+    fit: str = ""  # video：为空时同宽高比直接缩放、不同则按 render 处理；render 按该分辨率重新合成 / crop 居中裁剪 / pad 等比缩放补边
+    time: Optional[float] = None  # poster：截取时间点（秒），默认成片 1/3 处
+    start: float = 0  # teaser：起点（秒）
+    duration: float = 3  # teaser：时长（秒）
+    fps: int = 10  # teaser：帧率
+    width: int = 320  # teaser：宽度（高度等比）
+    format: str = "webp"  # teaser：webp / gif
 
 class VideoRequest(BaseModel):
     project_id: str
@@ -25,34 +52,151 @@ class VideoRequest(BaseModel):
     bgm_volume: float = 0.2
     resolution: str = "1080x1920"
     fps: int = 30
-    transition: str = "fade"
+    transition: str = "fade"  # fade / dissolve / slide / slideup / wipe / zoom / circle / cut / none（无转场）
+    engine: str = ""  # ffmpeg / segments / moviepy，为空时使用服务端默认
+    workers: int = 0  # 并行渲染 worker 数，0 表示使用服务端默认
+    subtitle_mode: str = "overlay"  # overlay / ass（libass 整体烧录）/ none
+    subtitle_style: SubtitleStyle = SubtitleStyle()
+    quality: str = "final"  # draft（540p / 15fps / 无转场，快速预览）/ preview / final
+    encoder_profile: str = ""  # default / stillimage / fast / compact，为空时使用服务端默认
+    outputs: List[ExportOutput] = []  # 额外导出，成片解码一次全部生成
+    hls: bool = False  # 额外生成 HLS 多码率阶梯（fMP4 分片）
+    thumbnails: Optional[bool] = None  # 生成封面与拖动预览缩略图（雪碧图 + WebVTT），为空时草稿档不生成
+    thumbnail_interval: float = 0  # 缩略图间隔（秒），0 表示使用服务端默认
 
 class VideoResponse(BaseModel):
     video_url: str
     local_path: str
     duration: float
+    file_size: int = 0
+    engine: str = ""
+    quality: str = "final"
+    encoder_profile: str = ""
+    resolution: str = ""
+    fps: int = 0
+    outputs: List[dict] = []
+    hls_url: str = ""
+    poster_url: str = ""
+    thumbnails_url: str = ""  # WebVTT 缩略图索引，cue 指向同目录下的雪碧图
+    segments_rendered: int = 0
+    segments_reused: int = 0
+    scene_timings: List[dict] = []
+
+class RemixRequest(BaseModel):
+    video_url: str  # 已合成的成片地址（/output/videos/...）
+    bgm_path: Optional[str] = ""  # 为空时去掉 BGM，只保留旁白
+    bgm_volume: float = 0.2
+    duck_db: float = -8.0  # 人声期间 BGM 额外衰减（dB），0 表示不闪避
+
+class PipelineRequest(VideoRequest):
+    scene_count: int  # 分镜总数，全部提交后自动拼接成片
+    scenes: List[Scene] = []  # 可在创建时一并提交已就绪的分镜
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
 
 class ProjectSaveRequest(BaseModel):
     title: str
     scenes: List[dict]
     video_url: str
 
-@router.post("/compose", response_model=VideoResponse)
+@router.post("/compose", response_model=JobResponse, status_code=202)
 async def compose(req: VideoRequest):
-    """合成最终视频"""
+    """提交视频合成任务，立即返回任务 ID（通过 /api/jobs/{job_id} 查询进度与结果）"""
     if not req.scenes:
         raise HTTPException(400, "没有分镜数据")
+    try:
+        validate_compose([s.model_dump() for s in req.scenes], req.engine, **_compose_options(req))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
-    result = await compose_video(
-        project_id=req.project_id,
+    try:
+        job = jobs.submit("compose", _compose_job, req)
+    except jobs.JobQueueFull as e:
+        raise HTTPException(503, str(e))
+    return JobResponse(job_id=job.id, status=job.status)
+
+def _compose_job(req: VideoRequest) -> dict:
+    """在合成线程池中执行"""
+    result = compose_video_sync(
         scenes=[s.model_dump() for s in req.scenes],
+        engine=req.engine,
+        **_compose_options(req),
+    )
+    return VideoResponse(**result).model_dump()
+
+def _compose_options(req: VideoRequest) -> dict:
+    """请求参数 → compose_video_sync 参数（不含分镜与引擎）"""
+    return dict(
+        project_id=req.project_id,
         bgm_path=req.bgm_path,
         bgm_volume=req.bgm_volume,
         resolution=req.resolution,
         fps=req.fps,
         transition=req.transition,
+        workers=req.workers,
+        subtitle_mode=req.subtitle_mode,
+        subtitle_style={
+            "font": req.subtitle_style.font,
+            "fontsize": req.subtitle_style.fontsize,
+            "stroke_width": req.subtitle_style.outline,
+            "bottom_offset": req.subtitle_style.bottom_offset,
+        },
+        quality=req.quality,
+        encoder_profile=req.encoder_profile,
+        outputs=[o.model_dump(exclude_none=True) for o in req.outputs],
+        hls=req.hls,
+        thumbnails=req.thumbnails,
+        thumbnail_interval=req.thumbnail_interval,
     )
-    return result
+
+@router.post("/remix", response_model=JobResponse, status_code=202)
+async def remix(req: RemixRequest):
+    """更换 BGM / 音量 / 闪避强度：只重建音轨并流拷贝画面，结果同 /compose，通过 /api/jobs/{job_id} 查询"""
+    try:
+        job = jobs.submit("remix", _remix_job, req)
+    except jobs.JobQueueFull as e:
+        raise HTTPException(503, str(e))
+    return JobResponse(job_id=job.id, status=job.status)
+
+def _remix_job(req: RemixRequest) -> dict:
+    result = remix_video_sync(req.video_url, req.bgm_path, req.bgm_volume, req.duck_db)
+    return VideoResponse(**result).model_dump()
+
+@router.post("/pipeline", response_model=JobResponse, status_code=202)
+async def create_pipeline(req: PipelineRequest):
+    """创建流水线合成任务：之后逐个提交分镜，每个分镜就绪即编码，全部到齐后自动拼接
+
+    成片结果同 /compose，通过 /api/jobs/{job_id} 查询
+    """
+    try:
+        validate_compose([s.model_dump() for s in req.scenes], "segments", **_compose_options(req))
+        pipeline = Pipeline(req.scene_count, _compose_options(req), req.workers)
+        for scene in req.scenes:
+            pipeline.submit(scene.model_dump())
+        job = jobs.submit_async("pipeline", _pipeline_job, pipeline)
+    except (PipelineError, ValueError) as e:
+        raise HTTPException(400, str(e))
+    except jobs.JobQueueFull as e:
+        raise HTTPException(503, str(e))
+    register(job, pipeline)
+    return JobResponse(job_id=job.id, status=job.status)
+
+@router.post("/pipeline/{job_id}/scenes", status_code=202)
+async def submit_pipeline_scene(job_id: str, scene: Scene):
+    """向流水线提交一个就绪的分镜（图片与音频均已生成）"""
+    pipeline = get_pipeline(job_id)
+    if pipeline is None:
+        raise HTTPException(404, "流水线任务不存在或已结束")
+    try:
+        received = pipeline.submit(scene.model_dump())
+    except PipelineError as e:
+        raise HTTPException(409, str(e))
+    return {"job_id": job_id, "received": received, "total": pipeline.total}
+
+async def _pipeline_job(pipeline: Pipeline) -> dict:
+    return VideoResponse(**await pipeline.run()).model_dump()
 
 @router.post("/save")
 async def save_project(
@@ -1,8 +1,14 @@
 """语音合成路由"""
+import json
+import secrets
+import time
+from typing import Optional
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from services.tts_service import synthesize_speech, list_voices
+from services.tts_service import synthesize_speech, synthesize_batch, synthesize_each, stream_speech, list_voices
+from services.tts_cache import cache_stats
+from services import jobs
 
 router = APIRouter()
 
@@ -16,10 +22,28 @@ class TTSRequest(BaseModel):
     api_key: str = ""
 
 
+class TTSBatchItem(BaseModel):
+    index: int
+    text: str
+
+
+class TTSBatchRequest(BaseModel):
+    items: list[TTSBatchItem]
+    voice: str = "zh-CN-XiaoxiaoNeural"
+    rate: str = "+0%"
+    volume: str = "+0%"
+    provider: str = "edge-tts"
+    api_key: str = ""
+    concurrency: int = 0  # 本批次额外并发上限，0 表示只受服务端 TTS_CONCURRENCY 约束
+    retries: Optional[int] = None  # 失败重试次数，为空时使用服务端 TTS_RETRIES
+    session: bool = False  # 整段脚本单会话合成后按词边界切分（仅 edge-tts，减少握手次数并保持语调连贯）
+
+
 class TTSResponse(BaseModel):
     audio_url: str
     local_path: str
     duration: float = 0
+    cached: bool = False
 
 
 @router.post("/synthesize", response_model=TTSResponse)
@@ -39,6 +63,116 @@ async def synthesize(req: TTSRequest):
     return result
 
 
+# 试听播放地址的有效期（秒）。密钥只随 POST 请求体提交，播放地址中只有一次性随机令牌
+PREVIEW_TTL = 60
+PREVIEW_MAX_PENDING = 64  # 未取用的试听令牌上限，超出时丢弃最早创建的
+_previews: dict[str, tuple[float, dict]] = {}
+
+
+def _prune_previews() -> None:
+    """丢弃过期的试听令牌（连同其中的密钥），并限制未取用令牌的数量"""
+    now = time.monotonic()
+    for token in [t for t, (expires, _) in _previews.items() if expires < now]:
+        del _previews[token]
+    while len(_previews) >= PREVIEW_MAX_PENDING:
+        del _previews[next(iter(_previews))]
+
+
+@router.post("/stream")
+async def create_stream(req: TTSRequest):
+    """创建流式试听，返回一次性、短期有效的播放地址 {"stream_url"}"""
+    if not req.text.strip():
+        raise HTTPException(400, "文本不能为空")
+    if req.provider not in ("edge-tts", "openai-tts"):
+        raise HTTPException(400, f"不支持的 TTS 供应商: {req.provider}")
+
+    _prune_previews()
+    token = secrets.token_urlsafe(16)
+    _previews[token] = (time.monotonic() + PREVIEW_TTL, req.model_dump())
+    return {"stream_url": f"/api/voice/stream/{token}"}
+
+
+@router.get("/stream/{token}")
+async def synthesize_stream(token: str):
+    """流式合成语音（试听），以分块传输的 audio/mpeg 边合成边返回
+
+    使用 GET 以便直接作为 <audio> 的 src 边下边播；令牌取用一次即失效。
+    完整合成的结果写入 TTS 缓存
+    """
+    entry = _previews.pop(token, None)
+    _prune_previews()
+    if not entry or entry[0] < time.monotonic():
+        raise HTTPException(404, "试听地址已失效")
+    chunks = stream_speech(**entry[1])
+    return StreamingResponse(chunks, media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
+
+
+def _batch_items(req: TTSBatchRequest) -> list[dict]:
+    items = [{"index": i.index, "text": i.text} for i in req.items if i.text.strip()]
+    if not items:
+        raise HTTPException(400, "文本不能为空")
+    return items
+
+
+@router.post("/synthesize-batch")
+async def synthesize_batch_stream(req: TTSBatchRequest):
+    """批量合成语音，按完成顺序以 NDJSON 流式返回每条结果
+
+    每行一个 JSON：{"index", "audio_url", "local_path", "duration", "cached", "error"}，
+    最后一行为汇总 {"done": true, "total", "failed"}；客户端断开时取消未完成的合成
+    """
+    items = _batch_items(req)
+
+    async def _lines():
+        failed = 0
+        async for entry in synthesize_each(
+            items,
+            concurrency=req.concurrency,
+            retries=req.retries,
+            session=req.session,
+            voice=req.voice,
+            rate=req.rate,
+            volume=req.volume,
+            provider=req.provider,
+            api_key=req.api_key,
+        ):
+            failed += bool(entry["error"])
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "total": len(items), "failed": failed}) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
+@router.post("/batch", status_code=202)
+async def synthesize_batch_job(req: TTSBatchRequest):
+    """提交批量语音合成任务，立即返回任务 ID（通过 /api/jobs/{job_id}/events 获取实时进度）"""
+    items = _batch_items(req)
+
+    try:
+        job = jobs.submit_async(
+            "tts_batch",
+            synthesize_batch,
+            items=items,
+            concurrency=req.concurrency,
+            retries=req.retries,
+            session=req.session,
+            voice=req.voice,
+            rate=req.rate,
+            volume=req.volume,
+            provider=req.provider,
+            api_key=req.api_key,
+        )
+    except jobs.JobQueueFull as e:
+        raise HTTPException(503, str(e))
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    """TTS 缓存命中率与占用情况"""
+    return cache_stats()
+
+
 @router.get("/voices")
 async def get_voices(provider: str = "edge-tts", language: str = "zh"):
     """获取可用音色列表"""
@@ -0,0 +1,160 @@
+"""编码档位基准测试
+
+合成一个示例项目（渐变静帧 + 正弦波旁白），用每个编码档位各合成一次，
+统计墙钟耗时、ffmpeg 子进程 CPU 时间、输出体积，以及相对无损参考的 PSNR / SSIM。
+
+用法（在 backend 目录下）：
+    python scripts/benchmark_encoders.py --scenes 8 --seconds 5
+    python scripts/benchmark_encoders.py --profiles default stillimage --json
+"""
+import argparse
+import atexit
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 合成过程中写出的字幕、时间线、时长索引等放进独立的临时目录（须在导入 config 之前设置），
+# 不混入正式任务的 TEMP_DIR / OUTPUT_DIR；导入本模块的脚本及其子进程同样生效
+SANDBOX_DIR = Path(tempfile.mkdtemp(prefix="bench_sandbox_"))
+os.environ["TEMP_DIR"] = str(SANDBOX_DIR / "temp")
+os.environ["OUTPUT_DIR"] = str(SANDBOX_DIR / "output")
+atexit.register(shutil.rmtree, SANDBOX_DIR, ignore_errors=True)
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from config import FFMPEG_BIN  # noqa: E402
+from services.encoder_profiles import ENCODER_PROFILES, audio_args, video_args  # noqa: E402
+from services.ffmpeg_engine import compose_ffmpeg  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows 不支持统计子进程 CPU 时间
+    resource = None
+
+
+def make_project(workdir: Path, scenes: int, seconds: float, width: int, height: int) -> list[dict]:
+    """生成示例分镜：每张静帧为不同色调的渐变 + 几何图形，旁白为不同音高的正弦波"""
+    project = []
+    for i in range(scenes):
+        image = Image.new("RGB", (width, height))
+        draw = ImageDraw.Draw(image)
+        for y in range(0, height, 4):
+            shade = int(255 * y / height)
+            draw.rectangle([0, y, width, y + 4], fill=((shade + 40 * i) % 256, (255 - shade) % 256, (90 * i) % 256))
+        draw.ellipse([width // 4, height // 3, width * 3 // 4, height // 3 + width // 2], outline="white", width=12)
+        image_path = workdir / f"scene_{i}.png"
+        image.save(image_path)
+
+        audio_path = workdir / f"scene_{i}.mp3"
+        subprocess.run(
+            [
+                FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", f"sine=frequency={220 + 40 * i}:duration={seconds}",
+                "-ac", "2", "-b:a", "128k", str(audio_path),
+            ],
+            check=True,
+        )
+        project.append({
+            "image_path": str(image_path),
+            "audio_path": str(audio_path),
+            "narration": f"示例字幕第 {i + 1} 段，用于衡量字幕区域的编码质量",
+        })
+    return project
+
+
+def _children_cpu() -> float | None:
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _quality(output: Path, reference: Path) -> tuple[float | None, float | None]:
+    """计算输出相对参考视频的平均 PSNR（dB）与 SSIM"""
+    result = subprocess.run(
+        [
+            FFMPEG_BIN, "-hide_banner", "-nostats", "-i", str(output), "-i", str(reference),
+            "-lavfi", "[0:v]split[a0][a1];[1:v]split[b0][b1];[a0][b0]psnr;[a1][b1]ssim",
+            "-f", "null", "-",
+        ],
+        capture_output=True, text=True,
+    )
+    psnr = re.search(r"PSNR .*average:([\d.]+|inf)", result.stderr)
+    ssim = re.search(r"SSIM .*All:([\d.]+)", result.stderr)
+    return (
+        float(psnr.group(1)) if psnr else None,
+        float(ssim.group(1)) if ssim else None,
+    )
+
+
+def _encode(project: list[dict], output: Path, args: argparse.Namespace, encode: list[str], audio: list[str]) -> dict:
+    cpu_before = _children_cpu()
+    start = time.perf_counter()
+    compose_ffmpeg(
+        project, output, width=args.width, height=args.height, fps=args.fps,
+        encode_args=encode, audio_args=audio,
+    )
+    wall = time.perf_counter() - start
+    cpu_after = _children_cpu()
+    return {
+        "wall_seconds": round(wall, 2),
+        "cpu_seconds": round(cpu_after - cpu_before, 2) if cpu_before is not None else None,
+        "size_kb": round(output.stat().st_size / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="对比各编码档位的耗时、体积与画质")
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0, help="每个分镜的旁白时长")
+    parser.add_argument("--resolution", default="1080x1920")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--profiles", nargs="*", default=list(ENCODER_PROFILES))
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--keep", action="store_true", help="保留生成的示例项目与视频")
+    args = parser.parse_args()
+    args.width, args.height = map(int, args.resolution.split("x"))
+
+    workdir = Path(tempfile.mkdtemp(prefix="encoder_bench_"))
+    try:
+        project = make_project(workdir, args.scenes, args.seconds, args.width, args.height)
+
+        # 无损参考：画质指标的比较基准
+        reference = workdir / "reference.mp4"
+        _encode(project, reference, args, ["-preset", "ultrafast", "-qp", "0"], [])
+
+        results = []
+        for name in args.profiles:
+            profile = ENCODER_PROFILES[name]
+            output = workdir / f"{name}.mp4"
+            stats = _encode(project, output, args, video_args(profile, args.fps), audio_args(profile))
+            psnr, ssim = _quality(output, reference)
+            results.append({"profile": name, **stats, "psnr": psnr, "ssim": ssim})
+    finally:
+        if args.keep:
+            print(f"示例项目保留在 {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'profile':<12}{'wall(s)':>10}{'cpu(s)':>10}{'size(KB)':>12}{'PSNR':>9}{'SSIM':>9}")
+    for r in results:
+        cpu = "-" if r["cpu_seconds"] is None else r["cpu_seconds"]
+        psnr = "-" if r["psnr"] is None else f"{r['psnr']:.2f}"
+        ssim = "-" if r["ssim"] is None else f"{r['ssim']:.4f}"
+        print(f"{r['profile']:<12}{r['wall_seconds']:>10}{cpu:>10}{r['size_kb']:>12}{psnr:>9}{ssim:>9}")
+
+
+if __name__ == "__main__":
+    main()
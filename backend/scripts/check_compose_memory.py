@@ -0,0 +1,95 @@
+"""长视频合成内存检查
+
+生成一个 150 个分镜的示例项目，在子进程中用指定引擎合成，读取子进程的峰值 RSS，
+超过上限时以非零状态退出（可用于 CI 回归检查）。
+
+用法（在 backend 目录下）：
+    python scripts/check_compose_memory.py --scenes 150 --max-rss-mb 1500
+    python scripts/check_compose_memory.py --engine segments --resolution 540x960
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import resource  # noqa: E402  仅支持类 Unix 系统
+
+from benchmark_encoders import make_project  # noqa: E402
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _child(args: argparse.Namespace) -> None:
+    """子进程：执行合成并输出峰值 RSS"""
+    from services.video_service import compose_video_sync
+
+    project = json.loads(Path(args.project).read_text(encoding="utf-8"))
+    result = compose_video_sync(
+        project_id="memcheck",
+        scenes=[{"index": i, **scene} for i, scene in enumerate(project)],
+        resolution=args.resolution,
+        fps=args.fps,
+        engine=args.engine,
+    )
+    Path(result["local_path"]).unlink(missing_ok=True)
+    print(json.dumps({"peak_rss_mb": round(_peak_rss_mb(), 1), "duration": result["duration"]}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="检查长视频合成的峰值内存")
+    parser.add_argument("--scenes", type=int, default=150)
+    parser.add_argument("--seconds", type=float, default=1.0, help="每个分镜的旁白时长")
+    parser.add_argument("--resolution", default="1080x1920")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--engine", default="moviepy")
+    parser.add_argument("--max-rss-mb", type=float, default=1500)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--project", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    width, height = map(int, args.resolution.split("x"))
+    workdir = Path(tempfile.mkdtemp(prefix="compose_memcheck_"))
+    try:
+        project_file = workdir / "project.json"
+        project_file.write_text(
+            json.dumps(make_project(workdir, args.scenes, args.seconds, width, height), ensure_ascii=False),
+            encoding="utf-8",
+        )
+        # 在独立子进程中合成，峰值 RSS 不受示例项目生成过程影响
+        result = subprocess.run(
+            [
+                sys.executable, __file__, "--child", "--project", str(project_file),
+                "--resolution", args.resolution, "--fps", str(args.fps), "--engine", args.engine,
+            ],
+            capture_output=True, text=True,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if result.returncode != 0:
+        print(result.stderr[-2000:], file=sys.stderr)
+        sys.exit(result.returncode)
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    ok = stats["peak_rss_mb"] <= args.max_rss_mb
+    print(
+        f"{args.engine}: {args.scenes} 个分镜，成片 {stats['duration']} 秒，"
+        f"峰值 RSS {stats['peak_rss_mb']} MB（上限 {args.max_rss_mb} MB）{'通过' if ok else '超出上限'}"
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
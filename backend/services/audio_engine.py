@@ -0,0 +1,193 @@
+"""NumPy 音频引擎 - 旁白拼接 + BGM 侧链闪避
+
+旁白与 BGM 各解码为 PCM 一次，在 NumPy 中整体排布时间线：
+- 旁白按分镜起点放置，分镜交界处与画面转场同步交叉淡化，片段边缘做去爆音淡入淡出
+- BGM 从曲库 PCM 缓存读取并循环 / 裁剪到时间线长度，按人声包络做侧链式闪避
+  （说话时压低、停顿时回升），结尾淡出
+- 输出单条 WAV 音轨，由视频编码直接混流
+"""
+import subprocess
+import wave
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+
+from config import FFMPEG_BIN
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+DECLICK = 0.01            # 片段边缘淡入淡出（秒），消除爆音
+DUCK_DB = -8.0            # 人声期间 BGM 额外衰减（dB）
+DUCK_THRESHOLD_DB = -40.0 # 人声检测阈值（dBFS）
+DUCK_WINDOW = 0.02        # 包络分析窗长（秒）
+DUCK_ATTACK = 0.08        # 闪避压下时长（秒）
+DUCK_RELEASE = 0.4        # 人声停顿后保持闪避的时长（秒），避免 BGM 在词间抽动
+BGM_FADEOUT = 2.0         # BGM 结尾淡出时长（秒）
+BLOCK_SAMPLES = 1 << 16   # 闪避 / 混音 / 写出时每块处理的采样数，限制临时数组大小
+
+
+def decode_pcm(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """用 ffmpeg 将任意音频解码为 float32 PCM，形状 (samples, 2)"""
+    result = subprocess.run(
+        [
+            FFMPEG_BIN, "-v", "error", "-i", str(path),
+            "-f", "f32le", "-ac", str(CHANNELS), "-ar", str(sample_rate), "pipe:1",
+        ],
+        capture_output=True, timeout=120,
+    )
+    if result.returncode != 0:
+        tail = result.stderr.decode("utf-8", errors="ignore").strip()[-400:]
+        raise RuntimeError(f"音频解码失败: {path}: {tail}")
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, CHANNELS)
+
+
+def _ramp(n: int) -> np.ndarray:
+    """等功率淡入曲线（长度 n，列向量）"""
+    return np.sin(np.linspace(0.0, np.pi / 2, n, dtype=np.float32))[:, None]
+
+
+def _place(timeline: np.ndarray, pcm: np.ndarray, lo: int, hi: int, gain: np.ndarray | None = None) -> None:
+    """将 pcm[lo:hi] 乘以增益后原地累加到 timeline 同一区间（pcm 不足时视为静音）"""
+    hi = min(hi, len(pcm))
+    if hi <= lo:
+        return
+    if gain is None:
+        timeline[lo:hi] += pcm[lo:hi]
+    else:
+        timeline[lo:hi] += pcm[lo:hi] * gain[:hi - lo]
+
+
+def layout_narration(
+    clips: Iterable[np.ndarray], durations: list[float], fade: float, sample_rate: int = SAMPLE_RATE,
+) -> np.ndarray:
+    """按分镜时长排布旁白；相邻分镜重叠 fade 秒，在重叠区交叉淡化
+
+    clips 可以是逐个解码的生成器：每段解码后立即叠加到时间线，不同时持有全部片段
+    """
+    starts, t = [], 0.0
+    for d in durations:
+        starts.append(round(t * sample_rate))
+        t += d - fade
+    total = round((sum(durations) - fade * (len(durations) - 1)) * sample_rate)
+    timeline = np.zeros((total, CHANNELS), dtype=np.float32)
+
+    declick = max(1, round(DECLICK * sample_rate))
+    fade_n = round(fade * sample_rate)
+    for i, (pcm, start, d) in enumerate(zip(clips, starts, durations)):
+        n = max(0, min(round(d * sample_rate), total - start))
+        region = timeline[start:start + n]
+        head = min(declick, n)
+        # 非最后一个分镜：尾部与下一分镜的转场重叠区淡出
+        tail = min(max(fade_n if i < len(durations) - 1 else 0, declick), n)
+        if head + tail > n:
+            # 片段极短，淡入淡出区相互重叠：合成一条增益曲线（长度不超过 head + tail）
+            gain = np.ones((n, 1), dtype=np.float32)
+            gain[:head] *= _ramp(head)
+            gain[n - tail:] *= _ramp(tail)[::-1]
+            _place(region, pcm, 0, n, gain)
+        else:
+            _place(region, pcm, 0, head, _ramp(head))
+            _place(region, pcm, head, n - tail)
+            _place(region, pcm, n - tail, n, _ramp(tail)[::-1])
+    return timeline
+
+
+def duck_envelope(voice: np.ndarray, sample_rate: int = SAMPLE_RATE, duck_db: float = DUCK_DB) -> np.ndarray:
+    """根据人声包络计算 BGM 增益（每个分析窗一个值，取值 duck_db 对应增益 ~ 1.0）
+
+    返回形状 (len(voice) // window + 1,)，第 k 个值对应窗中心 (k + 0.5) * window，
+    由 mix_bgm 分块插值到逐采样
+    """
+    window = max(1, round(DUCK_WINDOW * sample_rate))
+    full = len(voice) // window
+    frames = full + 1
+    # 逐块求各窗的单声道能量，不复制整条人声；末尾不足一窗的部分按补静音计算
+    energy = np.zeros(frames, dtype=np.float32)
+    step = max(1, BLOCK_SAMPLES // window)
+    for k in range(0, full, step):
+        end = min(k + step, full)
+        mono = voice[k * window:end * window].reshape(end - k, window, CHANNELS).mean(axis=2)
+        energy[k:end] = np.mean(np.square(mono), axis=1)
+    rest = voice[full * window:]
+    if len(rest):
+        energy[full] = np.sum(np.square(rest.mean(axis=1))) / window
+    rms_db = 10 * np.log10(energy + 1e-12)
+    speech = (rms_db > DUCK_THRESHOLD_DB).astype(np.float32)
+
+    # 人声后保持 release 时长，再用 attack 长度的滑动平均平滑过渡
+    hold = max(1, round(DUCK_RELEASE / DUCK_WINDOW))
+    speech = (np.convolve(speech, np.ones(hold), mode="full")[:frames] > 0).astype(np.float32)
+    attack = max(1, round(DUCK_ATTACK / DUCK_WINDOW))
+    speech = np.convolve(speech, np.ones(attack) / attack, mode="same")
+
+    duck_gain = 10 ** (duck_db / 20)
+    return (1.0 - speech * (1.0 - duck_gain)).astype(np.float32)
+
+
+def mix_bgm(
+    voice: np.ndarray, bgm: np.ndarray, bgm_volume: float, sample_rate: int = SAMPLE_RATE,
+    duck_db: float = DUCK_DB,
+) -> np.ndarray:
+    """BGM（已循环 / 裁剪到时间线长度）闪避、结尾淡出后原地叠加到旁白上并返回旁白数组
+    （duck_db 为 0 时不闪避）
+
+    音量、闪避、淡出合成为逐块的 float32 增益，BGM 只读不复制，可直接传入内存映射
+    """
+    length = min(len(voice), len(bgm))
+    fade_start = length - min(length, round(BGM_FADEOUT * sample_rate))
+    if duck_db:
+        window = max(1, round(DUCK_WINDOW * sample_rate))
+        gains = duck_envelope(voice[:length], sample_rate, duck_db)
+        positions = (np.arange(len(gains)) + 0.5) * window
+    for lo in range(0, length, BLOCK_SAMPLES):
+        hi = min(lo + BLOCK_SAMPLES, length)
+        index = np.arange(lo, hi)
+        gain = np.full(hi - lo, bgm_volume, dtype=np.float32)
+        if duck_db:
+            gain *= np.interp(index, positions, gains).astype(np.float32)
+        if hi > fade_start:
+            # 结尾淡出：从 fade_start 处的 1.0 线性降到最后一个采样的 0.0
+            fade = (length - 1 - index) / max(1, length - 1 - fade_start)
+            gain *= np.clip(fade, 0.0, 1.0).astype(np.float32)
+        voice[lo:hi] += bgm[lo:hi] * gain[:, None]
+    return voice
+
+
+def write_wav(pcm: np.ndarray, path: Path, sample_rate: int = SAMPLE_RATE) -> Path:
+    """分块写出 16-bit WAV；峰值超过满幅时整体缩放，避免削波"""
+    peak = 0.0
+    for lo in range(0, len(pcm), BLOCK_SAMPLES):
+        block = pcm[lo:lo + BLOCK_SAMPLES]
+        peak = max(peak, float(block.max()), -float(block.min()))
+    scale = np.float32(32767 / max(peak, 1.0))
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(CHANNELS)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        for lo in range(0, len(pcm), BLOCK_SAMPLES):
+            f.writeframes((pcm[lo:lo + BLOCK_SAMPLES] * scale).astype("<i2").tobytes())
+    return path
+
+
+def build_audio_track(
+    audio_paths: list[str],
+    durations: list[float],
+    fade: float,
+    output_path: Path,
+    bgm_path: str = "",
+    bgm_volume: float = 0.15,
+    duck_db: float = DUCK_DB,
+) -> Path:
+    """生成整条时间线的音轨 WAV
+
+    durations 为各分镜在画面上的时长（与视频时间线共用），fade 为转场重叠时长；
+    duck_db 为人声期间 BGM 的额外衰减（dB，0 表示不闪避）
+    """
+    from services.bgm_library import load_bgm
+
+    voice = layout_narration((decode_pcm(p) for p in audio_paths), durations, fade)
+    if bgm_path:
+        voice = mix_bgm(voice, load_bgm(bgm_path, len(voice)), bgm_volume, duck_db=duck_db)
+    return write_wav(voice, output_path)
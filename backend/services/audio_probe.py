@@ -0,0 +1,265 @@
+"""音频时长测量 - 解析 MP3 帧头得到精确时长，不解码、不启动子进程
+
+TTS 写出音频时立即测量时长，记入音频所在目录的时长索引（保存在 DURATION_INDEX_DIR，
+每个目录一个文件，按文件名索引，以文件大小与修改时间判断是否过期；改动在后台线程合并写盘）。
+合成引擎从索引读取时长，不再逐个 ffprobe 或用 moviepy 完整解码。
+
+MP3 时长按以下顺序确定：
+- Xing / Info 头（VBR 及 LAME 写出的 CBR）：总帧数 × 每帧采样数，再扣除 LAME 标签中的编码延迟与补齐
+- VBRI 头（Fraunhofer 编码器）：总帧数 × 每帧采样数
+- 均无时逐帧读取帧头计数（Edge-TTS 输出的 CBR 流即属此类），仅跳读帧头，开销与文件大小成正比但极小
+非 MP3 文件退回 ffprobe。
+"""
+import atexit
+import bisect
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from config import DURATION_INDEX_DIR
+
+INDEX_VERSION = 1
+INDEX_FLUSH_DELAY = 1.0  # 索引改动合并写盘的延迟（秒）
+
+# 比特率表（kbps），按 (MPEG-1?, 层) 索引
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# 采样率表，按版本位索引：0 = MPEG-2.5，2 = MPEG-2，3 = MPEG-1
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+_LAME_ENCODERS = (b"LAME", b"Lavc", b"Lavf")
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_indexes: dict[Path, dict] = {}
+_dirty: set[Path] = set()
+_flush_timer: threading.Timer | None = None
+
+
+def _parse_header(data: bytes, pos: int) -> dict | None:
+    """解析 pos 处的 MP3 帧头，不是合法帧头时返回 None"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if mpeg1 or layer == 2 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        "mpeg1": mpeg1,
+        "layer": layer,
+        "mono": b3 >> 6 == 3,
+        "crc": not b1 & 1,
+        "sample_rate": sample_rate,
+        "samples": samples,
+        "length": length,
+    }
+
+
+def _skip_id3v2(data: bytes) -> int:
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def _first_frame(data: bytes, start: int) -> tuple[int, dict]:
+    """定位第一个有效帧（要求紧随其后的也是合法帧头，避免误判同步字）"""
+    pos = data.find(b"\xff", start)
+    while pos != -1:
+        header = _parse_header(data, pos)
+        if header:
+            following = pos + header["length"]
+            if following >= len(data) or _parse_header(data, following):
+                return pos, header
+        pos = data.find(b"\xff", pos + 1)
+    raise ValueError("不是有效的 MP3 文件")
+
+
+def _vbr_frames(data: bytes, pos: int, header: dict) -> tuple[int, int] | None:
+    """读取 Xing / Info / VBRI 头中的总帧数，返回 (帧数, 需扣除的采样数)"""
+    if header["mpeg1"]:
+        side_info = 17 if header["mono"] else 32
+    else:
+        side_info = 9 if header["mono"] else 17
+    xing = pos + 4 + (2 if header["crc"] else 0) + side_info
+    tag = data[xing:xing + 4]
+    if tag in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing + 4:xing + 8], "big")
+        if not flags & 1:
+            return None
+        frames = int.from_bytes(data[xing + 8:xing + 12], "big")
+        lame = xing + 12 + (4 if flags & 2 else 0) + (100 if flags & 4 else 0) + (4 if flags & 8 else 0)
+        trim = 0
+        if data[lame:lame + 4] in _LAME_ENCODERS and len(data) >= lame + 24:
+            # LAME 标签第 21~23 字节：12 位编码延迟 + 12 位末尾补齐
+            gapless = int.from_bytes(data[lame + 21:lame + 24], "big")
+            trim = (gapless >> 12) + (gapless & 0xFFF)
+        return frames, trim
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI":
+        return int.from_bytes(data[vbri + 14:vbri + 18], "big"), 0
+    return None
+
+
+def mp3_duration(path: str | Path) -> float:
+    """解析 MP3 帧头计算精确时长（秒）"""
+    data = Path(path).read_bytes()
+    pos, header = _first_frame(data, _skip_id3v2(data))
+    vbr = _vbr_frames(data, pos, header)
+    if vbr:
+        frames, trim = vbr
+        return max(0, frames * header["samples"] - trim) / header["sample_rate"]
+
+    # 无 VBR 头：逐帧跳读帧头计数，遇到非帧数据（如 ID3v1 标签）即结束
+    sample_rate, samples = header["sample_rate"], 0
+    while header:
+        samples += header["samples"]
+        pos += header["length"]
+        header = _parse_header(data, pos)
+    return samples / sample_rate
+
+
+def mp3_frames(data: bytes) -> list[tuple[int, float]]:
+    """逐帧读取帧头，返回每帧的 (字节偏移, 起始时间秒)；多段 MP3 直接拼接的数据也可解析"""
+    frames = []
+    try:
+        pos, header = _first_frame(data, _skip_id3v2(data))
+    except ValueError:
+        return frames
+    t = 0.0
+    while header:
+        frames.append((pos, t))
+        t += header["samples"] / header["sample_rate"]
+        pos += header["length"]
+        header = _parse_header(data, pos)
+        if header is None and pos < len(data):
+            # 拼接处可能夹带非帧数据（标签 / 填充），重新同步
+            try:
+                pos, header = _first_frame(data, pos + 1)
+            except ValueError:
+                break
+    return frames
+
+
+def split_mp3(data: bytes, cuts: list[float]) -> list[bytes]:
+    """在最接近各时间点的帧边界处切分 MP3（不解码），返回 len(cuts) + 1 段"""
+    frames = mp3_frames(data)
+    if not frames:
+        raise ValueError("不是有效的 MP3 数据")
+    times = [t for _, t in frames]
+    offsets = [frames[0][0]]
+    for cut in cuts:
+        index = bisect.bisect_left(times, cut)
+        if index == len(times) or (index > 0 and cut - times[index - 1] < times[index] - cut):
+            index -= 1
+        offsets.append(max(offsets[-1], frames[index][0]))
+    offsets.append(len(data))
+    return [data[a:b] for a, b in zip(offsets, offsets[1:])]
+
+
+def _signature(path: Path) -> str:
+    stat = path.stat()
+    return f"{INDEX_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _index_file(directory: Path) -> Path:
+    digest = hashlib.sha1(str(directory).encode("utf-8")).hexdigest()[:16]
+    return DURATION_INDEX_DIR / f"{digest}.json"
+
+
+def _load_index(directory: Path) -> dict:
+    if directory not in _indexes:
+        try:
+            _indexes[directory] = json.loads(_index_file(directory).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _indexes[directory] = {}
+    return _indexes[directory]
+
+
+def flush_index() -> None:
+    """把有改动的时长索引写回磁盘"""
+    global _flush_timer
+    with _flush_lock:  # 串行写盘，避免较旧的快照覆盖较新的
+        with _lock:
+            _flush_timer = None
+            pending = {directory: dict(_indexes[directory]) for directory in _dirty}
+            _dirty.clear()
+        for directory, index in pending.items():
+            path = _index_file(directory)
+            tmp_path = path.with_suffix(f".{uuid.uuid4().hex[:6]}.tmp")
+            tmp_path.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, path)
+
+
+def _mark_dirty(directory: Path) -> None:
+    """登记待写回的目录，延迟 INDEX_FLUSH_DELAY 秒在后台线程批量写盘（需持有 _lock）"""
+    global _flush_timer
+    _dirty.add(directory)
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(INDEX_FLUSH_DELAY, flush_index)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+atexit.register(flush_index)
+
+
+def measure_duration(path: str | Path) -> float:
+    """测量音频时长：MP3 解析帧头，其他格式（或解析失败）退回 ffprobe"""
+    if Path(path).suffix.lower() == ".mp3":
+        try:
+            return mp3_duration(path)
+        except ValueError:
+            pass
+    from services.ffmpeg_engine import probe_duration
+    return probe_duration(str(path))
+
+
+def record_duration(path: str | Path, duration: float | None = None) -> float:
+    """测量（或直接使用给定的）时长并记入所在目录的时长索引，返回时长（索引在后台批量写盘）"""
+    path = Path(path).resolve()
+    if duration is None:
+        duration = measure_duration(path)
+    with _lock:
+        index = _load_index(path.parent)
+        index[path.name] = {"signature": _signature(path), "duration": round(duration, 4)}
+        _mark_dirty(path.parent)
+    return duration
+
+
+def forget_duration(path: str | Path) -> None:
+    """从时长索引中移除已删除的音频（缓存淘汰时调用，避免索引无限增长）"""
+    path = Path(path).resolve()
+    with _lock:
+        index = _load_index(path.parent)
+        if index.pop(path.name, None) is not None:
+            _mark_dirty(path.parent)
+
+
+def audio_duration(path: str | Path) -> float:
+    """读取音频时长：优先查时长索引，缺失或文件已变化时测量并补写索引"""
+    path = Path(path).resolve()
+    with _lock:
+        entry = _load_index(path.parent).get(path.name)
+    if entry and entry["signature"] == _signature(path):
+        return entry["duration"]
+    return record_duration(path)
@@ -0,0 +1,193 @@
+"""BGM 曲库 - 扫描 BGM_DIR 建立索引，缓存解码后的 PCM
+
+每首曲目记录时长、整体响度（EBU R128 积分响度）、采样率，并解码为 float32 PCM
+存入缓存目录；合成时以内存映射方式读取，按需循环或裁剪到任意长度，无需再次解码。
+索引按 (文件名, 大小, 修改时间) 判断是否过期，曲目更新后自动重建。
+"""
+import json
+import os
+import re
+import subprocess
+import threading
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from config import BGM_CACHE_DIR, BGM_DIR, FFMPEG_BIN, FFPROBE_BIN
+from services.audio_engine import CHANNELS, SAMPLE_RATE
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".m4a", ".aac", ".ogg", ".flac"}
+INDEX_VERSION = 1
+LOOP_CROSSFADE = 1.0  # 循环接缝处的交叉淡化时长（秒）
+
+_INDEX_PATH = BGM_CACHE_DIR / "index.json"
+_lock = threading.Lock()  # 保护索引读写（只做内存 / 小文件操作，不在持锁期间解码）
+_build_locks: dict[str, threading.Lock] = {}  # 每首曲目一把锁，同一曲目只解码一次
+_index: dict | None = None
+
+
+def _signature(path: Path) -> str:
+    stat = path.stat()
+    return f"{INDEX_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _probe_sample_rate(path: Path) -> int:
+    result = subprocess.run(
+        [FFPROBE_BIN, "-v", "quiet", "-print_format", "json", "-show_streams", "-select_streams", "a:0", str(path)],
+        capture_output=True, text=True, timeout=30,
+    )
+    streams = json.loads(result.stdout or "{}").get("streams") or [{}]
+    return int(streams[0].get("sample_rate", 0) or 0)
+
+
+def _analyze(path: Path, pcm_path: Path) -> float:
+    """一次解码同时完成：写出 PCM 缓存 + ebur128 测量积分响度（LUFS）"""
+    tmp_path = pcm_path.with_name(f"{pcm_path.stem}.{uuid.uuid4().hex[:6]}.tmp")
+    try:
+        result = subprocess.run(
+            [
+                FFMPEG_BIN, "-y", "-hide_banner", "-nostats", "-i", str(path),
+                "-filter_complex", f"[0:a]aresample={SAMPLE_RATE},aformat=channel_layouts=stereo,asplit[pcm][meter];"
+                                   "[meter]ebur128=framelog=quiet,anullsink",
+                "-map", "[pcm]", "-f", "f32le", str(tmp_path),
+            ],
+            capture_output=True, timeout=600,
+        )
+        if result.returncode != 0:
+            tail = result.stderr.decode("utf-8", errors="ignore").strip()[-400:]
+            raise RuntimeError(f"BGM 解码失败: {path.name}: {tail}")
+        os.replace(tmp_path, pcm_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    matches = re.findall(r"I:\s+(-?[\d.]+) LUFS", result.stderr.decode("utf-8", errors="ignore"))
+    return float(matches[-1]) if matches else 0.0
+
+
+def _build_entry(path: Path) -> dict:
+    pcm_path = BGM_CACHE_DIR / f"{path.stem}.{uuid.uuid4().hex[:8]}.f32"
+    loudness = _analyze(path, pcm_path)
+    samples = pcm_path.stat().st_size // (4 * CHANNELS)
+    return {
+        "name": path.name,
+        "url": f"/bgm/{path.name}",
+        "signature": _signature(path),
+        "duration": round(samples / SAMPLE_RATE, 3),
+        "loudness": loudness,
+        "sample_rate": _probe_sample_rate(path),
+        "pcm": pcm_path.name,
+    }
+
+
+def _load_index() -> dict:
+    global _index
+    if _index is None:
+        try:
+            _index = json.loads(_INDEX_PATH.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _index = {}
+    return _index
+
+
+def _save_index(index: dict) -> None:
+    tmp_path = _INDEX_PATH.with_suffix(f".{uuid.uuid4().hex[:6]}.tmp")
+    tmp_path.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, _INDEX_PATH)
+
+
+def _entry_valid(entry: dict | None, path: Path) -> bool:
+    return bool(entry) and entry["signature"] == _signature(path) and (BGM_CACHE_DIR / entry["pcm"]).exists()
+
+
+def _valid_entry(key: str, path: Path) -> dict | None:
+    with _lock:
+        entry = _load_index().get(key)
+        return entry if _entry_valid(entry, path) else None
+
+
+def get_entry(path: str | Path) -> dict:
+    """获取单首曲目的索引项（缺失或过期时立即分析并写入索引）
+
+    解码只持有该曲目的锁：长曲目首次分析时，使用其他曲目的合成任务不受影响
+    """
+    path = Path(path)
+    key = str(path.resolve())
+    entry = _valid_entry(key, path)
+    if entry:
+        return entry
+    with _lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        entry = _valid_entry(key, path)  # 等锁期间可能已由其他线程分析完成
+        if entry:
+            return entry
+        entry = _build_entry(path)
+        with _lock:
+            index = _load_index()
+            stale = index.get(key)
+            if stale:
+                (BGM_CACHE_DIR / stale["pcm"]).unlink(missing_ok=True)
+            index[key] = entry
+            _save_index(index)
+        return entry
+
+
+def scan_library() -> list[dict]:
+    """扫描 BGM_DIR，更新索引并清理已删除曲目的缓存，返回曲目列表"""
+    tracks = sorted(p for p in BGM_DIR.iterdir() if p.is_file() and p.suffix.lower() in AUDIO_EXTENSIONS)
+    entries = []
+    for path in tracks:
+        try:
+            entries.append(get_entry(path))
+        except Exception as e:
+            print(f"警告：BGM 分析失败 {path.name}: {e}")
+
+    with _lock:
+        index = _load_index()
+        alive = {str(p.resolve()) for p in tracks}
+        stale = [key for key in index if key.startswith(str(BGM_DIR.resolve())) and key not in alive]
+        for key in stale:
+            (BGM_CACHE_DIR / index.pop(key)["pcm"]).unlink(missing_ok=True)
+        if stale:
+            _save_index(index)
+    return [{k: v for k, v in e.items() if k not in ("signature", "pcm")} for e in entries]
+
+
+def load_pcm(path: str | Path) -> np.ndarray:
+    """以内存映射方式读取曲目的 PCM 缓存，形状 (samples, 2)，只读"""
+    pcm_path = BGM_CACHE_DIR / get_entry(path)["pcm"]
+    if pcm_path.stat().st_size == 0:
+        # 静音 / 截断的曲目解码结果为空文件，np.memmap 无法映射空文件
+        return np.zeros((0, CHANNELS), dtype=np.float32)
+    return np.memmap(pcm_path, dtype=np.float32, mode="r").reshape(-1, CHANNELS)
+
+
+def fit_length(pcm: np.ndarray, length: int, crossfade: float = LOOP_CROSSFADE) -> np.ndarray:
+    """循环或裁剪到指定采样数；循环时在接缝处等功率交叉淡化
+
+    裁剪时直接返回 pcm 的切片（内存映射时为只读视图，不整体读入内存）
+    """
+    if len(pcm) == 0:
+        return np.zeros((length, CHANNELS), dtype=np.float32)
+    if len(pcm) >= length:
+        return pcm[:length]
+
+    xf = min(round(crossfade * SAMPLE_RATE), len(pcm) // 2)
+    out = np.zeros((length, CHANNELS), dtype=np.float32)
+    fade_in = np.sin(np.linspace(0.0, np.pi / 2, xf, dtype=np.float32))[:, None]
+    fade_out = fade_in[::-1]
+    step = len(pcm) - xf
+    for start in range(0, length, step):
+        chunk = np.array(pcm[: length - start], dtype=np.float32)
+        if start > 0:
+            chunk[:xf] *= fade_in[: len(chunk)]
+        if start + len(pcm) < length:
+            chunk[len(chunk) - xf:] *= fade_out
+        out[start:start + len(chunk)] += chunk
+    return out
+
+
+def load_bgm(path: str | Path, length: int) -> np.ndarray:
+    """读取 BGM 并循环 / 裁剪到指定采样数"""
+    return fit_length(load_pcm(path), length)
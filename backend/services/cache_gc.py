@@ -0,0 +1,60 @@
+"""磁盘缓存淘汰 - 按最近访问时间（LRU）把各缓存目录控制在容量上限内
+
+分镜片段、字幕叠加图、归一化配图与成片时间线都按内容寻址，命中时调用 touch()
+刷新访问时间（保留修改时间，不受 noatime / relatime 挂载选项影响）。
+每次合成结束后执行一次 prune_caches()；最近 CACHE_EVICT_GRACE 秒内访问过的文件
+（可能正被其他任务使用）即使超出上限也不会删除。
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    CACHE_EVICT_GRACE, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB, SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_MB,
+    SUBTITLE_CACHE_DIR, SUBTITLE_CACHE_MAX_MB, TIMELINE_CACHE_MAX_MB, TIMELINE_DIR,
+)
+
+_lock = threading.Lock()
+
+
+def touch(path: str | Path) -> None:
+    """刷新访问时间（LRU 依据），保留修改时间"""
+    try:
+        os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+    except OSError:
+        pass
+
+
+def evict_lru(directory: Path, max_bytes: int, grace: float = CACHE_EVICT_GRACE) -> int:
+    """按最近访问时间删除目录下的文件，直到总大小不超过上限，返回删除的文件数"""
+    entries = []
+    for path in directory.iterdir():
+        try:
+            stat = path.stat()
+        except OSError:
+            continue  # 并发淘汰时文件可能已被删除
+        if path.is_file():
+            entries.append((path, stat))
+    total = sum(st.st_size for _, st in entries)
+    removed = 0
+    cutoff = time.time_ns() - int(grace * 1e9)
+    for path, st in sorted(entries, key=lambda e: e[1].st_atime_ns):
+        if total <= max_bytes or st.st_atime_ns > cutoff:
+            break
+        path.unlink(missing_ok=True)
+        total -= st.st_size
+        removed += 1
+    return removed
+
+
+def prune_caches() -> dict:
+    """淘汰全部合成缓存，返回 {目录名: 删除的文件数}"""
+    limits = {
+        SEGMENT_CACHE_DIR: SEGMENT_CACHE_MAX_MB,
+        SUBTITLE_CACHE_DIR: SUBTITLE_CACHE_MAX_MB,
+        IMAGE_CACHE_DIR: IMAGE_CACHE_MAX_MB,
+        TIMELINE_DIR: TIMELINE_CACHE_MAX_MB,
+    }
+    with _lock:
+        return {d.name: evict_lru(d, mb * 1024 * 1024) for d, mb in limits.items()}
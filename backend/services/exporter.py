@@ -0,0 +1,226 @@
+"""多规格导出 - 成片只解码一次，通过 split 分发到所有派生输出
+
+同一条时间线常需发布为多种规格（抖音 9:16、B 站 16:9）并附带封面与动图预告。
+这里不再多次完整合成，而是对合成好的成片做一次解码，在滤镜图中 split 为多路：
+- video：其他分辨率（同宽高比直接缩放；crop 居中裁剪，pad 等比缩放后补边），音轨直接拷贝。
+  宽高比不同且未指定 crop / pad 时（如 9:16 成片的 16:9 版本）裁剪会切掉字幕、放大发虚，
+  这类输出由 video_service 按目标分辨率从时间线重新合成（fit=render），不经过这里
+- poster：指定时间点的封面 JPEG
+- teaser：开头若干秒的 WebP / GIF 动图
+- thumbnails：每隔 N 秒一帧拼成的 JPEG 雪碧图 + WebVTT 索引（进度条拖动预览 / 项目列表缩略图）
+"""
+import math
+import re
+from pathlib import Path
+
+from services.ffmpeg_engine import MP4_MUX_ARGS, run_ffmpeg
+
+OUTPUT_KINDS = ("video", "poster", "teaser", "thumbnails")
+TEASER_FORMATS = ("webp", "gif")
+# video 的适配方式；为空时同宽高比直接缩放，宽高比不同则按 render 处理
+FIT_MODES = ("render", "crop", "pad")
+ASPECT_TOLERANCE = 0.01   # 宽高比相对误差在此范围内视为相同（分辨率取偶数造成的偏差）
+
+THUMBNAIL_INTERVAL = 2.0  # 雪碧图取帧间隔（秒）
+THUMBNAIL_WIDTH = 160     # 单个缩略图宽度（高度按成片比例）
+THUMBNAIL_COLUMNS = 10    # 每张雪碧图的列数
+THUMBNAIL_MAX_ROWS = 10   # 每张雪碧图的最大行数，超出时拆分为多张
+
+
+def _video_chain(spec: dict) -> str:
+    width, height = map(int, spec["resolution"].split("x"))
+    if spec.get("fit", "crop") == "pad":
+        return (
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1"
+        )
+    return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1"
+
+
+def _same_aspect(a: tuple[int, int], b: tuple[int, int]) -> bool:
+    return abs(a[0] * b[1] / (a[1] * b[0]) - 1) <= ASPECT_TOLERANCE
+
+
+def needs_render(spec: dict, size: tuple[int, int] | None) -> bool:
+    """该导出项是否需要按自身分辨率从时间线重新合成（而非由成片缩放 / 裁剪得到），size 为成片宽高"""
+    if spec["kind"] != "video":
+        return False
+    fit = spec.get("fit") or ""
+    if fit or not size:
+        return fit == "render"
+    width, height = map(int, spec["resolution"].split("x"))
+    return not _same_aspect((width, height), size)
+
+
+def _check_crop(spec: dict, size: tuple[int, int], style: dict) -> None:
+    """居中裁剪不得切到字幕区：左右裁掉的宽度不超过 side_margin，
+    底部裁掉的高度至少留出一行字幕（字幕顶部位于 height - bottom_offset）"""
+    width, height = map(int, spec["resolution"].split("x"))
+    scale = max(width / size[0], height / size[1])
+    cut_x = (size[0] - width / scale) / 2
+    cut_y = (size[1] - height / scale) / 2
+    if cut_x > style["side_margin"] or cut_y > style["bottom_offset"] - style["fontsize"] * 1.25:
+        raise ValueError(
+            f"{spec['resolution']} 居中裁剪会切掉字幕，请改用 fit=render（按该分辨率重新合成）或 fit=pad"
+        )
+
+
+def check_outputs(
+    outputs: list[dict], size: tuple[int, int] | None = None, subtitle_style: dict | None = None,
+) -> None:
+    """校验导出项（不合法时抛出 ValueError），参数同 export_outputs
+
+    subtitle_style 为成片烧录的字幕样式（无字幕时为空），用于拒绝会切掉字幕的 crop
+    """
+    for spec in outputs:
+        if spec["kind"] not in OUTPUT_KINDS:
+            raise ValueError(f"不支持的导出类型: {spec['kind']}")
+        if spec["kind"] == "video":
+            if not re.fullmatch(r"[1-9]\d*x[1-9]\d*", spec.get("resolution", "")):
+                raise ValueError(f"导出分辨率格式应为 宽x高: {spec.get('resolution', '')}")
+            if (spec.get("fit") or "") not in ("", *FIT_MODES):
+                raise ValueError(f"不支持的适配方式: {spec['fit']}")
+            if spec.get("fit") == "crop" and size and subtitle_style:
+                _check_crop(spec, size, subtitle_style)
+        if spec["kind"] == "teaser" and spec.get("format", "webp") not in TEASER_FORMATS:
+            raise ValueError(f"不支持的预告格式: {spec['format']}")
+        if spec["kind"] == "thumbnails":
+            if not size:
+                raise ValueError("生成缩略图需要成片尺寸")
+            if spec.get("interval", THUMBNAIL_INTERVAL) <= 0:
+                raise ValueError("缩略图间隔必须大于 0")
+
+
+def _output_path(master: Path, spec: dict) -> Path:
+    kind = spec["kind"]
+    if kind == "video":
+        return master.with_name(f"{master.stem}_{spec['resolution']}_{spec.get('fit') or 'scale'}.mp4")
+    if kind == "poster":
+        # 成片附属封面与按需导出的封面（可指定取帧时间）分开命名，同一次导出中互不覆盖
+        return master.with_name(f"{master.stem}_{'cover' if spec.get('side') else 'poster'}.jpg")
+    if kind == "thumbnails":
+        return master.with_name(f"{master.stem}_thumbnails.vtt")
+    return master.with_name(f"{master.stem}_teaser.{spec.get('format', 'webp')}")
+
+
+def _vtt_time(seconds: float) -> str:
+    ms = max(0, round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def _thumbnail_layout(spec: dict, duration: float, size: tuple[int, int]) -> dict:
+    """计算雪碧图布局：缩略图尺寸、数量、每张雪碧图的行列数"""
+    interval = spec.get("interval", THUMBNAIL_INTERVAL)
+    if interval <= 0:
+        raise ValueError("缩略图间隔必须大于 0")
+    width = spec.get("width", THUMBNAIL_WIDTH)
+    height = max(2, round(width * size[1] / size[0] / 2) * 2)
+    count = max(1, math.ceil(duration / interval))
+    columns = min(spec.get("columns", THUMBNAIL_COLUMNS), count)
+    rows = min(THUMBNAIL_MAX_ROWS, math.ceil(count / columns))
+    return {
+        "interval": interval, "width": width, "height": height, "count": count,
+        "columns": columns, "rows": rows, "sheets": math.ceil(count / (columns * rows)),
+    }
+
+
+def _write_thumbnail_vtt(path: Path, sprite_pattern: str, layout: dict, duration: float) -> list[Path]:
+    """写 WebVTT 缩略图索引（每条 cue 指向雪碧图中的一块 #xywh），返回雪碧图路径列表"""
+    per_sheet = layout["columns"] * layout["rows"]
+    w, h = layout["width"], layout["height"]
+    lines = ["WEBVTT", ""]
+    for i in range(layout["count"]):
+        start = i * layout["interval"]
+        end = min(duration, start + layout["interval"])
+        sheet, cell = divmod(i, per_sheet)
+        row, col = divmod(cell, layout["columns"])
+        lines += [
+            f"{_vtt_time(start)} --> {_vtt_time(end)}",
+            f"{sprite_pattern % (sheet + 1)}#xywh={col * w},{row * h},{w},{h}",
+            "",
+        ]
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return [path.with_name(sprite_pattern % (k + 1)) for k in range(layout["sheets"])]
+
+
+def export_outputs(
+    master: Path,
+    duration: float,
+    fps: int,
+    outputs: list[dict],
+    encode_args: list[str] | None = None,
+    size: tuple[int, int] | None = None,
+) -> list[dict]:
+    """从成片一次解码生成全部派生输出，返回 [{"kind", "path", ...}]
+
+    outputs 每项：
+      {"kind": "video", "resolution": "1920x1080", "fit": "" | "crop" | "pad"}（render 项需先由调用方剔除）
+      {"kind": "poster", "time": 秒（默认成片 1/3 处）}
+      {"kind": "teaser", "start": 0, "duration": 3, "fps": 10, "width": 320, "format": "webp" | "gif"}
+      {"kind": "thumbnails", "interval": 2, "width": 160, "columns": 10}（需要 size=成片宽高；
+       path 为 WebVTT 索引，"sprites" 为雪碧图路径列表）
+    """
+    check_outputs(outputs, size)
+    if any(needs_render(spec, size) for spec in outputs):
+        raise ValueError("宽高比不同的视频导出需按目标分辨率重新合成，不能由成片派生")
+    if not outputs:
+        return []
+
+    n = len(outputs)
+    filters = ["[0:v]" + (f"split={n}" if n > 1 else "null") + "".join(f"[s{i}]" for i in range(n))]
+    output_args: list[str] = []
+    results = []
+    used: set[str] = set()
+    for i, spec in enumerate(outputs):
+        path = _output_path(master, spec)
+        if path.name in used:
+            # 同类导出重复请求（如多个取帧时间的封面）时按序号区分文件名
+            path = path.with_name(f"{path.stem}_{i}{path.suffix}")
+        used.add(path.name)
+        kind = spec["kind"]
+        if kind == "video":
+            filters.append(f"[s{i}]{_video_chain(spec)}[o{i}]")
+            output_args += [
+                "-map", f"[o{i}]", "-map", "0:a?",
+                "-c:v", "libx264", "-pix_fmt", "yuv420p", *(encode_args or []),
+                "-c:a", "copy", *MP4_MUX_ARGS, str(path),
+            ]
+        elif kind == "poster":
+            at = min(max(0.0, spec.get("time", duration / 3)), max(0.0, duration - 1 / fps))
+            filters.append(f"[s{i}]trim=start={at:.3f},setpts=PTS-STARTPTS[o{i}]")
+            output_args += ["-map", f"[o{i}]", "-frames:v", "1", "-q:v", "2", str(path)]
+        elif kind == "thumbnails":
+            layout = _thumbnail_layout(spec, duration, size)
+            sprite_pattern = f"{path.stem}_%03d.jpg"
+            # 末尾补一个间隔的静帧，保证最后一格也有画面
+            filters.append(
+                f"[s{i}]tpad=stop_mode=clone:stop_duration={layout['interval']:.3f},"
+                f"fps=1/{layout['interval']:.3f},scale={layout['width']}:{layout['height']},"
+                f"tile={layout['columns']}x{layout['rows']}[o{i}]"
+            )
+            output_args += [
+                "-map", f"[o{i}]", "-frames:v", str(layout["sheets"]), "-q:v", "4",
+                str(path.with_name(sprite_pattern)),
+            ]
+            sprites = _write_thumbnail_vtt(path, sprite_pattern, layout, duration)
+            results.append({**spec, "path": path, "sprites": sprites, "interval": layout["interval"]})
+            continue
+        else:
+            start = spec.get("start", 0.0)
+            chain = (
+                f"[s{i}]trim=start={start:.3f}:duration={spec.get('duration', 3.0):.3f},setpts=PTS-STARTPTS,"
+                f"fps={spec.get('fps', 10)},scale={spec.get('width', 320)}:-2:flags=lanczos"
+            )
+            if spec.get("format", "webp") == "gif":
+                filters.append(f"{chain},split[g{i}a][g{i}b];[g{i}a]palettegen[p{i}];[g{i}b][p{i}]paletteuse[o{i}]")
+                output_args += ["-map", f"[o{i}]", "-loop", "0", str(path)]
+            else:
+                filters.append(f"{chain}[o{i}]")
+                output_args += ["-map", f"[o{i}]", "-c:v", "libwebp", "-loop", "0", "-q:v", "60", "-an", str(path)]
+        results.append({**spec, "path": path})
+
+    run_ffmpeg(
+        ["-i", str(master), "-filter_complex", ";".join(filters), *output_args],
+        total_frames=round(duration * fps), stage="export",
+    )
+    return results
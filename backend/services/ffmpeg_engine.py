@@ -0,0 +1,452 @@
+"""原生 FFmpeg 合成引擎 - 将分镜列表编译为单次 ffmpeg 调用
+
+整条时间线（循环静帧 → 字幕叠加 / ASS 烧录 → xfade 转场 → 旁白拼接 → amix 混入 BGM）
+全部在 ffmpeg 滤镜图中完成，Python 只负责拼命令，不接触任何视频帧。
+AUDIO_ENGINE=numpy 时音轨由 audio_engine 预先生成（BGM 侧链闪避），编码时直接混流。
+时长与画面布局与 moviepy 路径保持一致，便于两者互相替换。
+"""
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from config import AUDIO_ENGINE, FFMPEG_BIN, FFPROBE_BIN, TEMP_DIR, TIMELINE_DIR
+from services.audio_engine import DUCK_DB, build_audio_track
+from services.audio_probe import audio_duration
+from services.cache_gc import touch
+from services.jobs import check_cancelled, report_progress
+from services.subtitle_service import (
+    SUBTITLE_STYLE, build_ass, merge_style, render_subtitle, subtitles_filter,
+)
+
+# 与 moviepy 路径保持一致的时间线参数
+SCENE_PADDING = 0.5       # 每个分镜在旁白后留出的间隔（秒）
+FADE_DURATION = 0.5       # 交叉淡入淡出时长（秒）
+BGM_FADEOUT = 2.0         # BGM 结尾淡出时长（秒）
+AUDIO_SAMPLE_RATE = 44100
+
+# 转场目录：名称 → xfade 过渡类型。所有转场共用 FADE_DURATION 的重叠区间（时间线与音轨布局不变），
+# cut 在重叠区间中点硬切；none 表示整条时间线不做转场（无重叠，直接拼接）
+TRANSITIONS = {
+    "fade": "fade",
+    "dissolve": "dissolve",
+    "slide": "slideleft",
+    "slideup": "slideup",
+    "wipe": "wipeleft",
+    "zoom": "zoomin",
+    "circle": "circleopen",
+    "cut": None,
+}
+
+# 运动镜头（Ken Burns）：zoompan 从单帧静图生成全部帧，源图先一次性放大 MOTION_SUPERSAMPLE 倍，
+# 使平移 / 缩放的取景坐标精度达到亚像素，避免画面抖动
+MOTIONS = ("none", "zoom_in", "zoom_out", "pan_left", "pan_right", "pan_up", "pan_down")
+MOTION_INTENSITY = 0.15   # 默认缩放幅度（1.15 倍）
+MOTION_SUPERSAMPLE = 2
+
+# 成片 MP4 的封装参数：moov 前置，浏览器无需下载到文件末尾即可开始播放
+MP4_MUX_ARGS = ["-movflags", "+faststart"]
+
+def ffmpeg_available() -> bool:
+    """检查 ffmpeg / ffprobe 是否可用"""
+    return bool(shutil.which(FFMPEG_BIN) and shutil.which(FFPROBE_BIN))
+
+
+def probe_duration(path: str) -> float:
+    """使用 ffprobe 读取媒体时长（只解析容器头，不解码）"""
+    cmd = [
+        FFPROBE_BIN, "-v", "quiet",
+        "-print_format", "json",
+        "-show_format",
+        str(path),
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe 读取失败: {path}")
+    info = json.loads(result.stdout or "{}")
+    return float(info.get("format", {}).get("duration", 0))
+
+
+def run_ffmpeg(
+    args: list[str],
+    timeout: float | None = None,
+    total_frames: int = 0,
+    stage: str = "encode",
+) -> None:
+    """执行 ffmpeg，失败时抛出带 stderr 摘要的异常
+
+    在后台任务中运行时，任务被取消会立即终止 ffmpeg 进程并抛出 JobCancelled。
+    传入 total_frames 时解析 -progress 输出，上报已写帧数 / 编码速度 / 预计剩余时间。
+    """
+    check_cancelled()
+    cmd = [FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error"]
+    if total_frames:
+        cmd += ["-progress", "pipe:1", "-nostats"]
+    cmd += args
+
+    # stderr 写入临时文件，避免与 stdout 进度读取互相阻塞
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE if total_frames else subprocess.DEVNULL,
+            stderr=stderr_file, text=bool(total_frames),
+        )
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            if total_frames:
+                _watch_progress(process, total_frames, stage, deadline)
+            while True:
+                try:
+                    process.wait(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    _check_abort(deadline, cmd, timeout)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            tail = stderr_file.read().decode("utf-8", errors="ignore").strip()[-800:]
+            raise RuntimeError(f"ffmpeg 执行失败 (code {process.returncode}): {tail}")
+
+
+def _check_abort(deadline: float | None, cmd: list[str], timeout: float | None) -> None:
+    """任务取消或超时时抛出异常（调用方负责终止进程）"""
+    check_cancelled()
+    if deadline and time.monotonic() > deadline:
+        raise subprocess.TimeoutExpired(cmd, timeout)
+
+
+def _watch_progress(process: subprocess.Popen, total_frames: int, stage: str, deadline: float | None) -> None:
+    """逐行解析 ffmpeg -progress 输出并上报进度"""
+    started = time.monotonic()
+    fields: dict[str, str] = {}
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        fields[key] = value
+        if key != "progress":
+            continue
+        _check_abort(deadline, process.args, None)
+        frames = int(fields.get("frame", "0") or 0)
+        elapsed = time.monotonic() - started
+        speed = frames / elapsed if elapsed > 0 else 0.0
+        report_progress(
+            stage,
+            frames=frames,
+            total_frames=total_frames,
+            fps=round(speed, 1),
+            eta=round((total_frames - frames) / speed, 1) if speed > 0 else None,
+        )
+
+
+def check_transition(name: str, allow_none: bool = True) -> None:
+    if name not in TRANSITIONS and not (allow_none and name == "none"):
+        raise ValueError(f"不支持的转场: {name}")
+
+
+def scene_transitions(scenes: list[dict], transition: str) -> list[str | None]:
+    """每个分镜边界的 xfade 类型（第 i 项为 scenes[i] 与 scenes[i + 1] 之间）
+
+    分镜的 transition 字段表示进入该分镜时的转场，为空时使用全局 transition；
+    全局为 none 时忽略分镜设置（整条时间线无转场）
+    """
+    if transition == "none":
+        return [None] * max(0, len(scenes) - 1)
+    kinds = []
+    for scene in scenes[1:]:
+        name = scene.get("transition") or transition
+        check_transition(name, allow_none=False)
+        kinds.append(TRANSITIONS[name])
+    return kinds
+
+
+def transition_overlap(n: int, transition: str) -> float:
+    """相邻分镜的重叠时长（单个分镜或全局无转场时为 0）"""
+    return FADE_DURATION if transition != "none" and n > 1 else 0.0
+
+
+def transition_filter(a: str, b: str, kind: str | None, duration: float, offset: float, fps: int, out: str) -> str:
+    """两路画面之间的转场：xfade 过渡，或在重叠区间中点硬切（kind 为 None，trim + concat，不逐像素计算）
+
+    offset 为重叠区间在 a 上的起点
+    """
+    if kind:
+        return f"[{a}][{b}]xfade=transition={kind}:duration={duration:.3f}:offset={offset:.3f}[{out}]"
+    half = round(duration * fps / 2) / fps
+    return (
+        f"[{a}]trim=end={offset + half:.3f},setpts=PTS-STARTPTS[{out}_a];"
+        f"[{b}]trim=start={half:.3f},setpts=PTS-STARTPTS[{out}_b];"
+        f"[{out}_a][{out}_b]concat=n=2:v=1:a=0[{out}]"
+    )
+
+
+def scene_offsets(durations: list[float], fade: float) -> list[float]:
+    """计算每个分镜在时间线上的起点（转场重叠 fade 秒）"""
+    offsets, t = [], 0.0
+    for d in durations:
+        offsets.append(t)
+        t += d - fade
+    return offsets
+
+
+def motion_spec(scene: dict) -> dict | None:
+    """分镜的运动镜头参数 {"type", "intensity"}，静止画面返回 None"""
+    motion = scene.get("motion") or {}
+    kind = motion.get("type") or "none"
+    if kind not in MOTIONS:
+        raise ValueError(f"不支持的运动镜头: {kind}")
+    intensity = MOTION_INTENSITY if motion.get("intensity") is None else motion["intensity"]
+    if not 0 <= intensity <= 1:
+        raise ValueError("运动镜头幅度需在 0 到 1 之间")
+    if kind == "none" or intensity == 0:
+        return None  # 幅度为 0 等同静止画面（片段缓存键也与静止画面一致）
+    return {"type": kind, "intensity": intensity}
+
+
+def still_input(image_path: str, fps: int, duration: float = 0, motion: dict | None = None) -> list[str]:
+    """静帧输入参数：运动镜头只读一帧（由 zoompan 生成全部帧），否则循环输入"""
+    if motion:
+        return ["-i", image_path]
+    return ["-loop", "1", "-framerate", str(fps), *(["-t", f"{duration:.3f}"] if duration else []), "-i", image_path]
+
+
+def motion_filter(motion: dict, width: int, height: int, fps: int, start: int, frames: int, total: int) -> str:
+    """运动镜头滤镜：输出分镜时间线上第 start 帧起的 frames 帧（分镜共 total 帧）
+
+    进度按分镜自身的帧序号计算，主体片段与两侧转场片段分开渲染时画面运动依然连续
+    """
+    p = f"min(1,(on+{start})/{max(1, total - 1)})"
+    kind, intensity = motion["type"], motion["intensity"]
+    if kind == "zoom_in":
+        zoom = f"1+{intensity}*{p}"
+    elif kind == "zoom_out":
+        zoom = f"1+{intensity}*(1-{p})"
+    else:
+        zoom = f"{1 + intensity}"
+    x = {
+        "pan_left": f"(iw-iw/zoom)*(1-{p})",
+        "pan_right": f"(iw-iw/zoom)*{p}",
+    }.get(kind, "(iw-iw/zoom)/2")
+    y = {
+        "pan_up": f"(ih-ih/zoom)*(1-{p})",
+        "pan_down": f"(ih-ih/zoom)*{p}",
+    }.get(kind, "(ih-ih/zoom)/2")
+    return (
+        f"scale={width * MOTION_SUPERSAMPLE}:{height * MOTION_SUPERSAMPLE}:flags=lanczos,setsar=1,"
+        f"zoompan=z='{zoom}':x='{x}':y='{y}':d={max(1, frames)}:s={width}x{height}:fps={fps}"
+    )
+
+
+def still_filter(
+    image_in: str, sub_in: str | None, width: int, height: int, fps: int, out: str,
+    bottom_offset: int = SUBTITLE_STYLE["bottom_offset"],
+    motion: dict | None = None, start: int = 0, frames: int = 0, total: int = 0,
+) -> str:
+    """单个分镜画面：缩放到目标分辨率（或运动镜头），可选叠加字幕（字幕不随镜头运动）
+
+    motion 不为空时输入须为单帧（见 still_input），start / frames / total 含义见 motion_filter
+    """
+    if motion:
+        chain = f"[{image_in}]{motion_filter(motion, width, height, fps, start, frames, total or frames)}"
+    else:
+        chain = f"[{image_in}]scale={width}:{height},setsar=1"
+    if sub_in:
+        chain = f"{chain}[{out}_bg];[{out}_bg][{sub_in}]overlay=x=(W-w)/2:y=H-{bottom_offset}"
+    return f"{chain},fps={fps},format=yuv420p,settb=AVTB[{out}]"
+
+
+def subtitle_track(
+    scenes: list[dict], durations: list[float], fade: float, width: int, height: int, style: dict | None = None,
+) -> Path:
+    """按实际分镜时长生成整条时间线的 ASS 字幕（与画面共用同一份时长，不会漂移）"""
+    offsets = scene_offsets(durations, fade)
+    entries = [
+        (start, start + d, scene.get("narration", ""))
+        for scene, start, d in zip(scenes, offsets, durations)
+    ]
+    return build_ass(entries, width, height, style, fade)
+
+
+def narration_filters(audio_ins: list[str], lengths: list[float], out: str = "narr") -> list[str]:
+    """旁白：每段补静音 / 截断到指定长度后顺序拼接"""
+    filters = []
+    for i, (audio_in, length) in enumerate(zip(audio_ins, lengths)):
+        filters.append(
+            f"[{audio_in}]aresample={AUDIO_SAMPLE_RATE},aformat=channel_layouts=stereo,"
+            f"apad,atrim=0:{length:.3f},asetpts=PTS-STARTPTS[a{i}]"
+        )
+    filters.append("".join(f"[a{i}]" for i in range(len(lengths))) + f"concat=n={len(lengths)}:v=0:a=1[{out}]")
+    return filters
+
+
+def bgm_filters(bgm_in: str, bgm_len: float, bgm_volume: float, voice: str = "narr", out: str = "aout") -> list[str]:
+    """BGM：裁剪 + 音量 + 结尾淡出，再与旁白 amix"""
+    return [
+        f"[{bgm_in}]aresample={AUDIO_SAMPLE_RATE},aformat=channel_layouts=stereo,"
+        f"atrim=0:{bgm_len:.3f},volume={bgm_volume},"
+        f"afade=t=out:st={max(0.0, bgm_len - BGM_FADEOUT):.3f}:d={BGM_FADEOUT}[bgm]",
+        f"[{voice}][bgm]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[{out}]",
+    ]
+
+
+def audio_lengths(durations: list[float], fade: float) -> list[float]:
+    """每段旁白在时间线上占用的长度（转场重叠部分归下一个分镜）"""
+    n = len(durations)
+    return [d - fade if i < n - 1 else d for i, d in enumerate(durations)]
+
+
+def audio_track_inputs(
+    scenes: list[dict], durations: list[float], fade: float, total: float,
+    bgm_path: str, bgm_volume: float, first_input: int, duck_db: float = DUCK_DB,
+) -> tuple[list[str], list[str], str, Path | None]:
+    """构造音轨部分的输入与滤镜
+
+    AUDIO_ENGINE=numpy 时预先生成整条 WAV 音轨（调用方负责删除返回的临时文件），
+    否则在滤镜图中拼接旁白并 amix 混入 BGM（不支持闪避，忽略 duck_db）。
+    返回 (输入参数, 滤镜列表, 音频输出映射, 临时音轨路径)
+    """
+    if AUDIO_ENGINE == "numpy":
+        check_cancelled()
+        track = TEMP_DIR / f"audio_{uuid.uuid4().hex[:8]}.wav"
+        build_audio_track(
+            [s["audio_path"] for s in scenes], durations, fade, track, bgm_path, bgm_volume, duck_db,
+        )
+        report_progress("audio_mixed", duration=round(total, 3))
+        return ["-i", str(track)], [], f"{first_input}:a", track
+
+    n = len(scenes)
+    inputs = [arg for s in scenes for arg in ("-i", s["audio_path"])]
+    filters = narration_filters([f"{first_input + i}:a" for i in range(n)], audio_lengths(durations, fade))
+    audio_out = "[narr]"
+    if bgm_path:
+        # BGM 比成片短时无限循环，由 atrim 裁剪到成片时长
+        inputs += ["-stream_loop", "-1", "-i", bgm_path]
+        filters += bgm_filters(f"{first_input + n}:a", total, bgm_volume)
+        audio_out = "[aout]"
+    return inputs, filters, audio_out, None
+
+
+def save_timeline(
+    output_path: Path, scenes: list[dict], durations: list[float], fade: float, total: float,
+    bgm_path: str = "", bgm_volume: float = 0.15, audio_args: list[str] | None = None,
+) -> Path:
+    """记录成片的音轨时间线（旁白文件、分镜时长、转场重叠），供重新混音时只重建音轨"""
+    path = TIMELINE_DIR / f"{output_path.stem}.json"
+    path.write_text(json.dumps({
+        "audio_paths": [s["audio_path"] for s in scenes],
+        "durations": durations,
+        "fade": fade,
+        "total": total,
+        "bgm_path": bgm_path,
+        "bgm_volume": bgm_volume,
+        "audio_args": list(audio_args or []),
+    }, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def load_timeline(video_path: Path) -> dict | None:
+    path = TIMELINE_DIR / f"{video_path.stem}.json"
+    if not path.exists():
+        return None
+    touch(path)
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def compose_ffmpeg(
+    scenes: list[dict],
+    output_path: Path,
+    bgm_path: str = "",
+    bgm_volume: float = 0.15,
+    width: int = 1080,
+    height: int = 1920,
+    fps: int = 30,
+    transition: str = "fade",
+    subtitle_mode: str = "overlay",
+    subtitle_style: dict | None = None,
+    encode_args: list[str] | None = None,
+    audio_args: list[str] | None = None,
+) -> float:
+    """用单次 ffmpeg 调用合成视频，返回成片时长
+
+    scenes 中每项需包含 image_path / audio_path / narration（已解析为本地路径）
+    subtitle_mode: overlay 逐分镜叠加字幕图 / ass 整条时间线 libass 烧录 / none 不加字幕
+    encode_args: 额外的 x264 参数（-preset / -crf / -tune / -g），由编码档位与渲染质量决定
+    audio_args: 额外的 AAC 参数（-b:a）
+    """
+    style = merge_style(subtitle_style)
+    durations = [audio_duration(s["audio_path"]) + SCENE_PADDING for s in scenes]
+    n = len(scenes)
+    fade = transition_overlap(n, transition)
+    kinds = scene_transitions(scenes, transition)
+    total = sum(durations) - fade * (n - 1)
+
+    inputs: list[str] = []
+    filters: list[str] = []
+
+    # 输入：静帧循环（运动镜头为单帧）
+    motions = [motion_spec(scene) for scene in scenes]
+    for scene, duration, motion in zip(scenes, durations, motions):
+        inputs += still_input(scene["image_path"], fps, duration, motion)
+    next_input = n
+
+    # ── 画面：缩放 + 字幕叠加 ──
+    for i, scene in enumerate(scenes):
+        sub_in = None
+        narration = scene.get("narration", "")
+        if narration and subtitle_mode == "overlay":
+            inputs += ["-i", str(render_subtitle(narration, width, style))]
+            sub_in = f"{next_input}:v"
+            next_input += 1
+        frames = round(durations[i] * fps)
+        filters.append(still_filter(
+            f"{i}:v", sub_in, width, height, fps, f"v{i}", style["bottom_offset"],
+            motions[i], 0, frames, frames,
+        ))
+
+    # ── 转场：xfade 链 / 直接拼接 ──
+    if fade:
+        offsets = scene_offsets(durations, fade)
+        prev = "v0"
+        for i in range(1, n):
+            out = "vtl" if i == n - 1 else f"x{i}"
+            filters.append(transition_filter(prev, f"v{i}", kinds[i - 1], fade, offsets[i], fps, out))
+            prev = out
+    else:
+        filters.append("".join(f"[v{i}]" for i in range(n)) + f"concat=n={n}:v=1:a=0[vtl]")
+
+    # ── 字幕：ASS 模式在成片时间线上一次烧录 ──
+    if subtitle_mode == "ass":
+        track = subtitle_track(scenes, durations, fade, width, height, style)
+        filters.append(f"[vtl]{subtitles_filter(track)}[vout]")
+    else:
+        filters.append("[vtl]null[vout]")
+
+    # ── 旁白 + BGM ──
+    audio_inputs, audio_filters, audio_out, track = audio_track_inputs(
+        scenes, durations, fade, total, bgm_path, bgm_volume, next_input,
+    )
+    inputs += audio_inputs
+    filters += audio_filters
+
+    try:
+        run_ffmpeg([
+            *inputs,
+            "-filter_complex", ";".join(filters),
+            "-map", "[vout]", "-map", audio_out,
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", *(encode_args or []), "-r", str(fps),
+            "-c:a", "aac", *(audio_args or []),
+            *MP4_MUX_ARGS,
+            "-t", f"{total:.3f}",
+            str(output_path),
+        ], total_frames=round(total * fps))
+    finally:
+        if track:
+            track.unlink(missing_ok=True)
+
+    save_timeline(output_path, scenes, durations, fade, total, bgm_path, bgm_volume, audio_args)
+    return total
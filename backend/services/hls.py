@@ -0,0 +1,78 @@
+"""HLS 打包 - 成片转为 fMP4 分片的多码率阶梯
+
+成片解码一次，split 为多个分辨率并行编码，所有档位按 HLS_SEGMENT_SECONDS
+强制对齐关键帧，便于播放器按带宽切换。输出到 output/hls/<视频名>/master.m3u8。
+"""
+import shutil
+from pathlib import Path
+
+from config import OUTPUT_DIR
+from services.ffmpeg_engine import run_ffmpeg
+
+HLS_SEGMENT_SECONDS = 4
+# 码率阶梯：短边像素 → 最大码率（静帧内容实际码率远低于上限）
+HLS_LADDER = [
+    (1080, "5000k"),
+    (720, "2800k"),
+    (480, "1400k"),
+]
+HLS_AUDIO_BITRATE = "128k"
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2)) * 2)
+
+
+def ladder_for(width: int, height: int) -> list[tuple[int, int, str]]:
+    """按成片尺寸选取不超过原分辨率的档位，返回 [(宽, 高, 最大码率)]"""
+    short = min(width, height)
+    rungs = [(s, rate) for s, rate in HLS_LADDER if s <= short] or [(short, HLS_LADDER[-1][1])]
+    return [(_even(width * s / short), _even(height * s / short), rate) for s, rate in rungs]
+
+
+def package_hls(
+    master: Path,
+    width: int,
+    height: int,
+    fps: int,
+    duration: float,
+    encode_args: list[str] | None = None,
+) -> Path:
+    """生成 HLS 多码率阶梯，返回主播放列表路径"""
+    out_dir = OUTPUT_DIR / "hls" / master.stem
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+
+    rungs = ladder_for(width, height)
+    n = len(rungs)
+    filters = ["[0:v]" + (f"split={n}" if n > 1 else "null") + "".join(f"[s{i}]" for i in range(n))]
+    args: list[str] = []
+    for i, (w, h, rate) in enumerate(rungs):
+        filters.append(f"[s{i}]scale={w}:{h},setsar=1[v{i}]")
+        args += ["-map", f"[v{i}]"]
+    for _ in rungs:
+        args += ["-map", "0:a"]
+    for i, (_, _, rate) in enumerate(rungs):
+        args += [f"-maxrate:v:{i}", rate, f"-bufsize:v:{i}", f"{2 * int(rate[:-1])}k"]
+
+    gop = HLS_SEGMENT_SECONDS * fps
+    run_ffmpeg([
+        "-i", str(master),
+        "-filter_complex", ";".join(filters),
+        *args,
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", *(encode_args or []),
+        # 固定 GOP 并禁用场景切换插帧，保证各档位分片边界一致
+        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+        "-c:a", "aac", "-b:a", HLS_AUDIO_BITRATE,
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", str(out_dir / "v%v" / "seg_%05d.m4s"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", " ".join(f"v:{i},a:{i}" for i in range(n)),
+        str(out_dir / "v%v" / "index.m3u8"),
+    ], total_frames=round(duration * fps), stage="hls")
+    return out_dir / "master.m3u8"
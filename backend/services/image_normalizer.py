@@ -0,0 +1,132 @@
+"""配图归一化 - 入库时按目标分辨率智能裁剪并缩放
+
+供应商返回的尺寸与视频分辨率往往不一致（如 DALL·E 的 1024x1792 对应 1080x1920），
+直接拉伸会变形，且每次合成都要重新解码 PNG、重新缩放。这里在配图保存时（进程池中）
+按信息熵选取裁剪窗口，缩放到各目标分辨率后存为 JPEG，按 (源文件哈希, 分辨率) 缓存；
+合成时直接读取对应分辨率的版本。
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from config import IMAGE_CACHE_DIR, IMAGE_NORMALIZE_WORKERS, IMAGE_TARGET_RESOLUTIONS
+from services.cache_gc import touch
+
+# 裁剪 / 编码参数变化时递增，使旧缓存失效
+NORMALIZE_VERSION = 1
+JPEG_QUALITY = 92
+# 智能裁剪时在缩略图上评估的候选窗口数
+CROP_CANDIDATES = 9
+_ANALYSIS_SIZE = 256
+
+_pool: ProcessPoolExecutor | None = None
+
+
+@lru_cache(maxsize=512)
+def _source_digest(path: str, mtime_ns: int, size: int) -> str:
+    """源文件内容哈希（按路径 + 修改时间 + 大小记忆，避免重复读取）"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def variant_path(source: str, width: int, height: int) -> Path:
+    """源图在指定分辨率下的归一化文件路径"""
+    stat = os.stat(source)
+    digest = _source_digest(str(source), stat.st_mtime_ns, stat.st_size)
+    return IMAGE_CACHE_DIR / f"{digest[:24]}_v{NORMALIZE_VERSION}_{width}x{height}.jpg"
+
+
+def _crop_box(image: Image.Image, width: int, height: int) -> tuple[int, int, int, int]:
+    """在源图上选取与目标宽高比一致、信息熵最大的裁剪窗口"""
+    src_w, src_h = image.size
+    target_ratio = width / height
+    if abs(src_w / src_h - target_ratio) < 0.01:
+        return 0, 0, src_w, src_h
+
+    if src_w / src_h > target_ratio:
+        crop_w, crop_h = round(src_h * target_ratio), src_h
+    else:
+        crop_w, crop_h = src_w, round(src_w / target_ratio)
+    slack_x, slack_y = src_w - crop_w, src_h - crop_h
+
+    # 在灰度缩略图上比较候选窗口，原图只裁剪一次
+    scale = _ANALYSIS_SIZE / max(src_w, src_h)
+    thumb = ImageOps.grayscale(image).resize((max(1, round(src_w * scale)), max(1, round(src_h * scale))))
+    best, best_entropy = (slack_x // 2, slack_y // 2), -1.0
+    for i in range(CROP_CANDIDATES):
+        t = i / (CROP_CANDIDATES - 1)
+        x, y = round(slack_x * t), round(slack_y * t)
+        box = (x * scale, y * scale, (x + crop_w) * scale, (y + crop_h) * scale)
+        entropy = thumb.crop(tuple(round(v) for v in box)).entropy()
+        if entropy > best_entropy:
+            best, best_entropy = (x, y), entropy
+    x, y = best
+    return x, y, x + crop_w, y + crop_h
+
+
+def normalize_image(source: str, width: int, height: int) -> str:
+    """生成源图在指定分辨率下的 JPEG 版本（已存在时直接返回），在进程池中执行"""
+    path = variant_path(source, width, height)
+    if path.exists():
+        touch(path)
+        return str(path)
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image = image.crop(_crop_box(image, width, height)).resize((width, height), Image.LANCZOS)
+
+    # 先写临时文件再原子替换，避免并发合成读到半成品
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:6]}.tmp.jpg")
+    try:
+        image.save(tmp_path, "JPEG", quality=JPEG_QUALITY, optimize=False)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return str(path)
+
+
+def resolve_image(source: str, width: int, height: int) -> str:
+    """合成时获取指定分辨率的配图，缺失时同步生成；失败时退回原图"""
+    try:
+        return normalize_image(source, width, height)
+    except Exception as e:
+        print(f"警告：配图归一化失败 {source}: {e}")
+        return source
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_NORMALIZE_WORKERS)
+    return _pool
+
+
+def _parse_resolution(resolution: str) -> tuple[int, int]:
+    width, height = map(int, resolution.split("x"))
+    return width, height
+
+
+async def normalize_on_ingest(source: str, resolutions: list[str] | None = None) -> list[str]:
+    """配图保存后在进程池中生成各目标分辨率的版本，单个失败只记录警告"""
+    loop = asyncio.get_running_loop()
+    sizes = [_parse_resolution(r) for r in (resolutions or IMAGE_TARGET_RESOLUTIONS)]
+    results = await asyncio.gather(
+        *(loop.run_in_executor(_get_pool(), normalize_image, str(source), w, h) for w, h in sizes),
+        return_exceptions=True,
+    )
+    paths = []
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"警告：配图归一化失败 {source}: {result}")
+        else:
+            paths.append(result)
+    return paths
@@ -1,9 +1,13 @@
 """图像生成服务 - 统一封装多个图像生成 API"""
+import asyncio
+import time
 import uuid
 import httpx
 from pathlib import Path
 from openai import AsyncOpenAI
 from config import OUTPUT_DIR
+from services.jobs import check_cancelled, report_progress
+from services.image_normalizer import normalize_on_ingest
 
 
 # ── OpenAI 兼容图像供应商配置 ─────────────────────────
@@ -26,19 +30,68 @@ async def generate_image(
     base_url: str = "",
     model: str = "",
 ) -> dict:
-    """生成图像"""
+    """生成图像，保存后按目标分辨率归一化（裁剪 + 缩放）供合成直接使用"""
     if provider in ("openai", "dall-e"):
-        return await _generate_dalle(prompt, width, height, api_key, base_url, model)
+        result = await _generate_dalle(prompt, width, height, api_key, base_url, model)
     elif provider == "stability":
-        return await _generate_stability(prompt, width, height, api_key)
+        result = await _generate_stability(prompt, width, height, api_key)
     elif provider == "gemini-image":
-        return await _generate_gemini_native(prompt, width, height, api_key, model)
+        result = await _generate_gemini_native(prompt, width, height, api_key, model)
     elif provider in IMAGE_PROVIDER_DEFAULTS:
         # 智谱CogView / SiliconFlow(FLUX) / 豆包 / 通义万相 — 均走 OpenAI 兼容接口
-        return await _generate_openai_compat(prompt, width, height, api_key, base_url, model, provider)
+        result = await _generate_openai_compat(prompt, width, height, api_key, base_url, model, provider)
     else:
         raise ValueError(f"不支持的图像供应商: {provider}")
 
+    await normalize_on_ingest(result["local_path"])
+    return result
+
+
+async def generate_images_batch(
+    items: list[dict],
+    concurrency: int = 1,
+    retries: int = 3,
+    retry_delay: float = 30.0,
+    **options,
+) -> dict:
+    """批量生成配图（后台任务），每张完成后上报进度；单张失败不影响其余
+
+    items: [{"index", "prompt"}]，options 透传给 generate_image
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    total = len(items)
+    started = time.monotonic()
+    completed = 0
+
+    async def _one(item: dict) -> dict:
+        nonlocal completed
+        result, error = None, ""
+        async with semaphore:
+            for attempt in range(retries + 1):
+                check_cancelled()
+                try:
+                    result = await generate_image(prompt=item["prompt"], **options)
+                    break
+                except Exception as e:
+                    error = str(e)
+                    if attempt < retries:
+                        report_progress("image_retry", index=item["index"], attempt=attempt + 1, error=error)
+                        await asyncio.sleep(retry_delay)
+        completed += 1
+        entry = {"index": item["index"], **(result or {}), "error": "" if result else error}
+        elapsed = time.monotonic() - started
+        report_progress(
+            "image_generated" if result else "image_failed",
+            completed=completed,
+            total=total,
+            eta=round(elapsed / completed * (total - completed), 1),
+            **entry,
+        )
+        return entry
+
+    results = await asyncio.gather(*(_one(item) for item in items))
+    return {"images": list(results), "failed": sum(1 for r in results if r["error"])}
+
 
 async def _generate_dalle(
     prompt: str, width: int, height: int,
@@ -0,0 +1,209 @@
+"""后台任务队列 - 长耗时任务异步执行，接口立即返回任务 ID
+
+- 同步任务（视频合成）在有界线程池中运行，并发数受 CPU 核心数限制，不阻塞事件循环
+- 异步任务（批量生图 / 语音）作为 asyncio Task 运行
+- 任务内部通过 check_cancelled() 响应取消；ffmpeg 子进程会被直接终止
+- 任务内部通过 report_progress() 上报结构化进度事件，供 SSE 实时推送
+"""
+import asyncio
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from config import COMPOSE_MAX_JOBS, JOB_TTL, MAX_PENDING_JOBS
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+MAX_EVENTS = 500  # 每个任务保留的最近事件数
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+
+
+class JobQueueFull(Exception):
+    """排队任务过多"""
+
+
+class Job:
+    """单个后台任务的状态"""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.result: dict | None = None
+        self.error = ""
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.events: list[dict] = []
+        self.event_seq = 0
+        self.progress: dict = {}
+        self.updated_at = self.created_at
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "updated_at": self.updated_at,
+            "progress": self.progress,
+            "error": self.error,
+        }
+
+    def emit(self, stage: str, **data) -> dict:
+        """记录一条进度事件（可在任意线程调用）"""
+        with self._lock:
+            self.event_seq += 1
+            self.updated_at = time.time()
+            event = {"seq": self.event_seq, "time": self.updated_at, "stage": stage, **data}
+            self.events.append(event)
+            if len(self.events) > MAX_EVENTS:
+                del self.events[: len(self.events) - MAX_EVENTS]
+            self.progress = event
+        return event
+
+    def events_since(self, seq: int) -> list[dict]:
+        with self._lock:
+            return [e for e in self.events if e["seq"] > seq]
+
+
+_jobs: dict[str, Job] = {}
+_executor = ThreadPoolExecutor(max_workers=COMPOSE_MAX_JOBS, thread_name_prefix="compose")
+_current_job: contextvars.ContextVar[Job | None] = contextvars.ContextVar("current_job", default=None)
+
+
+def current_job() -> Job | None:
+    """当前上下文所属的任务（不在任务中时为 None）"""
+    return _current_job.get()
+
+
+def is_cancelled() -> bool:
+    job = _current_job.get()
+    return bool(job and job.cancelled)
+
+
+def check_cancelled() -> None:
+    """任务被取消时抛出 JobCancelled，供长循环在安全点调用"""
+    if is_cancelled():
+        raise JobCancelled()
+
+
+def report_progress(stage: str, **data) -> None:
+    """上报当前任务的进度事件；不在任务中调用时忽略"""
+    job = _current_job.get()
+    if job is not None:
+        job.emit(stage, **data)
+
+
+def get_job(job_id: str) -> Job | None:
+    return _jobs.get(job_id)
+
+
+def _prune() -> None:
+    """清理过期的已结束任务，并限制排队长度"""
+    now = time.time()
+    for job_id, job in list(_jobs.items()):
+        if job.status in FINISHED_STATES and job.finished_at and now - job.finished_at > JOB_TTL:
+            del _jobs[job_id]
+    pending = sum(1 for job in _jobs.values() if job.status not in FINISHED_STATES)
+    if pending >= MAX_PENDING_JOBS:
+        raise JobQueueFull(f"排队任务过多（{pending}），请稍后再试")
+
+
+def _register(kind: str) -> Job:
+    _prune()
+    job = Job(kind)
+    _jobs[job.id] = job
+    return job
+
+
+def submit(kind: str, func, *args, **kwargs) -> Job:
+    """提交同步任务到合成线程池，立即返回任务"""
+    job = _register(kind)
+    loop = asyncio.get_running_loop()
+    job.future = loop.run_in_executor(_executor, _run_sync, job, func, args, kwargs)
+    return job
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """在合成线程池中运行同步函数并等待结果（与其他合成任务共用 COMPOSE_MAX_JOBS 上限）
+
+    供异步任务中的编码步骤使用；复制当前上下文，进度上报与取消检查仍归属当前任务
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor, partial(context.run, func, *args, **kwargs))
+
+
+def submit_async(kind: str, coro_func, *args, **kwargs) -> Job:
+    """提交异步任务（协程）到事件循环，立即返回任务"""
+    job = _register(kind)
+    job.future = asyncio.create_task(_run_async(job, coro_func, args, kwargs))
+    return job
+
+
+def cancel(job: Job) -> bool:
+    """取消任务；排队中的任务直接取消，运行中的任务在下一个安全点退出"""
+    if job.status in FINISHED_STATES:
+        return False
+    job.cancel_event.set()
+    if job.status == "queued":
+        _finish(job, "cancelled")
+    if isinstance(job.future, asyncio.Task):
+        job.future.cancel()
+    return True
+
+
+def _start(job: Job) -> contextvars.Token:
+    job.status = "running"
+    job.started_at = time.time()
+    job.emit("running")
+    return _current_job.set(job)
+
+
+def _finish(job: Job, status: str, error: str = "") -> None:
+    job.status = status
+    job.error = error
+    job.finished_at = time.time()
+    job.emit(status, **({"error": error} if error else {}))
+
+
+def _run_sync(job: Job, func, args: tuple, kwargs: dict) -> None:
+    if job.cancelled:
+        return
+    token = _start(job)
+    try:
+        job.result = func(*args, **kwargs)
+        _finish(job, "completed")
+    except JobCancelled:
+        _finish(job, "cancelled")
+    except Exception as e:
+        _finish(job, "failed", str(e))
+    finally:
+        _current_job.reset(token)
+
+
+async def _run_async(job: Job, coro_func, args: tuple, kwargs: dict) -> None:
+    token = _start(job)
+    try:
+        job.result = await coro_func(*args, **kwargs)
+        _finish(job, "completed")
+    except (JobCancelled, asyncio.CancelledError):
+        _finish(job, "cancelled")
+    except Exception as e:
+        _finish(job, "failed", str(e))
+    finally:
+        _current_job.reset(token)
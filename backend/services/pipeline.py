@@ -0,0 +1,165 @@
+"""流水线合成 - 分镜就绪即编码，全部到齐后快速拼接
+
+常规流程是严格分阶段的：全部配图 → 全部配音 → 合成，合成必须等最慢的一张图。
+流水线任务先登记分镜总数与渲染参数，之后通过任务 API 逐个提交分镜；
+每个分镜的图片与音频到达后立即编码其主体片段，相邻分镜都到达后编码转场片段，
+最后由 segments 引擎命中全部缓存，只做一次流拷贝拼接 + 音轨混流。
+端到端延迟取决于最慢的单个分镜，而不是各阶段之和。
+"""
+import asyncio
+
+from config import COMPOSE_WORKERS, CPU_COUNT
+from services.ffmpeg_engine import ffmpeg_available
+from services.jobs import Job, report_progress, run_in_pool
+from services.segment_cache import (
+    body_segment, fade_frames, prepare_scene, render_segment, transition_segment,
+)
+from services.video_service import compose_video_sync, missing_assets, prepare_scenes, render_settings
+
+# 等待下一个分镜的最长时间（秒），超时后任务失败
+PIPELINE_IDLE_TIMEOUT = 600
+
+
+class PipelineError(Exception):
+    """分镜提交不合法"""
+
+
+class Pipeline:
+    """一次流水线合成的状态（仅在事件循环线程中访问）"""
+
+    def __init__(self, total: int, compose_options: dict, workers: int = 0):
+        if not ffmpeg_available():
+            raise PipelineError("流水线合成需要 ffmpeg")
+        if total < 1:
+            raise PipelineError("分镜数量必须大于 0")
+        self.total = total
+        self.options = compose_options
+        self.settings = render_settings(**{
+            k: compose_options[k] for k in (
+                "resolution", "fps", "transition", "subtitle_mode", "subtitle_style", "quality", "encoder_profile",
+            ) if k in compose_options
+        })
+        self.fade = fade_frames(total, self.settings["fps"], self.settings["transition"])
+        self.scenes: dict[int, dict] = {}
+        self.prepared: dict[int, dict] = {}
+        self.queue: asyncio.Queue = asyncio.Queue()
+        workers = min(max(1, workers or COMPOSE_WORKERS), CPU_COUNT)
+        self.semaphore = asyncio.Semaphore(workers)
+        self.threads = max(1, CPU_COUNT // workers)  # 与 render_missing 相同，CPU 核心按 worker 数均分给 x264
+        self.transitions: set[int] = set()
+        self.tasks: list[asyncio.Task] = []
+        self.job_id = ""
+
+    def submit(self, scene: dict) -> int:
+        """提交一个分镜，返回已接收数量"""
+        index = scene["index"]
+        if not 0 <= index < self.total:
+            raise PipelineError(f"分镜序号超出范围: {index}")
+        if index in self.scenes:
+            raise PipelineError(f"分镜 {index} 已提交")
+        missing = missing_assets(scene)
+        if missing:
+            raise PipelineError(f"分镜 {index} 素材缺失: {', '.join(missing)}")
+        self.scenes[index] = scene
+        self.queue.put_nowait(index)
+        return len(self.scenes)
+
+    async def _render(self, segment: dict) -> None:
+        settings = self.settings
+        async with self.semaphore:
+            seconds = await run_in_pool(
+                render_segment, segment, settings["width"], settings["height"], settings["fps"], self.threads,
+            )
+        report_progress(
+            "scene_encoded",
+            scene=segment["scene_index"],
+            segment=segment["kind"],
+            encode_seconds=round(seconds, 3),
+            received=len(self.scenes),
+            total=self.total,
+        )
+
+    async def _on_scene(self, index: int) -> None:
+        """单个分镜到达：解析素材 → 编码主体片段 → 编码与已到达邻居之间的转场"""
+        settings = self.settings
+        resolved = await run_in_pool(prepare_scenes, [self.scenes[index]], settings["width"], settings["height"])
+        if not resolved:
+            raise PipelineError(f"分镜 {index} 素材缺失")
+        self.prepared[index] = await run_in_pool(
+            prepare_scene, resolved[0], settings["width"], settings["height"], settings["fps"],
+            settings["subtitle_mode"], settings["subtitle_style"],
+        )
+
+        jobs = []
+        body = body_segment(index, self.total, self.prepared[index], self.fade, settings["encode_args"])
+        if not body["path"].exists():
+            jobs.append(self._render(body))
+        if self.fade:
+            for left in (index - 1, index):
+                right = left + 1
+                if left in self.transitions or left not in self.prepared or right not in self.prepared:
+                    continue
+                self.transitions.add(left)
+                segment = transition_segment(
+                    left, self.prepared[left], self.prepared[right], self.fade,
+                    settings["transition"], settings["encode_args"],
+                )
+                if not segment["path"].exists():
+                    jobs.append(self._render(segment))
+        await asyncio.gather(*jobs)
+
+    async def _next_scene(self) -> int:
+        """等待下一个分镜；等待期间已到达分镜编码失败时立即抛出，不再等待其余分镜"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PIPELINE_IDLE_TIMEOUT
+        getter = asyncio.ensure_future(self.queue.get())
+        running = {task for task in self.tasks if not task.done()}
+        try:
+            while True:
+                done, running = await asyncio.wait(
+                    {getter, *running}, timeout=deadline - loop.time(), return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    raise TimeoutError(f"等待分镜超时（已接收 {len(self.scenes)}/{self.total}）")
+                for task in done - {getter}:
+                    if task.exception():
+                        raise task.exception()
+                if getter in done:
+                    return getter.result()
+                running.discard(getter)
+        finally:
+            getter.cancel()
+
+    async def run(self) -> dict:
+        """等待全部分镜并完成合成（作为异步后台任务运行）"""
+        try:
+            while len(self.tasks) < self.total:
+                index = await self._next_scene()
+                report_progress("scene_received", scene=index, received=len(self.tasks) + 1, total=self.total)
+                self.tasks.append(asyncio.create_task(self._on_scene(index)))
+            done, _ = await asyncio.wait(self.tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception():
+                    raise task.exception()
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            _pipelines.pop(self.job_id, None)
+
+        # 全部片段已在缓存中，segments 引擎只需拼接与混流
+        scenes = [self.scenes[i] for i in range(self.total)]
+        return await run_in_pool(compose_video_sync, scenes=scenes, engine="segments", **self.options)
+
+
+_pipelines: dict[str, Pipeline] = {}
+
+
+def register(job: Job, pipeline: Pipeline) -> None:
+    """登记流水线，使分镜提交接口能按任务 ID 找到它（任务结束时自动移除）"""
+    pipeline.job_id = job.id
+    if job.status not in ("completed", "failed", "cancelled"):
+        _pipelines[job.id] = pipeline
+
+
+def get_pipeline(job_id: str) -> Pipeline | None:
+    return _pipelines.get(job_id)
@@ -0,0 +1,392 @@
+"""分镜片段缓存 - 增量重渲染
+
+每个分镜按内容哈希（图片字节、音频字节、旁白、分辨率、帧率、字幕样式）渲染为
+独立的中间片段，相邻分镜之间的转场单独渲染为短片段。成片通过 ffmpeg concat
+demuxer 流拷贝拼接，音轨单独一次性生成后混流。
+
+修改某一个分镜后再次合成，只会重新编码该分镜本身及其两侧的转场片段。
+ASS 字幕模式下片段不含字幕（修改旁白文本不会使片段失效），字幕在最终混流时
+整体烧录，此时画面需要重新编码一次。
+"""
+import contextvars
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from config import COMPOSE_WORKERS, CPU_COUNT, SEGMENT_CACHE_DIR, TEMP_DIR
+from services.jobs import report_progress
+from services.ffmpeg_engine import (
+    FADE_DURATION, SCENE_PADDING,
+    MP4_MUX_ARGS, audio_track_inputs, motion_spec, run_ffmpeg, save_timeline, scene_transitions,
+    still_filter, still_input, subtitle_track, transition_filter,
+)
+from services.audio_probe import audio_duration
+from services.cache_gc import touch
+from services.subtitle_service import merge_style, render_subtitle, resolve_font_path, subtitles_filter
+
+# 片段编码参数变化时递增，使旧缓存失效
+SEGMENT_FORMAT_VERSION = 1
+
+# 所有片段必须使用完全一致的编码参数，才能流拷贝拼接
+SEGMENT_ENCODE_ARGS = [
+    "-c:v", "libx264", "-pix_fmt", "yuv420p",
+    "-video_track_timescale", "90000",
+    "-an",
+]
+
+
+def _file_digest(path: str) -> str:
+    """计算文件内容的 SHA-1"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _hash(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def scene_key(scene: dict, width: int, height: int, fps: int) -> str:
+    """分镜内容哈希
+
+    片段不含字幕时（ASS / none 模式或无旁白）字幕样式不参与哈希，只改样式不会使片段失效
+    """
+    style = scene.get("subtitle_style") or merge_style()
+    subtitle = (style, resolve_font_path(style["font"])) if scene.get("narration") else None
+    return _hash(
+        SEGMENT_FORMAT_VERSION,
+        _file_digest(scene["image_path"]),
+        _file_digest(scene["audio_path"]),
+        scene.get("narration", ""),
+        f"{width}x{height}",
+        fps,
+        subtitle,
+        motion_spec(scene),
+    )
+
+
+def _segment_scene(scene: dict, subtitle_mode: str, style: dict) -> dict:
+    """片段渲染用的分镜：非 overlay 模式下去掉旁白，使片段与字幕文本无关"""
+    narration = scene.get("narration", "") if subtitle_mode == "overlay" else ""
+    return {**scene, "narration": narration, "subtitle_style": style}
+
+
+def render_body(
+    scene: dict, frames: int, path: Path, width: int, height: int, fps: int, threads: int = 0,
+    encode_args: list[str] | None = None, start: int = 0,
+) -> None:
+    """渲染分镜主体片段（不含与相邻分镜重叠的转场部分）
+
+    start 为主体在分镜时间线上的起始帧（运动镜头据此衔接转场片段）
+    """
+    motion = motion_spec(scene)
+    inputs = still_input(scene["image_path"], fps, motion=motion)
+    style = scene.get("subtitle_style") or merge_style()
+    sub_in = None
+    if scene.get("narration"):
+        inputs += ["-i", str(render_subtitle(scene["narration"], width, style))]
+        sub_in = "1:v"
+    _encode_segment(
+        inputs,
+        still_filter(
+            "0:v", sub_in, width, height, fps, "vout", style["bottom_offset"],
+            motion, start, frames, scene.get("frames", frames),
+        ),
+        frames, path, fps, threads, encode_args,
+    )
+
+
+def render_transition(
+    a: dict, b: dict, frames: int, path: Path, width: int, height: int, fps: int, threads: int = 0,
+    encode_args: list[str] | None = None, kind: str | None = "fade",
+) -> None:
+    """渲染两个相邻分镜之间的转场片段（kind 为 xfade 过渡类型，None 表示中点硬切）"""
+    inputs: list[str] = []
+    filters: list[str] = []
+    next_input = 0
+    # 转场取 a 的最后 frames 帧与 b 的最前 frames 帧
+    for label, scene, start in (("va", a, a.get("frames", frames) - frames), ("vb", b, 0)):
+        motion = motion_spec(scene)
+        inputs += still_input(scene["image_path"], fps, motion=motion)
+        image_in = f"{next_input}:v"
+        next_input += 1
+        style = scene.get("subtitle_style") or merge_style()
+        sub_in = None
+        if scene.get("narration"):
+            inputs += ["-i", str(render_subtitle(scene["narration"], width, style))]
+            sub_in = f"{next_input}:v"
+            next_input += 1
+        filters.append(still_filter(
+            image_in, sub_in, width, height, fps, label, style["bottom_offset"],
+            motion, start, frames, scene.get("frames", frames),
+        ))
+    filters.append(transition_filter("va", "vb", kind, frames / fps, 0.0, fps, "vout"))
+    _encode_segment(inputs, ";".join(filters), frames, path, fps, threads, encode_args)
+
+
+def _encode_segment(
+    inputs: list[str], filter_graph: str, frames: int, path: Path, fps: int, threads: int = 0,
+    encode_args: list[str] | None = None,
+) -> None:
+    """编码片段到临时文件后原子替换，避免并发合成读到半成品
+
+    threads: x264 编码线程数，0 表示由 ffmpeg 自动决定
+    encode_args: 额外的 x264 参数（-preset / -crf），同一次合成的所有片段必须一致
+    """
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:6]}.tmp.mp4")
+    try:
+        run_ffmpeg([
+            *inputs,
+            "-filter_complex", filter_graph,
+            "-map", "[vout]", "-frames:v", str(frames), "-r", str(fps),
+            *SEGMENT_ENCODE_ARGS, *(encode_args or []),
+            "-threads", str(threads),
+            str(tmp_path),
+        ])
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def prepare_scene(
+    scene: dict, width: int, height: int, fps: int,
+    subtitle_mode: str = "overlay", subtitle_style: dict | None = None,
+) -> dict:
+    """片段渲染用的分镜：附带内容哈希（key）与按帧量化的时长（frames）"""
+    prepared = _segment_scene(scene, subtitle_mode, merge_style(subtitle_style))
+    prepared["key"] = scene_key(prepared, width, height, fps)
+    prepared["frames"] = round((audio_duration(scene["audio_path"]) + SCENE_PADDING) * fps)
+    return prepared
+
+
+def fade_frames(n: int, fps: int, transition: str) -> int:
+    """转场帧数（单个分镜或全局无转场时为 0）"""
+    return round(FADE_DURATION * fps) if transition != "none" and n > 1 else 0
+
+
+def body_segment(index: int, n: int, scene: dict, fade: int, encode_args: list[str] | None = None) -> dict:
+    """分镜主体片段（不含与相邻分镜重叠的转场部分）
+
+    timeline_frames 为该分镜在时间线上占用的总帧数（主体 + 两侧转场）
+    """
+    head = fade if index > 0 else 0
+    tail = fade if index < n - 1 else 0
+    # 旁白极短时至少保留 1 帧主体
+    body_frames = max(1, scene["frames"] - head - tail)
+    encode_args = list(encode_args or [])
+    return {
+        "kind": "body",
+        "path": SEGMENT_CACHE_DIR / f"body_{_hash(scene['key'], head, body_frames, encode_args)}.mp4",
+        "frames": body_frames,
+        "start": head,
+        "timeline_frames": body_frames + head + tail,
+        "scene_index": index,
+        "scenes": [scene],
+        "encode_args": encode_args,
+    }
+
+
+def transition_segment(
+    index: int, a: dict, b: dict, fade: int, transition: str, encode_args: list[str] | None = None,
+) -> dict:
+    """分镜 index 与 index + 1 之间的转场片段（类型由 b 的 transition 字段或全局 transition 决定）"""
+    encode_args = list(encode_args or [])
+    kind = scene_transitions([a, b], transition)[0]
+    return {
+        "kind": "transition",
+        "transition": kind,
+        "path": SEGMENT_CACHE_DIR / f"fade_{_hash(a['key'], b['key'], fade, kind, encode_args)}.mp4",
+        "frames": fade,
+        "scene_index": index,
+        "scenes": [a, b],
+        "encode_args": encode_args,
+    }
+
+
+def plan_segments(
+    scenes: list[dict], width: int, height: int, fps: int, transition: str,
+    subtitle_mode: str = "overlay", subtitle_style: dict | None = None,
+    encode_args: list[str] | None = None,
+) -> dict:
+    """规划时间线：计算每个分镜的帧数与片段列表
+
+    编码参数计入片段哈希，草稿与成片的片段分别缓存、互不覆盖。
+    返回 {"durations", "fade", "segments": [{"kind", "path", "frames", "scenes", "encode_args"}]}
+    """
+    prepared = [prepare_scene(s, width, height, fps, subtitle_mode, subtitle_style) for s in scenes]
+    n = len(prepared)
+    fade = fade_frames(n, fps, transition)
+
+    segments, durations = [], []
+    for i, scene in enumerate(prepared):
+        body = body_segment(i, n, scene, fade, encode_args)
+        segments.append(body)
+        durations.append(body["timeline_frames"] / fps)
+        if fade and i < n - 1:
+            segments.append(transition_segment(i, scene, prepared[i + 1], fade, transition, encode_args))
+
+    return {
+        "durations": durations,
+        "fade": fade / fps,
+        "segments": segments,
+    }
+
+
+def render_segment(segment: dict, width: int, height: int, fps: int, threads: int = 0) -> float:
+    """渲染单个缺失的片段，返回编码耗时（秒）"""
+    start = time.perf_counter()
+    encode_args = segment.get("encode_args")
+    if segment["kind"] == "body":
+        render_body(
+            segment["scenes"][0], segment["frames"], segment["path"], width, height, fps, threads, encode_args,
+            segment["start"],
+        )
+    else:
+        a, b = segment["scenes"]
+        render_transition(
+            a, b, segment["frames"], segment["path"], width, height, fps, threads, encode_args,
+            segment["transition"],
+        )
+    return time.perf_counter() - start
+
+
+def render_missing(segments: list[dict], width: int, height: int, fps: int, workers: int = 0) -> dict:
+    """并行渲染缓存中缺失的片段，返回 {片段索引: 编码耗时}
+
+    每个 worker 驱动一个独立的 ffmpeg 进程，CPU 核心按 worker 数均分给 x264，避免超额订阅。
+    """
+    workers = min(max(1, workers or COMPOSE_WORKERS), CPU_COUNT)
+    missing = []
+    for i, segment in enumerate(segments):
+        if segment["path"].exists():
+            touch(segment["path"])
+        else:
+            missing.append(i)
+    if not missing:
+        return {}
+
+    timings = {}
+
+    def _done(i: int, seconds: float) -> None:
+        timings[i] = seconds
+        report_progress(
+            "scene_encoded",
+            scene=segments[i]["scene_index"],
+            segment=segments[i]["kind"],
+            encode_seconds=round(seconds, 3),
+            completed=len(timings),
+            total=len(missing),
+        )
+
+    if workers == 1 or len(missing) == 1:
+        for i in missing:
+            _done(i, render_segment(segments[i], width, height, fps))
+        return timings
+
+    threads = max(1, CPU_COUNT // workers)
+    with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+        # 复制上下文，使 worker 线程中的 ffmpeg 也能响应任务取消
+        futures = {
+            pool.submit(contextvars.copy_context().run, render_segment, segments[i], width, height, fps, threads): i
+            for i in missing
+        }
+        for future in as_completed(futures):
+            _done(futures[future], future.result())
+    return timings
+
+
+def scene_timings(segments: list[dict], timings: dict) -> list[dict]:
+    """按分镜汇总编码耗时（分镜主体 + 其后的转场）"""
+    result: dict[int, dict] = {}
+    for i, segment in enumerate(segments):
+        entry = result.setdefault(segment["scene_index"], {
+            "index": segment["scene_index"], "encode_seconds": 0.0, "cached": True,
+        })
+        if i in timings:
+            entry["encode_seconds"] = round(entry["encode_seconds"] + timings[i], 3)
+            entry["cached"] = False
+    return list(result.values())
+
+
+def compose_segments(
+    scenes: list[dict],
+    output_path: Path,
+    bgm_path: str = "",
+    bgm_volume: float = 0.15,
+    width: int = 1080,
+    height: int = 1920,
+    fps: int = 30,
+    transition: str = "fade",
+    workers: int = 0,
+    subtitle_mode: str = "overlay",
+    subtitle_style: dict | None = None,
+    encode_args: list[str] | None = None,
+    audio_args: list[str] | None = None,
+) -> dict:
+    """基于片段缓存增量合成视频
+
+    workers: 并行渲染片段的 worker 数，0 表示使用 COMPOSE_WORKERS
+    subtitle_mode: overlay / ass / none，ass 模式在最终混流时烧录字幕
+    encode_args: 额外的 x264 参数（-preset / -crf / -tune / -g），由编码档位与渲染质量决定
+    audio_args: 额外的 AAC 参数（-b:a）
+    返回 {"duration", "segments_rendered", "segments_reused", "scene_timings"}
+    """
+    plan = plan_segments(
+        scenes, width, height, fps, transition, subtitle_mode, subtitle_style, encode_args,
+    )
+    segments = plan["segments"]
+
+    timings = render_missing(segments, width, height, fps, workers)
+    rendered = len(timings)
+
+    duration = sum(s["frames"] for s in segments) / fps
+    concat_list = TEMP_DIR / f"concat_{uuid.uuid4().hex[:8]}.txt"
+    concat_list.write_text(
+        "".join(f"file '{s['path'].resolve().as_posix()}'\n" for s in segments),
+        encoding="utf-8",
+    )
+
+    # 画面流拷贝（ASS 模式烧录字幕后重新编码）+ 音轨一次性生成
+    audio_inputs, filters, audio_out, track = audio_track_inputs(
+        scenes, plan["durations"], plan["fade"], duration, bgm_path, bgm_volume, 1,
+    )
+    inputs = ["-f", "concat", "-safe", "0", "-i", str(concat_list), *audio_inputs]
+
+    video_map, video_codec = "0:v", ["-c:v", "copy"]
+    if subtitle_mode == "ass":
+        ass_track = subtitle_track(
+            scenes, plan["durations"], plan["fade"], width, height, merge_style(subtitle_style),
+        )
+        filters.append(f"[0:v]{subtitles_filter(ass_track)}[vout]")
+        video_map, video_codec = "[vout]", ["-c:v", "libx264", "-pix_fmt", "yuv420p", *(encode_args or [])]
+
+    try:
+        run_ffmpeg([
+            *inputs,
+            *(["-filter_complex", ";".join(filters)] if filters else []),
+            "-map", video_map, "-map", audio_out,
+            *video_codec, "-c:a", "aac", *(audio_args or []),
+            *MP4_MUX_ARGS,
+            "-t", f"{duration:.3f}",
+            str(output_path),
+        ], total_frames=round(duration * fps), stage="mux")
+    finally:
+        concat_list.unlink(missing_ok=True)
+        if track:
+            track.unlink(missing_ok=True)
+
+    save_timeline(output_path, scenes, plan["durations"], plan["fade"], duration, bgm_path, bgm_volume, audio_args)
+
+    return {
+        "duration": duration,
+        "segments_rendered": rendered,
+        "segments_reused": len(segments) - rendered,
+        "scene_timings": scene_timings(segments, timings),
+    }
@@ -0,0 +1,231 @@
+"""字幕渲染服务
+
+两种字幕方式：
+- overlay：Pillow 直接光栅化为 RGBA 叠加图，取代 moviepy TextClip(method="caption")。
+  后者每条字幕都要启动一次 ImageMagick 进程，且找不到 Arial-Unicode-MS 字体时会静默失败。
+  结果按 (文本, 字体, 字号, 宽度, 描边) 缓存为 PNG，重复合成时直接复用。
+- ass：整条时间线生成一个 ASS 字幕文件，最终编码时由 ffmpeg subtitles 滤镜（libass）一次烧录。
+"""
+import hashlib
+import json
+import os
+import uuid
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from config import FONTS_DIR, SUBTITLE_CACHE_DIR, SUBTITLE_FONT
+from services.cache_gc import touch
+
+SUBTITLE_MODES = ("overlay", "ass", "none")
+
+# 默认字幕样式（与原 moviepy TextClip 参数对应）
+SUBTITLE_STYLE = {
+    "font": "",             # 字体文件名（backend/fonts 下）或绝对路径，为空时自动查找
+    "fontsize": 36,
+    "color": "white",
+    "stroke_color": "black",
+    "stroke_width": 1.5,
+    "side_margin": 40,      # 左右各留 40px，对应 size=(width - 80, None)
+    "bottom_offset": 200,   # 字幕顶部位于 height - 200
+}
+
+# 项目字体目录之外的系统 CJK 字体兜底
+_SYSTEM_FONTS = [
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+]
+
+
+# 探测字形：常用汉字与一个几乎不会被收录的私用区码位（必然落到 .notdef 缺字框）
+_CJK_PROBE = "中"
+_MISSING_PROBE = "\U000FFFFD"
+
+
+def _covers_cjk(path: str) -> bool:
+    """字体是否包含汉字字形（缺字时 Pillow 会画出与 .notdef 相同的方框，即“豆腐块”）"""
+    try:
+        font = ImageFont.truetype(path, 32)
+    except OSError:
+        return False
+    glyph = _draw_glyph(font, _CJK_PROBE)
+    return any(glyph) and glyph != _draw_glyph(font, _MISSING_PROBE)
+
+
+def _draw_glyph(font: ImageFont.FreeTypeFont, ch: str) -> bytes:
+    image = Image.new("L", (48, 48))
+    ImageDraw.Draw(image).text((8, 0), ch, font=font, fill=255)
+    return image.tobytes()
+
+
+@lru_cache(maxsize=16)
+def resolve_font_path(font: str = "") -> str:
+    """字体查找顺序：指定字体 → SUBTITLE_FONT 环境变量 → backend/fonts 目录 → 系统 CJK 字体
+
+    只返回能显示中文的字体；都找不到时抛出 ValueError，由合成任务报错，
+    而不是退回 Pillow 默认字体把旁白渲染成一排方框
+    """
+    candidates = [font, FONTS_DIR / font if font else "", SUBTITLE_FONT]
+    for pattern in ("*.otf", "*.ttf", "*.ttc"):
+        candidates += sorted(FONTS_DIR.glob(pattern))
+    candidates += _SYSTEM_FONTS
+    for candidate in candidates:
+        if candidate and Path(candidate).is_file() and _covers_cjk(str(candidate)):
+            return str(candidate)
+    raise ValueError(
+        "未找到支持中文的字幕字体，请将 Noto Sans SC 等 CJK 字体放入 backend/fonts/"
+        "（或设置 SUBTITLE_FONT），也可将字幕模式设为 none"
+    )
+
+
+def merge_style(style: dict | None = None) -> dict:
+    """在默认样式上合并请求中的样式（忽略空值）"""
+    return {**SUBTITLE_STYLE, **{k: v for k, v in (style or {}).items() if v not in (None, "")}}
+
+
+@lru_cache(maxsize=16)
+def _load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(path, size)
+
+
+def _wrap_text(text: str, font: ImageFont.ImageFont, max_width: int) -> list[str]:
+    """按像素宽度逐字换行（兼容无空格的中文）"""
+    lines, current = [], ""
+    for ch in text:
+        if ch == "\n":
+            lines.append(current)
+            current = ""
+            continue
+        trial = current + ch
+        if current and font.getlength(trial) > max_width:
+            lines.append(current)
+            current = ch
+        else:
+            current = trial
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _cache_key(text: str, font_path: str, width: int, style: dict) -> str:
+    payload = json.dumps([text, font_path, width, style], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def render_subtitle(text: str, width: int, style: dict | None = None) -> Path:
+    """将旁白渲染为透明 PNG（居中多行、描边），命中缓存时直接返回
+
+    width 为视频宽度，字幕框宽度为 width - 2 * side_margin
+    """
+    style = merge_style(style)
+    font_path = resolve_font_path(style["font"])
+    path = SUBTITLE_CACHE_DIR / f"sub_{_cache_key(text, font_path, width, style)}.png"
+    if path.exists():
+        touch(path)
+        return path
+
+    box_width = width - 2 * style["side_margin"]
+    font = _load_font(font_path, style["fontsize"])
+    stroke = max(1, round(style["stroke_width"]))
+    lines = _wrap_text(text, font, box_width) or [""]
+
+    line_height = int(style["fontsize"] * 1.25)
+    height = line_height * len(lines) + 2 * stroke
+    image = Image.new("RGBA", (box_width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        x = (box_width - font.getlength(line)) / 2
+        draw.text(
+            (x, stroke + i * line_height), line, font=font,
+            fill=style["color"], stroke_width=stroke, stroke_fill=style["stroke_color"],
+        )
+
+    # 先写临时文件再原子替换，避免并行渲染时读到半成品
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:6]}.tmp.png")
+    image.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _ass_color(color: str) -> str:
+    """颜色名 / #RRGGBB → ASS 的 &H00BBGGRR"""
+    r, g, b = ImageColor.getrgb(color)[:3]
+    return f"&H00{b:02X}{g:02X}{r:02X}"
+
+
+def _ass_time(seconds: float) -> str:
+    cs = max(0, round(seconds * 100))
+    return f"{cs // 360000}:{cs // 6000 % 60:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
+
+
+def _ass_text(text: str) -> str:
+    # ASS 中花括号为样式标签，无法转义，替换为全角括号
+    return text.replace("{", "（").replace("}", "）").replace("\n", "\\N")
+
+
+def build_ass(
+    entries: list[tuple[float, float, str]],
+    width: int,
+    height: int,
+    style: dict | None = None,
+    fade: float = 0.0,
+) -> Path:
+    """根据 (开始, 结束, 文本) 列表生成整条时间线的 ASS 字幕文件
+
+    单行字幕的位置与 overlay 方式一致（顶部位于 height - bottom_offset），多行向上扩展；
+    fade > 0 时字幕随画面转场淡入淡出。
+    """
+    style = merge_style(style)
+    font_path = resolve_font_path(style["font"])
+    font_name = _load_font(font_path, style["fontsize"]).getname()[0]
+    margin_v = max(0, style["bottom_offset"] - int(style["fontsize"] * 1.25))
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Default,{font_name},{style['fontsize']},{_ass_color(style['color'])},&H000000FF,"
+        f"{_ass_color(style['stroke_color'])},&H00000000,0,0,0,0,100,100,0,0,1,{style['stroke_width']},0,"
+        f"2,{style['side_margin']},{style['side_margin']},{margin_v},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    fade_ms = round(fade * 1000)
+    for i, (start, end, text) in enumerate(entries):
+        if not text:
+            continue
+        fade_in = fade_ms if i > 0 else 0
+        fade_out = fade_ms if i < len(entries) - 1 else 0
+        prefix = f"{{\\fad({fade_in},{fade_out})}}" if fade_in or fade_out else ""
+        lines.append(f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Default,,0,0,0,,{prefix}{_ass_text(text)}")
+
+    content = "\n".join(lines) + "\n"
+    digest = hashlib.sha1(content.encode("utf-8")).hexdigest()[:24]
+    path = SUBTITLE_CACHE_DIR / f"track_{digest}.ass"
+    if path.exists():
+        touch(path)
+    else:
+        path.write_text(content, encoding="utf-8")
+    return path
+
+
+def subtitles_filter(ass_path: Path) -> str:
+    """构造 subtitles 滤镜参数（转义滤镜图中的特殊字符，并指定字体目录）"""
+    def _escape(p: Path) -> str:
+        return p.resolve().as_posix().replace(":", "\\:").replace("'", "\\'")
+    return f"subtitles=filename='{_escape(ass_path)}':fontsdir='{_escape(FONTS_DIR)}'"
@@ -0,0 +1,246 @@
+"""TTS 音频缓存 - 按 (文本, 音色, 语速, 音量, 供应商) 内容寻址
+
+相同参数的合成结果保存为 OUTPUT_DIR/audio/tts_<哈希>.mp3，再次请求时直接返回，不调用供应商接口。
+同一参数的并发请求（如试听与批量配音同时触发）只合成一次，其余请求等待同一结果；
+合成在独立任务中进行，发起请求被取消时只要还有其他等待方就继续合成。
+缓存总大小超过 TTS_CACHE_MAX_MB 时按最近访问时间淘汰（访问时刷新 atime，不改 mtime，
+时长索引依旧有效）。
+流式试听边转发边写入临时文件，合成完整结束后才入库。
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+from config import OUTPUT_DIR, TTS_CACHE_MAX_MB
+from services.audio_probe import audio_duration, forget_duration, record_duration
+from services.cache_gc import touch
+
+# 合成参数或输出格式变化时递增，使旧缓存失效
+TTS_CACHE_VERSION = 1
+
+AUDIO_DIR = OUTPUT_DIR / "audio"
+AUDIO_DIR.mkdir(exist_ok=True)
+
+STREAM_CHUNK_SIZE = 16 * 1024  # 流式读出缓存文件的块大小
+
+_inflight: dict[str, asyncio.Task] = {}
+_waiters: dict[asyncio.Task, int] = {}
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "evicted_bytes": 0}
+_evict_lock = threading.Lock()
+
+
+def cache_key(text: str, voice: str, rate: str, volume: str, provider: str) -> str:
+    payload = json.dumps([TTS_CACHE_VERSION, text, voice, rate, volume, provider], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def cache_path(key: str) -> Path:
+    return AUDIO_DIR / f"tts_{key}.mp3"
+
+
+def _result(path: Path, cached: bool) -> dict:
+    return {
+        "audio_url": f"/output/audio/{path.name}",
+        "local_path": str(path),
+        "duration": round(audio_duration(path), 2),
+        "cached": cached,
+    }
+
+
+def lookup(key: str) -> dict | None:
+    """查询缓存，命中时返回结果（计入命中数）"""
+    path = cache_path(key)
+    if not path.exists():
+        return None
+    _stats["hits"] += 1
+    touch(path)
+    return _result(path, cached=True)
+
+
+def store(key: str, data: bytes) -> dict:
+    """将外部合成好的音频（如整段脚本单会话合成后切分出的分镜片段）写入缓存（计入未命中数）"""
+    _stats["misses"] += 1
+    path = cache_path(key)
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:6]}.tmp.mp3")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    record_duration(path)
+    return _result(path, cached=False)
+
+
+async def _synthesize(key: str, write: Callable[[Path], Awaitable[None]]) -> dict:
+    path = cache_path(key)
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:6]}.tmp.mp3")
+    try:
+        await write(tmp_path)
+        os.replace(tmp_path, path)
+        await asyncio.to_thread(record_duration, path)
+        return _result(path, cached=False)
+    finally:
+        if _inflight.get(key) is asyncio.current_task():
+            del _inflight[key]
+        tmp_path.unlink(missing_ok=True)
+
+
+def _start(key: str, write: Callable[[Path], Awaitable[None]]) -> asyncio.Task:
+    """启动共享合成任务
+
+    任务在空白上下文中运行，不继承发起方所属的后台任务（发起方的取消检查不会中断其他等待方）
+    """
+    _stats["misses"] += 1
+    task = contextvars.Context().run(asyncio.create_task, _synthesize(key, write))
+    # 无等待方时避免 "exception was never retrieved" 警告
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    _inflight[key] = task
+    return task
+
+
+def _join(task: asyncio.Task) -> None:
+    _waiters[task] = _waiters.get(task, 0) + 1
+
+
+def _leave(key: str, task: asyncio.Task) -> None:
+    """等待方离开（完成 / 被取消 / 客户端断开）；最后一个等待方离开时才取消未完成的合成"""
+    _waiters[task] -= 1
+    if _waiters[task]:
+        return
+    del _waiters[task]
+    if not task.done():
+        task.cancel()
+        if _inflight.get(key) is task:
+            del _inflight[key]  # 之后的请求重新合成，而不是等待正在取消的任务
+
+
+async def cached_synthesis(key: str, synthesize: Callable[[Path], Awaitable[None]]) -> dict:
+    """命中缓存直接返回；否则调用 synthesize(临时路径) 写出音频后入库
+
+    同一 key 同时只会有一次 synthesize 在执行；某个等待方被取消时合成继续，其余等待方不受影响
+    """
+    hit = lookup(key)
+    if hit:
+        return hit
+
+    task = _inflight.get(key)
+    owner = task is None
+    if owner:
+        task = _start(key, synthesize)
+    else:
+        _stats["coalesced"] += 1
+    _join(task)
+    try:
+        result = await asyncio.shield(task)
+    finally:
+        _leave(key, task)
+
+    if not owner:
+        return {**result, "cached": True}
+    await asyncio.to_thread(evict)
+    return result
+
+
+async def _read_chunks(path: Path) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, STREAM_CHUNK_SIZE):
+            yield chunk
+
+
+async def cached_stream(key: str, stream: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+    """流式版 cached_synthesis：命中缓存时逐块读出文件；否则边转发 stream() 产出的音频块边写入缓存
+
+    同一 key 已在合成时等待其完成后读出缓存文件，不重复调用供应商。
+    客户端中途断开时，若还有其他等待方则合成继续并照常入库，否则取消合成并丢弃不完整的音频
+    """
+    path = cache_path(key)
+    if lookup(key):
+        async for chunk in _read_chunks(path):
+            yield chunk
+        return
+
+    task = _inflight.get(key)
+    if task:
+        _stats["coalesced"] += 1
+        _join(task)
+        try:
+            await asyncio.shield(task)
+        finally:
+            _leave(key, task)
+        async for chunk in _read_chunks(path):
+            yield chunk
+        return
+
+    chunks: asyncio.Queue[bytes | None] = asyncio.Queue()
+
+    async def _write(tmp_path: Path) -> None:
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in stream():
+                    f.write(chunk)
+                    chunks.put_nowait(chunk)
+        finally:
+            chunks.put_nowait(None)
+
+    task = _start(key, _write)
+    _join(task)
+    try:
+        while (chunk := await chunks.get()) is not None:
+            yield chunk
+        await asyncio.shield(task)  # 合成失败时抛出异常
+    finally:
+        _leave(key, task)
+
+    await asyncio.to_thread(evict)
+
+
+def _entries() -> list[tuple[Path, os.stat_result]]:
+    entries = []
+    for path in AUDIO_DIR.glob("tts_*.mp3"):
+        try:
+            entries.append((path, path.stat()))
+        except OSError:
+            pass  # 并发淘汰时文件可能已被删除
+    return entries
+
+
+def evict(max_bytes: int | None = None) -> int:
+    """按最近访问时间淘汰，直到缓存总大小不超过上限，返回删除的文件数"""
+    max_bytes = TTS_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    with _evict_lock:
+        entries = _entries()
+        total = sum(st.st_size for _, st in entries)
+        removed = 0
+        inflight = {cache_path(key).name for key in list(_inflight)}
+        for path, st in sorted(entries, key=lambda e: e[1].st_atime_ns):
+            if total <= max_bytes:
+                break
+            if path.name in inflight:
+                continue
+            path.unlink(missing_ok=True)
+            forget_duration(path)
+            total -= st.st_size
+            removed += 1
+            _stats["evictions"] += 1
+            _stats["evicted_bytes"] += st.st_size
+        return removed
+
+
+def cache_stats() -> dict:
+    """缓存命中率与占用情况"""
+    entries = _entries()
+    lookups = _stats["hits"] + _stats["misses"] + _stats["coalesced"]
+    return {
+        **_stats,
+        "hit_rate": round((_stats["hits"] + _stats["coalesced"]) / lookups, 3) if lookups else 0.0,
+        "inflight": len(_inflight),
+        "entries": len(entries),
+        "bytes": sum(st.st_size for _, st in entries),
+        "max_bytes": TTS_CACHE_MAX_MB * 1024 * 1024,
+    }
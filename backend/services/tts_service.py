@@ -1,8 +1,40 @@
 """TTS 语音合成服务"""
-import uuid
+import asyncio
+import bisect
+import math
+import time
 import edge_tts
+from functools import partial
 from pathlib import Path
-from config import OUTPUT_DIR
+from typing import AsyncIterator
+from config import TTS_CONCURRENCY, TTS_DEFAULT_CONCURRENCY, TTS_RETRIES, TTS_RETRY_BACKOFF
+from services.jobs import check_cancelled, report_progress
+from services.audio_probe import split_mp3
+from services.tts_cache import cache_key, cached_stream, cached_synthesis, evict, lookup, store
+
+# 每个供应商一个全局信号量：所有请求（单条、批量任务、流式批量）共享同一并发上限，
+# 由服务端配置决定同时占用多少 edge-tts 连接，而不是由前端并发请求数决定
+_provider_slots: dict[str, asyncio.Semaphore] = {}
+
+
+def _provider_slot(provider: str) -> asyncio.Semaphore:
+    if provider not in _provider_slots:
+        limit = TTS_CONCURRENCY.get(provider, TTS_DEFAULT_CONCURRENCY)
+        _provider_slots[provider] = asyncio.Semaphore(max(1, limit))
+    return _provider_slots[provider]
+
+
+async def _call_provider(provider: str, call, *args, retries: int):
+    """占用供应商并发名额执行 call(*args)，失败时指数退避重试（等待期间释放名额）"""
+    for attempt in range(retries + 1):
+        check_cancelled()
+        try:
+            async with _provider_slot(provider):
+                return await call(*args)
+        except Exception:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(TTS_RETRY_BACKOFF * 2 ** attempt)
 
 
 async def synthesize_speech(
@@ -12,69 +44,290 @@ async def synthesize_speech(
     volume: str = "+0%",
     provider: str = "edge-tts",
     api_key: str = "",
+    retries: int | None = None,
 ) -> dict:
-    """合成语音"""
+    """合成语音（按内容缓存，相同参数再次合成时直接返回已有音频）
+
+    retries: 失败重试次数，None 表示使用 TTS_RETRIES；命中缓存时不占用供应商并发名额
+    """
     if provider == "edge-tts":
-        return await _edge_tts(text, voice, rate, volume)
+        synthesize = partial(_edge_tts, text, voice, rate, volume)
     elif provider == "openai-tts":
-        return await _openai_tts(text, voice, api_key)
+        synthesize = partial(_openai_tts, text, voice, api_key)
     else:
         raise ValueError(f"不支持的 TTS 供应商: {provider}")
+    retries = TTS_RETRIES if retries is None else retries
+    return await cached_synthesis(
+        cache_key(text, voice, rate, volume, provider),
+        partial(_call_provider, provider, synthesize, retries=retries),
+    )
 
 
-async def _edge_tts(text: str, voice: str, rate: str, volume: str) -> dict:
-    """使用 Edge-TTS（免费）"""
-    filename = f"tts_{uuid.uuid4().hex[:8]}.mp3"
-    filepath = OUTPUT_DIR / "audio" / filename
-    filepath.parent.mkdir(exist_ok=True)
+def stream_speech(
+    text: str,
+    voice: str = "zh-CN-XiaoxiaoNeural",
+    rate: str = "+0%",
+    volume: str = "+0%",
+    provider: str = "edge-tts",
+    api_key: str = "",
+) -> AsyncIterator[bytes]:
+    """流式合成语音（试听用），边合成边产出 MP3 数据块，完整合成的结果写入 TTS 缓存
+
+    已开始向客户端输出后无法重试，因此不做失败重试；参数错误在返回迭代器前抛出
+    """
+    if provider == "edge-tts":
+        stream = partial(_edge_tts_chunks, text, voice, rate, volume)
+    elif provider == "openai-tts":
+        stream = partial(_openai_tts_chunks, text, voice, api_key)
+    else:
+        raise ValueError(f"不支持的 TTS 供应商: {provider}")
+
+    async def _slotted() -> AsyncIterator[bytes]:
+        async with _provider_slot(provider):
+            async for chunk in stream():
+                yield chunk
+
+    return cached_stream(cache_key(text, voice, rate, volume, provider), _slotted)
+
+
+async def synthesize_each(
+    items: list[dict],
+    concurrency: int = 0,
+    session: bool = False,
+    **options,
+) -> AsyncIterator[dict]:
+    """逐条合成，按完成顺序产出 {"index", "audio_url", ..., "error"}；单条失败不影响其余
+
+    items: [{"index", "text"}]，options 透传给 synthesize_speech
+    concurrency: 本批次的额外并发上限，0 表示只受供应商并发上限约束
+    session: edge-tts 整段脚本单会话合成后按词边界切分（见 synthesize_script），其他供应商忽略
+    迭代提前结束（任务取消 / 客户端断开）时取消尚未完成的合成
+    """
+    if session and options.get("provider", "edge-tts") == "edge-tts":
+        items = await synthesize_script(items, **options)
+        for entry in (item for item in items if "audio_url" in item):
+            yield entry
+        items = [item for item in items if "audio_url" not in item]  # 未能对齐的分镜逐条合成
+
+    limit = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+
+    async def _one(item: dict) -> dict:
+        try:
+            if limit:
+                async with limit:
+                    result = await synthesize_speech(text=item["text"], **options)
+            else:
+                result = await synthesize_speech(text=item["text"], **options)
+            return {"index": item["index"], **result, "error": ""}
+        except Exception as e:
+            return {"index": item["index"], "error": str(e)}
+
+    tasks = [asyncio.create_task(_one(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def synthesize_batch(
+    items: list[dict],
+    concurrency: int = 0,
+    session: bool = False,
+    **options,
+) -> dict:
+    """批量合成语音（后台任务），每条完成后上报进度，参数同 synthesize_each"""
+    total = len(items)
+    started = time.monotonic()
+    results = []
+    async for entry in synthesize_each(items, concurrency, session, **options):
+        check_cancelled()
+        results.append(entry)
+        completed = len(results)
+        elapsed = time.monotonic() - started
+        report_progress(
+            "audio_failed" if entry["error"] else "audio_synthesized",
+            completed=completed,
+            total=total,
+            eta=round(elapsed / completed * (total - completed), 1),
+            **entry,
+        )
+    results.sort(key=lambda r: r["index"])
+    return {"audios": results, "failed": sum(1 for r in results if r["error"])}
+
+
+# ── 整段脚本单会话合成 ──
+
+_SENTENCE_END = "。！？!?.…；;"
+# 相邻分镜未对齐（位置未知）时，在已对齐分镜的首词前 / 末词后保留的余量（秒），小于句间停顿
+_CUT_MARGIN = 0.15
+
 
+def _join_script(texts: list[str]) -> tuple[str, list[tuple[int, int]]]:
+    """拼接各分镜文本（补句末标点并换行，使分镜之间有自然停顿），返回 (全文, 各分镜字符区间)"""
+    script, spans = "", []
+    for text in texts:
+        text = text.strip()
+        if text and text[-1] not in _SENTENCE_END:
+            text += "。"
+        spans.append((len(script), len(script) + len(text)))
+        script += text + "\n"
+    return script, spans
+
+
+def _align_words(words: list[dict], script: str, spans: list[tuple[int, int]]) -> list[tuple[float, float] | None]:
+    """将 WordBoundary 事件按文本位置归属到分镜，返回各分镜 (首词起点, 末词终点)（秒）"""
+    bounds: list[tuple[float, float] | None] = [None] * len(spans)
+    starts = [start for start, _ in spans]
+    cursor = 0
+    for word in words:
+        # 只在当前位置附近查找，避免重复词把游标带到后面的分镜
+        pos = script.find(word["text"], cursor, cursor + len(word["text"]) + 64) if word["text"] else -1
+        if pos == -1:
+            continue
+        cursor = pos + len(word["text"])
+        i = bisect.bisect_right(starts, pos) - 1
+        if i < 0 or pos >= spans[i][1]:
+            continue
+        start, end = bounds[i] or (word["start"], word["end"])
+        bounds[i] = (min(start, word["start"]), max(end, word["end"]))
+    return bounds
+
+
+def _cut_between(left: tuple[float, float] | None, right: tuple[float, float] | None) -> float:
+    """相邻分镜之间的切点：两侧都已对齐时取停顿中点，否则在已对齐一侧留出 _CUT_MARGIN 余量"""
+    if left and right:
+        return (left[1] + right[0]) / 2
+    return left[1] + _CUT_MARGIN if left else max(0.0, right[0] - _CUT_MARGIN)
+
+
+async def _edge_tts_stream(text: str, voice: str, rate: str, volume: str) -> tuple[bytes, list[dict]]:
+    """单个 edge-tts 会话合成，返回 (MP3 数据, 词边界列表)；偏移单位为 100ns"""
     communicate = edge_tts.Communicate(text, voice, rate=rate, volume=volume)
-    await communicate.save(str(filepath))
+    audio, words = bytearray(), []
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            audio += chunk["data"]
+        elif chunk["type"] == "WordBoundary":
+            words.append({
+                "text": chunk["text"],
+                "start": chunk["offset"] / 1e7,
+                "end": (chunk["offset"] + chunk["duration"]) / 1e7,
+            })
+    return bytes(audio), words
 
-    # 估算时长（粗略：中文约 4 字/秒，英文约 3 词/秒）
-    char_count = len(text)
-    estimated_duration = char_count / 4.0
 
-    return {
-        "audio_url": f"/output/audio/{filename}",
-        "local_path": str(filepath),
-        "duration": round(estimated_duration, 1),
+async def synthesize_script(
+    items: list[dict],
+    voice: str = "zh-CN-XiaoxiaoNeural",
+    rate: str = "+0%",
+    volume: str = "+0%",
+    retries: int | None = None,
+    **_,
+) -> list[dict]:
+    """edge-tts 整段脚本单会话合成：一次握手合成全部未缓存分镜，按词边界在分镜间停顿处切分
+
+    切点取相邻分镜末词终点与首词起点的中点，在 MP3 帧边界处切分（不解码不重编码），
+    每段按分镜文本写入 TTS 缓存（与逐条合成共用缓存键），时长由帧头精确计算。
+    返回与 items 顺序一致的结果；会话失败时全部分镜、词边界无法对齐时仅该分镜只含 index / text，
+    由调用方逐条合成（已对齐分镜的片段照常保留）
+    """
+    keys = [cache_key(item["text"], voice, rate, volume, "edge-tts") for item in items]
+    results: list[dict] = []
+    pending = []
+    for item, key in zip(items, keys):
+        hit = lookup(key)
+        results.append({"index": item["index"], **hit, "error": ""} if hit else dict(item))
+        if not hit:
+            pending.append(len(results) - 1)
+    if not pending:
+        return results
+
+    script, spans = _join_script([items[i]["text"] for i in pending])
+    try:
+        audio, words = await _call_provider(
+            "edge-tts", _edge_tts_stream, script, voice, rate, volume,
+            retries=TTS_RETRIES if retries is None else retries,
+        )
+    except Exception as e:
+        print(f"整段合成失败，改为逐条合成: {e}")
+        return results
+    bounds = _align_words(words, script, spans)
+    last = len(bounds) - 1
+    ranges = {
+        k: (
+            0.0 if k == 0 else _cut_between(bounds[k - 1], bound),
+            math.inf if k == last else _cut_between(bound, bounds[k + 1]),
+        )
+        for k, bound in enumerate(bounds) if bound is not None
     }
+    if len(ranges) < len(bounds):
+        print(f"整段合成有 {len(bounds) - len(ranges)} 个分镜的词边界无法对齐，这些分镜改为逐条合成")
+    if not ranges:
+        return results
+
+    cuts = sorted({t for r in ranges.values() for t in r} - {0.0, math.inf})
+    pieces = split_mp3(audio, cuts)
+    edges = [0.0, *cuts]
+    for k, (start, _) in ranges.items():
+        i = pending[k]
+        clip = pieces[edges.index(start)]
+        results[i] = {"index": items[i]["index"], **await asyncio.to_thread(store, keys[i], clip), "error": ""}
+    await asyncio.to_thread(evict)
+    return results
 
 
-async def _openai_tts(text: str, voice: str, api_key: str) -> dict:
+async def _edge_tts(text: str, voice: str, rate: str, volume: str, filepath: Path) -> None:
+    """使用 Edge-TTS（免费）"""
+    communicate = edge_tts.Communicate(text, voice, rate=rate, volume=volume)
+    await communicate.save(str(filepath))
+
+
+async def _edge_tts_chunks(text: str, voice: str, rate: str, volume: str) -> AsyncIterator[bytes]:
+    """Edge-TTS 流式输出，逐块产出服务端推送的 MP3 数据"""
+    communicate = edge_tts.Communicate(text, voice, rate=rate, volume=volume)
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            yield chunk["data"]
+
+
+# OpenAI TTS 音色映射
+_OPENAI_VOICES = {
+    "alloy": "alloy", "echo": "echo", "fable": "fable",
+    "onyx": "onyx", "nova": "nova", "shimmer": "shimmer",
+}
+
+
+async def _openai_tts(text: str, voice: str, api_key: str, filepath: Path) -> None:
     """使用 OpenAI TTS"""
     from openai import AsyncOpenAI
 
     client = AsyncOpenAI(api_key=api_key)
 
-    # OpenAI TTS 音色映射
-    voice_map = {
-        "alloy": "alloy", "echo": "echo", "fable": "fable",
-        "onyx": "onyx", "nova": "nova", "shimmer": "shimmer",
-    }
-    tts_voice = voice_map.get(voice, "alloy")
-
     response = await client.audio.speech.create(
         model="tts-1",
-        voice=tts_voice,
+        voice=_OPENAI_VOICES.get(voice, "alloy"),
         input=text,
     )
 
-    filename = f"tts_{uuid.uuid4().hex[:8]}.mp3"
-    filepath = OUTPUT_DIR / "audio" / filename
-    filepath.parent.mkdir(exist_ok=True)
-
     filepath.write_bytes(response.content)
 
-    char_count = len(text)
-    estimated_duration = char_count / 4.0
 
-    return {
-        "audio_url": f"/output/audio/{filename}",
-        "local_path": str(filepath),
-        "duration": round(estimated_duration, 1),
-    }
+async def _openai_tts_chunks(text: str, voice: str, api_key: str) -> AsyncIterator[bytes]:
+    """OpenAI TTS 流式输出（分块传输的 MP3）"""
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(api_key=api_key)
+
+    async with client.audio.speech.with_streaming_response.create(
+        model="tts-1",
+        voice=_OPENAI_VOICES.get(voice, "alloy"),
+        input=text,
+        response_format="mp3",
+    ) as response:
+        async for chunk in response.iter_bytes():
+            yield chunk
 
 
 async def list_voices(provider: str = "edge-tts", language: str = "zh") -> list[dict]:
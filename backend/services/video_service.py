@@ -1,16 +1,48 @@
 """视频合成服务 - FFmpeg/moviepy"""
+import re
 import uuid
 import os
 from pathlib import Path
-from config import OUTPUT_DIR
+from config import OUTPUT_DIR, BGM_DIR, COMPOSE_ENGINE, COMPOSE_WORKERS, TEMP_DIR, ENCODER_PROFILE
+from services.ffmpeg_engine import (
+    MP4_MUX_ARGS, audio_track_inputs, check_transition, compose_ffmpeg, ffmpeg_available, load_timeline,
+    motion_spec, run_ffmpeg, save_timeline, scene_transitions, transition_overlap,
+)
+from services.segment_cache import compose_segments
+from services.jobs import check_cancelled, report_progress
+from services.image_normalizer import resolve_image
+from services.audio_engine import DUCK_DB
+from services.audio_probe import audio_duration
+from services.encoder_profiles import audio_args, get_profile, video_args
+from services.exporter import THUMBNAIL_INTERVAL, check_outputs, export_outputs, needs_render
+from services.hls import package_hls
+from services.cache_gc import prune_caches
+from services.subtitle_service import SUBTITLE_MODES, merge_style, render_subtitle, resolve_font_path
 import PIL.Image
 
 # Monkey patch for Pillow 10.x compatibility (moviepy uses ANTIALIAS)
 if not hasattr(PIL.Image, 'ANTIALIAS'):
     PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
 
+# 可选的合成引擎
+ENGINES = ("ffmpeg", "segments", "moviepy")
 
-async def compose_video(
+# 渲染质量档位：scale 为相对请求分辨率的缩放比例，fps 为帧率上限（0 表示不限制）
+# 草稿档用于工作室内快速预览，成片档用于最终导出（preset / crf 为空时使用编码档位）
+QUALITY_PRESETS = {
+    "draft": {"scale": 0.5, "fps": 15, "preset": "ultrafast", "crf": 30, "transitions": False},
+    "preview": {"scale": 2 / 3, "fps": 24, "preset": "veryfast", "crf": 26, "transitions": True},
+    "final": {"scale": 1.0, "fps": 0, "preset": "", "crf": 0, "transitions": True},
+}
+
+# moviepy 引擎每个渲染窗口的分镜数（同时驻留内存的剪辑数量上限）
+MOVIEPY_WINDOW = 8
+
+# 随分辨率等比缩放的字幕样式项
+_SCALED_STYLE_KEYS = ("fontsize", "stroke_width", "side_margin", "bottom_offset")
+
+
+def compose_video_sync(
     project_id: str,
     scenes: list[dict],
     bgm_path: str = "",
@@ -18,20 +50,352 @@ async def compose_video(
     resolution: str = "1080x1920",
     fps: int = 30,
     transition: str = "fade",
+    engine: str = "",
+    workers: int = 0,
+    subtitle_mode: str = "overlay",
+    subtitle_style: dict | None = None,
+    quality: str = "final",
+    encoder_profile: str = "",
+    outputs: list[dict] | None = None,
+    hls: bool = False,
+    thumbnails: bool | None = None,
+    thumbnail_interval: float = 0,
 ) -> dict:
-    """合成视频"""
-    from moviepy.editor import (
-        ImageClip, AudioFileClip, CompositeAudioClip,
-        concatenate_videoclips, TextClip, CompositeVideoClip,
+    """合成视频（同步执行，供后台任务队列调用）
+
+    engine: ffmpeg（单次原生调用）/ segments（片段缓存，增量重渲染）/ moviepy（兜底）；
+    为空时使用 COMPOSE_ENGINE
+    workers: 并行渲染 worker 数（segments 引擎的片段并行度 / moviepy 的编码线程数），
+    0 表示使用 COMPOSE_WORKERS
+    subtitle_mode: overlay（逐分镜叠加字幕图）/ ass（整条时间线 libass 烧录）/ none；
+    moviepy 引擎不支持 ass，按 overlay 处理
+    分镜的 motion（运动镜头）与 transition（转场）由 ffmpeg 滤镜渲染，moviepy 引擎中运动镜头按静止画面处理
+    subtitle_style: 字幕样式（font / fontsize / stroke_width / bottom_offset 等），缺省项使用默认值
+    quality: draft / preview / final，低档位降低分辨率与帧率、使用更快的 x264 预设，
+    字幕按比例缩放；片段缓存与输出文件均按档位区分
+    encoder_profile: 编码档位（见 ENCODER_PROFILES），为空时使用 ENCODER_PROFILE
+    outputs: 额外导出（其他宽高比 / 封面 / 动图预告，见 export_outputs），成片解码一次全部生成；
+    宽高比不同的视频（未指定 crop / pad 时）按其分辨率从时间线重新合成，字幕按该尺寸排版
+    hls: 额外生成 HLS fMP4 多码率阶梯（成片 MP4 本身始终 faststart）
+    thumbnails: 同时生成封面 JPEG 与缩略图雪碧图 + WebVTT 索引（与 outputs 共用一次解码），
+    为空时除草稿档外都生成（草稿追求出片速度，省去额外的解码）；
+    thumbnail_interval 为取帧间隔（秒），0 表示使用 THUMBNAIL_INTERVAL
+    """
+    engine = engine or COMPOSE_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"不支持的合成引擎: {engine}")
+    if subtitle_mode not in SUBTITLE_MODES:
+        raise ValueError(f"不支持的字幕模式: {subtitle_mode}")
+    # ffmpeg 不在 PATH 中时退回 moviepy（其自带 imageio-ffmpeg）
+    if engine != "moviepy" and not ffmpeg_available():
+        print("警告：未找到 ffmpeg/ffprobe，回退到 moviepy 引擎")
+        engine = "moviepy"
+
+    settings = render_settings(resolution, fps, transition, subtitle_mode, subtitle_style, quality, encoder_profile)
+    width, height, fps = settings["width"], settings["height"], settings["fps"]
+    encode_args = settings["encode_args"]
+
+    bgm_path = _resolve_bgm_path(bgm_path)
+    valid_scenes = prepare_scenes(scenes, width, height)
+    if not valid_scenes:
+        raise ValueError("没有有效的分镜片段")
+
+    suffix = "" if quality == "final" else f"_{quality}"
+    output_filename = f"video_{project_id}{suffix}_{uuid.uuid4().hex[:6]}.mp4"
+    output_path = OUTPUT_DIR / "videos" / output_filename
+    output_path.parent.mkdir(exist_ok=True)
+
+    duration, stats = _render_timeline(
+        engine, valid_scenes, output_path, settings, bgm_path, bgm_volume, workers,
     )
+    file_size = output_path.stat().st_size
+
+    # 宽高比不同的视频导出按自身分辨率从时间线重新合成（字幕按该尺寸排版），其余由成片一次解码派生
+    outputs = list(outputs or [])
+    variants = [spec for spec in outputs if needs_render(spec, (width, height))]
+    outputs = [spec for spec in outputs if not needs_render(spec, (width, height))]
+    exports = [
+        _render_variant(engine, scenes, output_path, spec, i, settings, bgm_path, bgm_volume, workers)
+        for i, spec in enumerate(variants)
+    ]
+
+    if thumbnails is None:
+        thumbnails = quality != "draft"
+    if thumbnails:
+        outputs.append({"kind": "poster", "side": True})
+        outputs.append({"kind": "thumbnails", "interval": thumbnail_interval or THUMBNAIL_INTERVAL, "side": True})
+
+    poster_url = thumbnails_url = ""
+    if outputs:
+        check_cancelled()
+        for item in export_outputs(output_path, duration, fps, outputs, encode_args, size=(width, height)):
+            path = item.pop("path")
+            url = f"/output/videos/{path.name}"
+            if item.pop("side", False):
+                # 封面与缩略图作为成片附属文件单独返回
+                if item["kind"] == "poster":
+                    poster_url = url
+                else:
+                    thumbnails_url = url
+                continue
+            exports.append({
+                **item,
+                "url": url,
+                "local_path": str(path),
+                "file_size": path.stat().st_size,
+            })
+
+    hls_url = ""
+    if hls:
+        check_cancelled()
+        playlist = package_hls(output_path, width, height, fps, duration, encode_args)
+        hls_url = "/output/" + playlist.relative_to(OUTPUT_DIR).as_posix()
+
+    prune_caches()
+
+    return {
+        "video_url": f"/output/videos/{output_filename}",
+        "local_path": str(output_path),
+        "duration": round(duration, 1),
+        "file_size": file_size,
+        "engine": engine,
+        "quality": quality,
+        "encoder_profile": encoder_profile or ENCODER_PROFILE,
+        "resolution": f"{width}x{height}",
+        "fps": fps,
+        "outputs": exports,
+        "hls_url": hls_url,
+        "poster_url": poster_url,
+        "thumbnails_url": thumbnails_url,
+        **stats,
+    }
+
+
+def remix_video_sync(
+    video_url: str,
+    bgm_path: str = "",
+    bgm_volume: float = 0.15,
+    duck_db: float = DUCK_DB,
+) -> dict:
+    """替换已合成视频的 BGM / 音量 / 闪避强度：只重建音轨，画面流拷贝（不重新编码）
+
+    video_url 为 compose 返回的成片地址（/output/videos/...），依赖合成时记录的时间线；
+    duck_db 为人声期间 BGM 的额外衰减（dB，0 表示不闪避，仅 AUDIO_ENGINE=numpy 时生效）。
+    生成新文件，原成片及其封面 / 缩略图 / 派生输出保持不变。
+    """
+    videos_dir = (OUTPUT_DIR / "videos").resolve()
+    source = Path(_resolve_output_path(video_url)).resolve()
+    if source.parent != videos_dir or not source.is_file():
+        raise ValueError(f"找不到成片: {video_url}")
+    timeline = load_timeline(source)
+    if timeline is None:
+        raise ValueError("缺少该视频的时间线信息，请重新合成")
+    missing = [p for p in timeline["audio_paths"] if not os.path.exists(p)]
+    if missing:
+        raise ValueError(f"旁白音频已被删除，无法重新混音: {missing[0]}")
+
+    bgm_path = _resolve_bgm_path(bgm_path)
+    scenes = [{"audio_path": p} for p in timeline["audio_paths"]]
+    durations, fade, total = timeline["durations"], timeline["fade"], timeline["total"]
+    output_filename = f"{source.stem.rsplit('_', 1)[0]}_{uuid.uuid4().hex[:6]}.mp4"
+    output_path = videos_dir / output_filename
+
+    audio_inputs, filters, audio_out, track = audio_track_inputs(
+        scenes, durations, fade, total, bgm_path, bgm_volume, 1, duck_db,
+    )
+    try:
+        run_ffmpeg([
+            "-i", str(source), *audio_inputs,
+            *(["-filter_complex", ";".join(filters)] if filters else []),
+            "-map", "0:v", "-map", audio_out,
+            "-c:v", "copy", "-c:a", "aac", *timeline["audio_args"],
+            *MP4_MUX_ARGS,
+            "-t", f"{total:.3f}",
+            str(output_path),
+        ], stage="mux")
+    finally:
+        if track:
+            track.unlink(missing_ok=True)
+    save_timeline(output_path, scenes, durations, fade, total, bgm_path, bgm_volume, timeline["audio_args"])
+
+    return {
+        "video_url": f"/output/videos/{output_filename}",
+        "local_path": str(output_path),
+        "duration": round(total, 1),
+        "file_size": output_path.stat().st_size,
+        "engine": "remix",
+    }
+
+
+# render_settings 的参数名（compose_video_sync 参数的子集）
+_SETTING_KEYS = ("resolution", "fps", "transition", "subtitle_mode", "subtitle_style", "quality", "encoder_profile")
+
+
+def _render_timeline(
+    engine: str, scenes: list[dict], output_path: Path, settings: dict,
+    bgm_path: str, bgm_volume: float, workers: int,
+) -> tuple[float, dict]:
+    """按 settings（render_settings 的结果）用指定引擎合成时间线，返回 (时长, 引擎统计)"""
+    width, height, fps = settings["width"], settings["height"], settings["fps"]
+    subtitle_mode, subtitle_style = settings["subtitle_mode"], settings["subtitle_style"]
+    if engine == "segments":
+        stats = compose_segments(
+            scenes, output_path,
+            bgm_path=bgm_path, bgm_volume=bgm_volume,
+            width=width, height=height, fps=fps, transition=settings["transition"],
+            workers=workers, subtitle_mode=subtitle_mode, subtitle_style=subtitle_style,
+            encode_args=settings["encode_args"], audio_args=settings["audio_args"],
+        )
+        return stats.pop("duration"), stats
+    if engine == "ffmpeg":
+        duration = compose_ffmpeg(
+            scenes, output_path,
+            bgm_path=bgm_path, bgm_volume=bgm_volume,
+            width=width, height=height, fps=fps, transition=settings["transition"],
+            subtitle_mode=subtitle_mode, subtitle_style=subtitle_style,
+            encode_args=settings["encode_args"], audio_args=settings["audio_args"],
+        )
+        return duration, {}
+    duration = _compose_moviepy(
+        scenes, output_path,
+        bgm_path=bgm_path, bgm_volume=bgm_volume,
+        width=width, height=height, fps=fps, transition=settings["transition"],
+        threads=workers or COMPOSE_WORKERS,
+        subtitles=subtitle_mode != "none", subtitle_style=subtitle_style,
+        encode_args=settings["encode_args"], audio_bitrate=settings["profile"]["audio_bitrate"],
+    )
+    return duration, {}
+
+
+def _render_variant(
+    engine: str, scenes: list[dict], master: Path, spec: dict, index: int, settings: dict,
+    bgm_path: str, bgm_volume: float, workers: int,
+) -> dict:
+    """按导出项的分辨率重新合成一版（fit=render）
+
+    配图按该分辨率重新裁剪，字幕样式按短边比例缩放，使字号与边距在横竖版中观感一致；
+    segments 引擎的片段缓存按分辨率区分，同一宽高比的版本再次导出时直接复用
+    """
+    check_cancelled()
+    width, height = map(int, spec["resolution"].split("x"))
+    scale = min(width, height) / min(settings["width"], settings["height"])
+    variant = {
+        **settings, "width": width, "height": height,
+        "subtitle_style": _scale_style(settings["subtitle_style"], scale),
+    }
+    path = master.with_name(f"{master.stem}_{spec['resolution']}_render_{index}.mp4")
+    _render_timeline(engine, prepare_scenes(scenes, width, height), path, variant, bgm_path, bgm_volume, workers)
+    return {
+        **spec,
+        "fit": "render",
+        "url": f"/output/videos/{path.name}",
+        "local_path": str(path),
+        "file_size": path.stat().st_size,
+    }
+
+
+def validate_compose(scenes: list[dict], engine: str = "", **options) -> None:
+    """提交后台任务前校验合成参数，不合法时抛出 ValueError（参数同 compose_video_sync）
+
+    只做不依赖素材与 ffmpeg 的检查，使请求立即得到 4xx，而不是排队后才失败
+    """
+    if (engine or COMPOSE_ENGINE) not in ENGINES:
+        raise ValueError(f"不支持的合成引擎: {engine}")
+    settings = render_settings(**{k: options[k] for k in _SETTING_KEYS if k in options})
+    scene_transitions(scenes, options.get("transition", "fade"))
+    for scene in scenes:
+        motion_spec(scene)
+    subtitled = settings["subtitle_mode"] != "none" and any(scene.get("narration") for scene in scenes)
+    check_outputs(
+        options.get("outputs") or [], (settings["width"], settings["height"]),
+        settings["subtitle_style"] if subtitled else None,
+    )
+    if subtitled:
+        resolve_font_path(settings["subtitle_style"]["font"])
+
+
+def render_settings(
+    resolution: str = "1080x1920",
+    fps: int = 30,
+    transition: str = "fade",
+    subtitle_mode: str = "overlay",
+    subtitle_style: dict | None = None,
+    quality: str = "final",
+    encoder_profile: str = "",
+) -> dict:
+    """根据请求参数与质量档位计算实际渲染参数（分辨率 / 帧率 / 转场 / 字幕样式 / 编码参数）"""
+    if subtitle_mode not in SUBTITLE_MODES:
+        raise ValueError(f"不支持的字幕模式: {subtitle_mode}")
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"不支持的渲染质量: {quality}")
+    check_transition(transition)
+    if not re.fullmatch(r"[1-9]\d*x[1-9]\d*", resolution):
+        raise ValueError(f"分辨率格式应为 宽x高: {resolution}")
+    if fps <= 0:
+        raise ValueError("帧率必须大于 0")
+    profile = get_profile(encoder_profile)
 
     width, height = map(int, resolution.split("x"))
-    clips = []
+    preset = QUALITY_PRESETS[quality]
+    width, height = _even(width * preset["scale"]), _even(height * preset["scale"])
+    if preset["fps"]:
+        fps = min(fps, preset["fps"])
+    if not preset["transitions"]:
+        transition = "none"
+    profile = {
+        **profile,
+        "preset": preset["preset"] or profile["preset"],
+        "crf": preset["crf"] or profile["crf"],
+    }
+    return {
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "transition": transition,
+        "subtitle_mode": subtitle_mode,
+        "subtitle_style": _scale_style(merge_style(subtitle_style), preset["scale"]),
+        "profile": profile,
+        "encode_args": video_args(profile, fps),
+        "audio_args": audio_args(profile),
+    }
+
+
+def prepare_scenes(scenes: list[dict], width: int, height: int) -> list[dict]:
+    """解析素材路径，并换用按目标分辨率预先裁剪缩放的配图（入库时已生成，缺失时此处补齐）"""
+    valid_scenes = _resolve_scenes(scenes)
+    for scene in valid_scenes:
+        scene["image_path"] = resolve_image(scene["image_path"], width, height)
+    return valid_scenes
+
+
+def _even(value: float) -> int:
+    """yuv420p 要求宽高为偶数"""
+    return max(2, int(round(value / 2)) * 2)
+
+
+def _scale_style(style: dict, scale: float) -> dict:
+    """按输出缩放比例调整字幕尺寸，使草稿与成片的版式一致"""
+    if scale == 1.0:
+        return style
+    scaled = {k: round(style[k] * scale, 1) if k == "stroke_width" else round(style[k] * scale)
+              for k in _SCALED_STYLE_KEYS}
+    return {**style, **scaled}
+
+
+def _resolve_output_path(path: str) -> str:
+    """路径标准化：处理前端传来的 URL 路径 (/output/...)"""
+    if path.startswith("/output/"):
+        rel_path = path.lstrip("/").replace("output/", "", 1)
+        candidate = OUTPUT_DIR / rel_path
+        if candidate.exists():
+            return str(candidate)
+    return path
+
 
-    # 处理 BGM 路径
+def _resolve_bgm_path(bgm_path: str) -> str:
+    """处理 BGM 路径，找不到文件时返回空字符串"""
     if bgm_path and not os.path.exists(bgm_path):
         # 尝试从 BGM_DIR 查找
-        from config import BGM_DIR
         candidate = BGM_DIR / bgm_path
         if candidate.exists():
             bgm_path = str(candidate)
@@ -39,24 +403,26 @@ async def compose_video(
             candidate = BGM_DIR / bgm_path.lstrip("/").replace("bgm/", "", 1)
             if candidate.exists():
                 bgm_path = str(candidate)
+    return bgm_path if bgm_path and os.path.exists(bgm_path) else ""
+
+
+def missing_assets(scene: dict) -> list[str]:
+    """返回分镜缺失的素材文件路径（图片 / 音频）"""
+    paths = [
+        _resolve_output_path(scene.get("image_path") or scene.get("image_url") or ""),
+        _resolve_output_path(scene.get("audio_path") or scene.get("audio_url") or ""),
+    ]
+    return [path or "（未提供）" for path in paths if not path or not os.path.exists(path)]
 
+
+def _resolve_scenes(scenes: list[dict]) -> list[dict]:
+    """解析分镜素材路径，跳过缺失文件的分镜"""
+    resolved = []
     for scene in scenes:
-        image_path = scene["image_path"]
-        audio_path = scene["audio_path"]
-        
-        # 路径标准化：处理前端传来的 URL 路径 (/output/...)
-        if image_path.startswith("/output/"):
-            rel_path = image_path.lstrip("/").replace("output/", "", 1)
-            candidate = OUTPUT_DIR / rel_path
-            if candidate.exists():
-                image_path = str(candidate)
-        
-        if audio_path.startswith("/output/"):
-            rel_path = audio_path.lstrip("/").replace("output/", "", 1)
-            candidate = OUTPUT_DIR / rel_path
-            if candidate.exists():
-                audio_path = str(candidate)
-                
+        # 兼容 image_path / image_url 两种字段
+        image_path = _resolve_output_path(scene.get("image_path") or scene.get("image_url") or "")
+        audio_path = _resolve_output_path(scene.get("audio_path") or scene.get("audio_url") or "")
+
         # 再次检查文件是否存在
         if not os.path.exists(image_path):
              print(f"警告：找不到图片文件 {image_path}")
@@ -65,94 +431,210 @@ async def compose_video(
              print(f"警告：找不到音频文件 {audio_path}")
              continue
 
-        narration = scene.get("narration", "")
+        resolved.append({
+            **scene,
+            "image_path": image_path,
+            "audio_path": audio_path,
+            "narration": scene.get("narration", ""),
+        })
+    return resolved
 
-        # 加载音频获取真实时长
-        audio = AudioFileClip(audio_path)
-        duration = audio.duration + 0.5  # 留一点间隔
 
-        # 创建图片片段
-        img_clip = (
-            ImageClip(image_path)
-            .set_duration(duration)
-            .resize((width, height))
-            .set_fps(fps)
-        )
+def _compose_moviepy(
+    scenes: list[dict],
+    output_path: Path,
+    bgm_path: str = "",
+    bgm_volume: float = 0.15,
+    width: int = 1080,
+    height: int = 1920,
+    fps: int = 30,
+    transition: str = "fade",
+    threads: int = 4,
+    subtitles: bool = True,
+    subtitle_style: dict | None = None,
+    encode_args: list[str] | None = None,
+    audio_bitrate: str | None = None,
+) -> float:
+    """moviepy 逐帧合成（兜底引擎），返回成片时长
+
+    按 MOVIEPY_WINDOW 个分镜为一组分窗渲染为中间片段，渲染完即释放，内存占用与分镜总数无关；
+    跨窗口的转场由下一窗口开头的"上一分镜尾部"补齐。最后流拷贝拼接并混入整条音轨。
+    """
+    from moviepy.editor import concatenate_videoclips
 
-        # 添加字幕（底部居中）
-        if narration:
-            try:
-                txt_clip = (
-                    TextClip(
-                        narration,
-                        fontsize=36,
-                        color="white",
-                        font="Arial-Unicode-MS",
-                        stroke_color="black",
-                        stroke_width=1.5,
-                        size=(width - 80, None),
-                        method="caption",
-                    )
-                    .set_duration(duration)
-                    .set_position(("center", height - 200))
-                )
-                img_clip = CompositeVideoClip([img_clip, txt_clip])
-            except Exception:
-                pass  # 字幕失败不阻塞视频生成
-
-        img_clip = img_clip.set_audio(audio)
-        clips.append(img_clip)
-
-    if not clips:
+    style = merge_style(subtitle_style)
+    n = len(scenes)
+    if not n:
         raise ValueError("没有有效的分镜片段")
 
-    # 拼接
-    if transition == "fade" and len(clips) > 1:
-        # 交叉淡入淡出
-        for i in range(len(clips)):
-            if i > 0:
-                clips[i] = clips[i].crossfadein(0.5)
-        final = concatenate_videoclips(clips, method="compose", padding=-0.5)
-    else:
-        final = concatenate_videoclips(clips, method="compose")
-
-    # 添加 BGM
-    if bgm_path and os.path.exists(bgm_path):
-        bgm = AudioFileClip(bgm_path).volumex(bgm_volume)
-        if bgm.duration > final.duration:
-            bgm = bgm.subclip(0, final.duration)
-        bgm = bgm.audio_fadeout(2)
-
-        if final.audio:
-            final_audio = CompositeAudioClip([final.audio, bgm])
-        else:
-            final_audio = bgm
-        final = final.set_audio(final_audio)
-
-    # 输出
-    output_filename = f"video_{project_id}_{uuid.uuid4().hex[:6]}.mp4"
-    output_path = OUTPUT_DIR / "videos" / output_filename
-    output_path.parent.mkdir(exist_ok=True)
+    # 时长按帧量化，保证各窗口拼接后画面与音轨不漂移
+    durations = [
+        round((audio_duration(scene["audio_path"]) + 0.5) * fps) / fps  # 留一点间隔
+        for scene in scenes
+    ]
+    fade = round(transition_overlap(n, transition) * fps) / fps
+    kinds = scene_transitions(scenes, transition)
+    total = sum(durations) - fade * (n - 1)
+
+    def _scene_clip(i: int, duration: float):
+        return _moviepy_scene_clip(scenes[i], duration, width, height, fps, style, subtitles)
+
+    windows = []
+    frame_offset = 0
+    try:
+        for start in range(0, n, MOVIEPY_WINDOW):
+            check_cancelled()
+            end = min(start + MOVIEPY_WINDOW, n)
+            clips = []
+            if fade and start > 0:
+                clips.append(_scene_clip(start - 1, fade))  # 上一窗口末尾分镜的转场部分
+            for i in range(start, end):
+                report_progress("scene_loaded", scene=i, completed=i, total=n)
+                # 非最后窗口的末尾分镜去掉转场部分，交由下一窗口渲染
+                duration = durations[i] - fade if fade and i == end - 1 and end < n else durations[i]
+                clip = _scene_clip(i, duration)
+                clips.append(_moviepy_transition(clip, kinds[i - 1], fade) if fade and clips else clip)
+
+            window = (
+                concatenate_videoclips(clips, method="compose", padding=-fade) if fade
+                else concatenate_videoclips(clips, method="compose")
+            )
+            path = TEMP_DIR / f"window_{uuid.uuid4().hex[:8]}.mp4"
+            windows.append(path)
+            window_frames = round(window.duration * fps)
+            window.write_videofile(
+                str(path),
+                fps=fps,
+                codec="libx264",
+                audio=False,
+                ffmpeg_params=list(encode_args or []),
+                threads=threads,
+                logger=_progress_logger(frame_offset, round(total * fps)),
+            )
+            frame_offset += window_frames
+            window.close()
+            for clip in clips:
+                clip.close()
+
+        _concat_windows(windows, scenes, durations, fade, total, output_path, bgm_path, bgm_volume, audio_bitrate)
+    finally:
+        for path in windows:
+            path.unlink(missing_ok=True)
+
+    return total
+
+
+def _moviepy_scene_clip(
+    scene: dict, duration: float, width: int, height: int, fps: int, style: dict, subtitles: bool,
+):
+    """单个分镜画面（静帧 + 可选字幕），不含音频"""
+    from moviepy.editor import ImageClip, CompositeVideoClip
+
+    img_clip = ImageClip(scene["image_path"]).set_duration(duration).set_fps(fps)
+    # 归一化后的配图已是目标尺寸，无需逐帧缩放
+    if tuple(img_clip.size) != (width, height):
+        img_clip = img_clip.resize((width, height))
+
+    # 添加字幕（底部居中，Pillow 预渲染的 RGBA 叠加图，alpha 通道作为遮罩）
+    if scene["narration"] and subtitles:
+        try:
+            txt_clip = (
+                ImageClip(str(render_subtitle(scene["narration"], width, style)))
+                .set_duration(duration)
+                .set_position(("center", height - style["bottom_offset"]))
+            )
+            img_clip = CompositeVideoClip([img_clip, txt_clip])
+        except Exception:
+            pass  # 字幕失败不阻塞视频生成
+    return img_clip
+
+
+def _moviepy_transition(clip, kind: str | None, fade: float):
+    """moviepy 引擎的转场近似：滑入类用 slide_in，硬切不处理，其余均为交叉淡入"""
+    from moviepy.video.compositing.transitions import slide_in
+
+    if kind is None:
+        return clip
+    if kind == "slideleft":
+        return slide_in(clip, fade, "right")
+    if kind == "slideup":
+        return slide_in(clip, fade, "bottom")
+    return clip.crossfadein(fade)
+
 
-    final.write_videofile(
-        str(output_path),
-        fps=fps,
-        codec="libx264",
-        audio_codec="aac",
-        threads=4,
-        logger=None,
+def _concat_windows(
+    windows: list[Path],
+    scenes: list[dict],
+    durations: list[float],
+    fade: float,
+    total: float,
+    output_path: Path,
+    bgm_path: str,
+    bgm_volume: float,
+    audio_bitrate: str | None,
+) -> None:
+    """各窗口片段流拷贝拼接，同时生成并混入整条音轨"""
+    concat_list = TEMP_DIR / f"concat_{uuid.uuid4().hex[:8]}.txt"
+    concat_list.write_text(
+        "".join(f"file '{p.resolve().as_posix()}'\n" for p in windows), encoding="utf-8",
+    )
+    audio_inputs, filters, audio_out, track = audio_track_inputs(
+        scenes, durations, fade, total, bgm_path, bgm_volume, 1,
     )
+    try:
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", str(concat_list), *audio_inputs,
+            *(["-filter_complex", ";".join(filters)] if filters else []),
+            "-map", "0:v", "-map", audio_out,
+            "-c:v", "copy", "-c:a", "aac", *(["-b:a", audio_bitrate] if audio_bitrate else []),
+            *MP4_MUX_ARGS,
+            "-t", f"{total:.3f}",
+            str(output_path),
+        ], stage="mux")
+    finally:
+        concat_list.unlink(missing_ok=True)
+        if track:
+            track.unlink(missing_ok=True)
 
-    # 关闭资源
-    final.close()
-    for clip in clips:
-        clip.close()
+    save_timeline(
+        output_path, scenes, durations, fade, total, bgm_path, bgm_volume,
+        ["-b:a", audio_bitrate] if audio_bitrate else [],
+    )
 
-    file_size = output_path.stat().st_size
 
-    return {
-        "video_url": f"/output/videos/{output_filename}",
-        "local_path": str(output_path),
-        "duration": round(final.duration, 1),
-        "file_size": file_size,
-    }
+def _progress_logger(frame_offset: int = 0, total_frames: int = 0):
+    """moviepy 写帧进度转发为任务进度事件（不在任务中时静默）
+
+    分窗渲染时 frame_offset 为之前窗口已写帧数，total_frames 为成片总帧数
+    """
+    import time
+    from proglog import ProgressBarLogger
+    from services.jobs import current_job
+
+    if current_job() is None:
+        return None
+
+    class _JobLogger(ProgressBarLogger):
+        started = last = time.monotonic()
+
+        def bars_callback(self, bar, attr, value, old_value=None):
+            if bar != "t" or attr != "index":
+                return
+            check_cancelled()
+            now = time.monotonic()
+            if now - self.last < 0.5:  # 每 0.5 秒上报一次
+                return
+            self.last = now
+            total = total_frames or self.bars[bar].get("total") or 0
+            elapsed = now - self.started
+            speed = value / elapsed if elapsed > 0 else 0.0
+            frames = frame_offset + value
+            report_progress(
+                "encode",
+                frames=frames,
+                total_frames=total,
+                fps=round(speed, 1),
+                eta=round((total - frames) / speed, 1) if speed > 0 else None,
+            )
+
+    return _JobLogger()
@@ -0,0 +1,95 @@
+"""媒体静态文件 - 在 StaticFiles 基础上支持 Range 请求与缓存头
+
+浏览器播放 MP4 / HLS 时依赖 Range 请求做拖动与分段加载；产物文件名带随机后缀，
+内容不会变化，可长期缓存，播放列表则每次校验。
+"""
+import mimetypes
+import os
+
+from starlette.responses import Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("text/vtt", ".vtt")
+
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# 播放列表、索引等可能被重新生成的文件
+_MUTABLE_SUFFIXES = {".m3u8", ".json"}
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """解析单段 Range 头，返回 [start, end]（闭区间）；不合法或不可满足时返回 None"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:  # bytes=-N：最后 N 字节
+            start, end = size - int(end_s), size - 1
+    except ValueError:
+        return None
+    start, end = max(0, start), min(end, size - 1)
+    return (start, end) if start <= end else None
+
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class MediaStaticFiles(StaticFiles):
+    """支持 Range / Cache-Control 的 StaticFiles
+
+    immutable: 目录中的文件名是否带内容无关的唯一后缀（生成产物），是则允许长期缓存
+    """
+
+    def __init__(self, *args, immutable: bool = True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable = immutable
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        suffix = os.path.splitext(str(full_path))[1].lower()
+        cache_control = IMMUTABLE if self.immutable and suffix not in _MUTABLE_SUFFIXES else REVALIDATE
+        response.headers["Cache-Control"] = cache_control
+        response.headers["Accept-Ranges"] = "bytes"
+        if response.status_code != 200 or scope.get("method") != "GET":
+            return response
+
+        headers = dict(scope.get("headers") or [])
+        range_header = headers.get(b"range", b"").decode("latin-1")
+        if not range_header:
+            return response
+
+        size = stat_result.st_size
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+        start, end = byte_range
+        return StreamingResponse(
+            _iter_file(str(full_path), start, end - start + 1),
+            status_code=206,
+            media_type=response.media_type,
+            headers={
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+                "Accept-Ranges": "bytes",
+                "Cache-Control": cache_control,
+                "ETag": response.headers.get("etag", ""),
+                "Last-Modified": response.headers.get("last-modified", ""),
+            },
+        )
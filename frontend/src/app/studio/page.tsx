@@ -69,9 +69,20 @@ export default function StudioPage() {
   const [rate, setRate] = useState("+0%");
   const [ttsProvider, setTtsProvider] = useState("edge-tts");
   const [bgm, setBgm] = useState("");
+  const [bgmTracks, setBgmTracks] = useState<{ name: string; duration: number }[]>([]);
+
+  // 曲库列表（后端扫描 bgm 目录）
+  useEffect(() => {
+    fetch(`${API_BASE}/api/bgm`)
+      .then((res) => res.json())
+      .then((data) => setBgmTracks(data.tracks || []))
+      .catch((err) => console.error("Failed to fetch BGM library:", err));
+  }, []);
 
   // Step 4: Result
   const [videoUrl, setVideoUrl] = useState("");
+  const [posterUrl, setPosterUrl] = useState("");
+  const [isDraft, setIsDraft] = useState(false);
 
   // API Keys from localStorage
   const getKey = (provider: string) => {
@@ -86,6 +97,45 @@ export default function StudioPage() {
     return keys[provider] || {};
   };
 
+  // 订阅后台任务的 SSE 进度事件直到结束，返回任务结果
+  const waitForJob = (jobId: string, onProgress?: (event: any) => void) =>
+    new Promise<any>((resolve, reject) => {
+      const source = new EventSource(`${API_BASE}/api/jobs/${jobId}/events`);
+      source.addEventListener("progress", (e) => onProgress?.(JSON.parse((e as MessageEvent).data)));
+      source.addEventListener("end", async (e) => {
+        source.close();
+        const job = JSON.parse((e as MessageEvent).data);
+        if (job.status === "failed") return reject(new Error(job.error || "任务失败"));
+        if (job.status === "cancelled") return reject(new Error("任务已取消"));
+        try {
+          const res = await fetch(`${API_BASE}/api/jobs/${jobId}/result`);
+          const data = await res.json();
+          if (!res.ok) throw new Error(data.detail || "获取结果失败");
+          resolve(data);
+        } catch (err) {
+          reject(err);
+        }
+      });
+      source.onerror = () => {
+        // EventSource 会自动重连（携带 Last-Event-ID）；仅在连接彻底关闭时报错
+        if (source.readyState === EventSource.CLOSED) reject(new Error("进度连接中断"));
+      };
+    });
+
+  // 提交后台任务并等待完成
+  const runJob = async (url: string, body: any, onProgress?: (event: any) => void) => {
+    const res = await fetch(`${API_BASE}${url}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body),
+    });
+    const job = await res.json();
+    if (!res.ok) throw new Error(job.detail || "任务提交失败");
+    return waitForJob(job.job_id, onProgress);
+  };
+
+  const formatEta = (eta?: number | null) => (eta ? `，剩余约 ${Math.ceil(eta)} 秒` : "");
+
   // Step 1: Generate Script
   const generateScript = async () => {
     const llmConfig = getConfig("llm");
@@ -124,7 +174,7 @@ export default function StudioPage() {
     }
   };
 
-  // Step 2: Generate Images (Sequential + Auto-retry, 绝不报错)
+  // Step 2: Generate Images (服务端批量任务：逐张生成 + 自动重试，绝不报错)
   const generateImages = async () => {
     const imgConfig = getConfig("image");
     if (!imgConfig.api_key) {
@@ -138,61 +188,33 @@ export default function StudioPage() {
     const [w, h] = resolution.split("x").map(Number);
     let failCount = 0;
 
-    const MAX_RETRIES_PER_IMAGE = 3;
-    const RETRY_DELAY = 30000; // 30s
-
-    // 逐个生成，避免触发速率限制
-    for (let i = 0; i < updatedScenes.length; i++) {
-      let success = false;
-
-      for (let attempt = 0; attempt <= MAX_RETRIES_PER_IMAGE; attempt++) {
-        if (attempt > 0) {
-          setProgress(`配图 ${i + 1}/${updatedScenes.length} 等待重试 (${attempt}/${MAX_RETRIES_PER_IMAGE})...`);
-          await new Promise((r) => setTimeout(r, RETRY_DELAY));
+    setProgress(`生成配图 1/${updatedScenes.length}...`);
+    try {
+      const data = await runJob("/api/image/batch", {
+        items: updatedScenes.map((s, i) => ({ index: i, prompt: s.image_prompt })),
+        style_prefix: stylePrefix,
+        width: w,
+        height: h,
+        provider: imgConfig.provider || "dall-e",
+        api_key: imgConfig.api_key,
+        base_url: imgConfig.base_url || "",
+        model: imgConfig.model || "",
+      }, (event) => {
+        if (event.stage === "image_generated") {
+          // 实时更新UI
+          updatedScenes[event.index].image_url = event.image_url;
+          setScenes([...updatedScenes]);
         }
-
-        setProgress(`生成配图 ${i + 1}/${updatedScenes.length}${attempt > 0 ? ` (重试 ${attempt})` : ""}...`);
-
-        try {
-          const controller = new AbortController();
-          const timeout = setTimeout(() => controller.abort(), 300000); // 5分钟超时
-
-          const res = await fetch(`${API_BASE}/api/image/generate`, {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            signal: controller.signal,
-            body: JSON.stringify({
-              prompt: updatedScenes[i].image_prompt,
-              style_prefix: stylePrefix,
-              width: w,
-              height: h,
-              provider: imgConfig.provider || "dall-e",
-              api_key: imgConfig.api_key,
-              base_url: imgConfig.base_url || "",
-              model: imgConfig.model || "",
-            }),
-          });
-          clearTimeout(timeout);
-
-          if (res.ok) {
-            const data = await res.json();
-            updatedScenes[i].image_url = data.image_url;
-            setScenes([...updatedScenes]);
-            success = true;
-            break; // 成功，跳到下一张图
-          } else {
-            const data = await res.json().catch(() => ({}));
-            console.warn(`配图 ${i + 1} 第 ${attempt + 1} 次尝试失败:`, data.detail || res.statusText);
-          }
-        } catch (e: any) {
-          console.warn(`配图 ${i + 1} 第 ${attempt + 1} 次尝试出错:`, e.message);
+        if (event.stage === "image_retry") {
+          setProgress(`配图 ${event.index + 1}/${updatedScenes.length} 等待重试 (${event.attempt})...`);
+        } else if (event.total) {
+          setProgress(`生成配图 ${event.completed}/${event.total}${formatEta(event.eta)}...`);
         }
-      }
-
-      if (!success) {
-        failCount++;
-        console.error(`配图 ${i + 1} 最终生成失败，已跳过`);
-      }
+      });
+      failCount = data.failed;
+    } catch (e: any) {
+      console.error("批量生成配图失败:", e);
+      failCount = updatedScenes.filter((s) => !s.image_url).length;
     }
 
     setScenes(updatedScenes);
@@ -206,58 +228,38 @@ export default function StudioPage() {
     setProgress("");
   };
 
-  // Step 3: Generate Audio (Concurrent)
+  // Step 3: Generate Audio (服务端批量任务)
   const generateAudio = async () => {
     setLoading(true);
     const updatedScenes = [...scenes];
     let failCount = 0;
-    let completed = 0;
-    let currentIndex = 0;
-    const CONCURRENCY = 3;
-
-    const worker = async () => {
-      while (currentIndex < updatedScenes.length) {
-        const i = currentIndex++;
-        setProgress(`合成语音 ${completed + 1}/${updatedScenes.length}...`);
-        try {
-          const controller = new AbortController();
-          const timeout = setTimeout(() => controller.abort(), 60000);
 
-          const ttsConfig = getConfig("tts");
-          const res = await fetch(`${API_BASE}/api/voice/synthesize`, {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            signal: controller.signal,
-            body: JSON.stringify({
-              text: updatedScenes[i].narration,
-              voice,
-              rate,
-              provider: ttsConfig.provider || ttsProvider,
-              api_key: ttsConfig.api_key || "",
-            }),
-          });
-          clearTimeout(timeout);
-          const data = await res.json();
-          if (res.ok) {
-            updatedScenes[i].audio_url = data.local_path;
-            updatedScenes[i].duration = data.duration;
-             // 实时更新UI
-            setScenes([...updatedScenes]);
-          } else {
-            failCount++;
-            console.error(`语音 ${i + 1} 合成失败:`, data.detail || data);
-          }
-        } catch (e: any) {
-          failCount++;
-          console.error(`语音 ${i + 1} 合成失败:`, e);
-        } finally {
-          completed++;
-          setProgress(`合成语音 ${completed}/${updatedScenes.length}...`);
+    setProgress(`合成语音 0/${updatedScenes.length}...`);
+    try {
+      const ttsConfig = getConfig("tts");
+      const data = await runJob("/api/voice/batch", {
+        items: updatedScenes.map((s, i) => ({ index: i, text: s.narration })),
+        voice,
+        rate,
+        session: true,
+        provider: ttsConfig.provider || ttsProvider,
+        api_key: ttsConfig.api_key || "",
+      }, (event) => {
+        if (event.stage === "audio_synthesized") {
+          updatedScenes[event.index].audio_url = event.local_path;
+          updatedScenes[event.index].duration = event.duration;
+          // 实时更新UI
+          setScenes([...updatedScenes]);
         }
-      }
-    };
-
-    await Promise.all(Array.from({ length: CONCURRENCY }, () => worker()));
+        if (event.total) {
+          setProgress(`合成语音 ${event.completed}/${event.total}${formatEta(event.eta)}...`);
+        }
+      });
+      failCount = data.failed;
+    } catch (e: any) {
+      console.error("批量合成语音失败:", e);
+      failCount = updatedScenes.filter((s) => !s.audio_url).length;
+    }
 
     setScenes(updatedScenes);
     if (failCount > 0) {
@@ -275,7 +277,8 @@ export default function StudioPage() {
     setPreviewing(true);
     try {
       const ttsConfig = getConfig("tts");
-      const res = await fetch(`${API_BASE}/api/voice/synthesize`, {
+      // 先用 POST 提交参数（密钥不进入 URL），再以返回的短期播放地址流式播放，收到首个数据块即开始
+      const res = await fetch(`${API_BASE}/api/voice/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -287,12 +290,12 @@ export default function StudioPage() {
         }),
       });
       const data = await res.json();
-      if (res.ok) {
-        const audio = new Audio(data.audio_url.startsWith("http") ? data.audio_url : `${API_BASE}${data.audio_url}`);
-        audio.play().catch(e => console.error("Play error:", e));
-      } else {
+      if (!res.ok) {
         alert("试听失败: " + (data.detail || "未知错误"));
+        return;
       }
+      const audio = new Audio(`${API_BASE}${data.stream_url}`);
+      await audio.play();
     } catch (e: any) {
       alert("试听失败: " + e.message);
     } finally {
@@ -301,52 +304,54 @@ export default function StudioPage() {
   };
 
   // Step 4: Compose Video
-  const composeVideo = async () => {
+  // quality: draft 为快速草稿预览（低分辨率、无转场，不保存项目），final 为最终导出
+  const composeVideo = async (quality: "draft" | "final" = "final") => {
     setLoading(true);
-    setProgress("正在合成视频...");
+    setProgress(quality === "draft" ? "正在生成草稿预览..." : "正在合成视频...");
     try {
       const projectId = Date.now().toString(36);
-      const res = await fetch(`${API_BASE}/api/video/compose`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          project_id: projectId,
-          scenes: scenes.map((s, i) => ({
-            index: i,
-            narration: s.narration,
-            image_path: s.image_url || "",
-            audio_path: s.audio_url || "",
-            duration: s.duration,
-          })),
-          bgm_path: bgm,
-          resolution,
-        }),
+      const data = await runJob("/api/video/compose", {
+        project_id: projectId,
+        scenes: scenes.map((s, i) => ({
+          index: i,
+          narration: s.narration,
+          image_path: s.image_url || "",
+          audio_path: s.audio_url || "",
+          duration: s.duration,
+        })),
+        bgm_path: bgm,
+        resolution,
+        quality,
+      }, (event) => {
+        if (event.stage === "scene_encoded") {
+          setProgress(`已编码分镜 ${event.completed}/${event.total}...`);
+        } else if (event.total_frames) {
+          const pct = Math.min(100, Math.round((event.frames / event.total_frames) * 100));
+          setProgress(`正在合成视频 ${pct}%（${event.fps} fps${formatEta(event.eta)}）...`);
+        }
       });
-      const data = await res.json();
-      if (res.ok) {
-        setVideoUrl(`${API_BASE}${data.video_url}`);
-
-        // Save project to DB if authenticated
-        if (token) {
-          try {
-            await fetch(`${API_BASE}/api/video/save`, {
-              method: "POST",
-              headers: {
-                "Content-Type": "application/json",
-                "Authorization": `Bearer ${token}`
-              },
-              body: JSON.stringify({
-                title: title || topic || "未命名项目",
-                scenes: scenes,
-                video_url: data.video_url
-              })
-            });
-          } catch (e) {
-            console.error("Failed to save project:", e);
-          }
+      setVideoUrl(`${API_BASE}${data.video_url}`);
+      setPosterUrl(data.poster_url ? `${API_BASE}${data.poster_url}` : "");
+      setIsDraft(quality === "draft");
+
+      // Save project to DB if authenticated
+      if (token && quality === "final") {
+        try {
+          await fetch(`${API_BASE}/api/video/save`, {
+            method: "POST",
+            headers: {
+              "Content-Type": "application/json",
+              "Authorization": `Bearer ${token}`
+            },
+            body: JSON.stringify({
+              title: title || topic || "未命名项目",
+              scenes: scenes,
+              video_url: data.video_url
+            })
+          });
+        } catch (e) {
+          console.error("Failed to save project:", e);
         }
-      } else {
-        throw new Error(data.detail || "合成失败");
       }
     } catch (e: any) {
       alert(`错误: ${e.message}`);
@@ -356,6 +361,24 @@ export default function StudioPage() {
     }
   };
 
+  // 只更换配乐：后端重建音轨，画面流拷贝不重新编码
+  const remixVideo = async () => {
+    setLoading(true);
+    setProgress("正在更换配乐...");
+    try {
+      const data = await runJob("/api/video/remix", {
+        video_url: videoUrl.replace(API_BASE, ""),
+        bgm_path: bgm,
+      });
+      setVideoUrl(`${API_BASE}${data.video_url}`);
+    } catch (e: any) {
+      alert(`错误: ${e.message}`);
+    } finally {
+      setLoading(false);
+      setProgress("");
+    }
+  };
+
   const updateScene = (idx: number, field: keyof Scene, value: string) => {
     const updated = [...scenes];
     (updated[idx] as any)[field] = value;
@@ -579,7 +602,11 @@ export default function StudioPage() {
                   <label>背景音乐</label>
                   <select className="input" value={bgm} onChange={(e) => setBgm(e.target.value)}>
                     <option value="">无 BGM</option>
-                    <option value="default.mp3">默认轻音乐</option>
+                    {bgmTracks.map((t) => (
+                      <option key={t.name} value={t.name}>
+                        {t.name.replace(/\.[^.]+$/, "")}（{Math.round(t.duration)} 秒）
+                      </option>
+                    ))}
                   </select>
                 </div>
               </div>
@@ -623,9 +650,28 @@ export default function StudioPage() {
             <div className={styles.previewContainer}>
               {videoUrl ? (
                 <div className={styles.videoResult}>
-                  <video controls src={videoUrl} className={styles.videoPlayer} />
+                  <video controls preload="metadata" src={videoUrl} poster={posterUrl || undefined} className={styles.videoPlayer} />
                   <div className={styles.videoActions}>
-                    <a href={videoUrl} download className="btn btn-primary btn-lg">
+                    {isDraft && (
+                      <>
+                        <button className="btn btn-secondary" onClick={() => setVideoUrl("")}>
+                          <Icon name="arrow-left" size={16} /> 返回修改
+                        </button>
+                        <button className="btn btn-primary btn-lg" onClick={() => composeVideo()}>
+                          <Icon name="film" size={18} /> 合成最终视频
+                        </button>
+                      </>
+                    )}
+                    <select className="input" value={bgm} onChange={(e) => setBgm(e.target.value)} disabled={loading}>
+                      <option value="">无 BGM</option>
+                      {bgmTracks.map((t) => (
+                        <option key={t.name} value={t.name}>{t.name.replace(/\.[^.]+$/, "")}</option>
+                      ))}
+                    </select>
+                    <button className="btn btn-secondary" onClick={remixVideo} disabled={loading}>
+                      <Icon name="music" size={16} /> 更换配乐
+                    </button>
+                    <a href={videoUrl} download className={isDraft ? "btn btn-secondary" : "btn btn-primary btn-lg"}>
                       <Icon name="download" size={18} /> 下载视频
                     </a>
                     <button className="btn btn-secondary" onClick={() => { setVideoUrl(""); setStep(1); setScenes([]); setTopic(""); }}>
@@ -654,7 +700,10 @@ export default function StudioPage() {
 
                   <div className={styles.stepActions}>
                     <button className="btn btn-secondary" onClick={() => setStep(3)}><Icon name="arrow-left" size={16} /> 上一步</button>
-                    <button className="btn btn-primary btn-lg" onClick={composeVideo}>
+                    <button className="btn btn-secondary" onClick={() => composeVideo("draft")}>
+                      <Icon name="zap" size={16} /> 草稿预览
+                    </button>
+                    <button className="btn btn-primary btn-lg" onClick={() => composeVideo()}>
                       <Icon name="film" size={18} /> 合成视频
                     </button>
                   </div>